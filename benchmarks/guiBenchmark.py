@@ -0,0 +1,224 @@
+"""Measures a whole scan in the GUI: MainWindow and SimulatorWindow run on the offscreen Qt platform, the benchmark
+connects to the simulator, starts a scan and waits until it is complete.
+
+The latencies of the stages which receive, generate and render the data are reported as percentiles in milliseconds,
+together with the frames of the render scheduler, as JSON. The exit code is 1 if the scan does not complete or a limit
+given by --max-render-p99 or --max-dropped-frames is exceeded, so the benchmark can run in CI.
+
+Example:
+    python -m benchmarks.guiBenchmark --resolution 500 --line-time 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+CONNECT_TIMEOUT = 30 # seconds
+SCREW_VALUES = (100, 100, 100) # tunnel current within the bounds, so every line is generated
+
+
+def parseArguments(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.guiBenchmark", description="Measures a scan in the GUI on the offscreen platform.")
+    parser.add_argument("--images", default=None, help="directory of the material images, defaults to the one of the simulator")
+    parser.add_argument("--resolution", type=int, default=500, help="points per line and number of lines")
+    parser.add_argument("--line-time", type=float, default=5, help="milliseconds per line, 0 scans as fast as possible")
+    parser.add_argument("--fps", type=float, default=None, help="target frame rate of the render scheduler, defaults to the one of the GUI")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds after which the scan is aborted")
+    parser.add_argument("--max-render-p99", type=float, default=None, help="milliseconds which the 99th percentile of a scan render may take")
+    parser.add_argument("--max-dropped-frames", type=int, default=None, help="frames which the render scheduler may drop")
+    return parser.parse_args(args)
+
+
+class StageTimer:
+    """Measures the calls of methods by replacing them on their instance. Signals and the render scheduler look the
+    methods up when they are connected or marked dirty, so the methods have to be instrumented before that
+    """
+    def __init__(self):
+        self.samples = {}
+
+    def instrument(self, obj, name: str, stage: str = None, after=None):
+        """Replaces a method of an instance by a wrapper which measures its calls
+
+        Args:
+            obj: the instance
+            name (str): name of the method
+            stage (str, optional): name of the measurements. Defaults to the name of the method.
+            after (optional): called with the arguments of each call after the method. Defaults to None.
+        """
+        method = getattr(obj, name)
+        samples = self.samples.setdefault(stage or name, [])
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                # list.append is atomic, so methods of other threads may be measured too
+                samples.append(time.perf_counter() - start)
+                if after is not None:
+                    after(*args, **kwargs)
+
+        setattr(obj, name, timed)
+
+    def report(self) -> dict:
+        return {stage: summarize(samples) for stage, samples in self.samples.items()}
+
+
+def summarize(samples: list) -> dict:
+    """
+    Args:
+        samples (list): durations in seconds
+
+    Returns:
+        dict: number of samples, percentiles, maximum and total in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    summary = {"count": len(values)}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}"] = float(value)
+    summary["max"] = float(values.max())
+    summary["total"] = float(values.sum())
+    return summary
+
+
+def waitFor(app, condition, timeout: float) -> bool:
+    """Runs the event loop until the condition is true
+
+    Returns:
+        bool: False if the timeout expired
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        app.processEvents()
+        time.sleep(0.001)
+    return True
+
+
+def runBenchmark(app, args: argparse.Namespace) -> dict:
+    import main
+    import simulator.simulator as simulator
+
+    if args.images is not None:
+        simulator.PATH_TO_IMAGES = args.images
+
+    window = main.MainWindow()
+    scheduler = window.renderScheduler
+    if args.fps is not None:
+        scheduler.setTargetFps(args.fps)
+    timer = StageTimer()
+    timer.instrument(window, "updateScanLines")
+    timer.instrument(window.prepTabWidget, "updatePlot")
+    timer.instrument(window.prepTabWidget, "blitPlot")
+
+    # latency from the generation of a line until it is on the screen
+    generatedAt = {}
+    lineLatencies = []
+    startY = 0
+
+    def lineGenerated(startX, y, lengthX, count, *args, **kwargs):
+        now = time.perf_counter()
+        for row in range(y - startY, y - startY + count):
+            generatedAt[row] = now
+
+    def linesRendered(region):
+        now = time.perf_counter()
+        rows = generatedAt.keys() if region is None else range(region[0], region[1])
+        for row in [row for row in rows if row in generatedAt]:
+            lineLatencies.append(now - generatedAt.pop(row))
+
+    timer.instrument(window.scanTabWidget, "renderImageLines", after=linesRendered)
+
+    connectedAt = []
+    microscopeConnected = window.microscopeConnected
+
+    def connected():
+        connectedAt.append(time.perf_counter())
+        microscopeConnected()
+
+    window.microscopeConnected = connected
+
+    connectStart = time.perf_counter()
+    window.showSimulator()
+    if not waitFor(app, lambda: connectedAt, CONNECT_TIMEOUT):
+        raise TimeoutError("Verbindung zum Simulator fehlgeschlagen")
+    connectSeconds = connectedAt[0] - connectStart
+    engine = window.simulatorWindow.model.engine
+    timer.instrument(engine, "getScanBlock", after=lineGenerated)
+
+    view = window.simulatorWindow.view
+    for dial, value in zip((view.screwDialOne, view.screwDialTwo, view.screwDialThree), SCREW_VALUES):
+        dial.setValue(value)
+    window.xEndRow.children()[2].setText(str(args.resolution))
+    window.lineTimeRow.children()[2].setText(f"{args.line_time:g}")
+    startY = int(window.yStartRow.children()[2].text())
+
+    scanStart = time.perf_counter()
+    window.startHandler()
+    completed = waitFor(app, lambda: not window.isMidScan, args.timeout)
+    scanSeconds = time.perf_counter() - scanStart
+    # the last lines are rendered in the next frame
+    waitFor(app, lambda: not scheduler.dirty, 1)
+
+    queue = window.microscope.microscope.lines
+    result = {
+        "resolution": args.resolution,
+        "lineTime": args.line_time,
+        "targetFps": 1 / scheduler.frameInterval,
+        "completed": completed,
+        "connectSeconds": connectSeconds,
+        "scanSeconds": scanSeconds,
+        "stages": timer.report(),
+        "lineLatency": summarize(lineLatencies),
+        "framesRendered": scheduler.framesRendered,
+        "framesDropped": scheduler.framesDropped,
+        "updatesMerged": scheduler.updatesMerged,
+        "linesCoalesced": queue.coalesced,
+    }
+    window.close()
+    window.simulatorWindow.close()
+    window.simulatorWindow.model.close()
+    return result
+
+
+def checkLimits(result: dict, args: argparse.Namespace) -> list:
+    """
+    Returns:
+        list: messages of the exceeded limits
+    """
+    errors = []
+    if not result["completed"]:
+        errors.append(f"Scan wurde nicht innerhalb von {args.timeout:g} s beendet")
+    render = result["stages"]["renderImageLines"]
+    if args.max_render_p99 is not None and render.get("p99", 0) > args.max_render_p99:
+        errors.append(f"Rendern dauert {render['p99']:.1f} ms (p99), erlaubt sind {args.max_render_p99:g} ms")
+    if args.max_dropped_frames is not None and result["framesDropped"] > args.max_dropped_frames:
+        errors.append(f"{result['framesDropped']} Frames verworfen, erlaubt sind {args.max_dropped_frames}")
+    return errors
+
+
+def main(args=None):
+    args = parseArguments(args)
+    # the platform has to be chosen before the application is created
+    os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    from PySide6 import QtWidgets as qtw
+    app = qtw.QApplication.instance() or qtw.QApplication(sys.argv[:1])
+
+    result = runBenchmark(app, args)
+    print(json.dumps(result, indent=2))
+    errors = checkLimits(result, args)
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Measures the throughput of the hot paths of the simulator model across resolutions, tip breadths, directions and
+scans at the borders of the material. The engine runs without Qt, shared memory or a display.
+
+The results are compared with a baseline file, the exit code is 1 if the throughput of a case dropped by more than
+--threshold. Without a baseline, or with --save-baseline, the results are written as the new baseline.
+
+Example:
+    python -m benchmarks.modelBenchmark --save-baseline
+    python -m benchmarks.modelBenchmark --resolutions 100 1000 --threshold 0.3
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from simulator.model.engine import PATH_TO_IMAGES, SimulatorEngine
+from simulator.model.materialCache import PATH_TO_MATERIAL_CACHE, MaterialCache
+from simulator.model.noise import GaussianNoise, LineOffsetNoise, PinkNoise, TelegraphNoise, UniformNoise
+
+RESOLUTIONS = (100, 500, 1000, 4000)
+BREADTHS = (0.01, 0.1, 0.5, 2, 20)
+DIRECTIONS = {"left": 0, "right": 1}
+IMAGE_BREADTHS = (0.1, 2, 20)
+NOISE_MODELS = {"uniform": UniformNoise, "gaussian": GaussianNoise, "pink": PinkNoise, "telegraph": TelegraphNoise, "lineOffset": LineOffsetNoise}
+NOISE_BLOCK_LINES = 64
+NOISE_AMPLITUDE = 10 # grey levels, fixed so that the work does not depend on the tunnel current
+SCREW_VALUES = {"target": (100, 100, 100), "min": (50, 50, 50), "max": (150, 150, 150), "nearTarget": (99.99, 100, 100.01)}
+TUNNEL_CURRENT_CALLS = 1000 # calls per measurement, a single call is too short to be timed
+NOISE_SEED = 0
+
+DEFAULT_BASELINE = PATH_TO_MATERIAL_CACHE.parent / "modelBaseline.json" # results of this machine, kept outside of the repository
+DEFAULT_THRESHOLD = 0.25 # largest allowed drop of the throughput
+MIN_TIME = 0.2 # seconds which every case is repeated for
+MIN_REPEATS = 3
+
+
+def parseArguments(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.modelBenchmark", description="Measures the hot paths of the simulator model.")
+    parser.add_argument("--images", type=Path, default=Path(PATH_TO_IMAGES), help="directory of the material images")
+    parser.add_argument("--cache", type=Path, default=PATH_TO_MATERIAL_CACHE, help="directory of the decoded material cache")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=RESOLUTIONS, help="points per line")
+    parser.add_argument("--filter", default="", help="only run the cases whose name contains this text")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds which every case is repeated for")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="largest allowed drop of the throughput, 0.25 for 25 %%")
+    return parser.parse_args(args)
+
+
+class Case:
+    """One benchmark case: run is called repeatedly and processes units items of unit per call
+    """
+    def __init__(self, name: str, run, units: int, unit: str = "samples"):
+        self.name = name
+        self.run = run
+        self.units = units
+        self.unit = unit
+
+
+def scanLineCases(engine: SimulatorEngine, resolutions: tuple) -> list:
+    height, width = engine.currentPyramid.getLevel(0).shape
+    cases = []
+    for resolution in resolutions:
+        line = np.empty(resolution)
+        for breadth in BREADTHS:
+            for directionName, direction in DIRECTIONS.items():
+                cases.append(Case(
+                    f"getScanLine/res={resolution}/breadth={breadth:g}/{directionName}",
+                    lambda resolution=resolution, breadth=breadth, direction=direction, line=line: engine.getScanLine(width // 2, height // 2, resolution, direction, breadth, out=line),
+                    resolution))
+
+        # lines which are partly or completely outside of the material
+        borders = {
+            "leftOutside": (0, height // 2, 0),
+            "rightPartial": (width - resolution // 2, height // 2, 1),
+            "negativeStart": (-resolution // 2, height // 2, 1),
+            "belowImage": (0, height, 1),
+            "lastRow": (0, height - 1, 1),
+        }
+        for borderName, (startX, startY, direction) in borders.items():
+            cases.append(Case(
+                f"getScanLine/res={resolution}/border={borderName}",
+                lambda resolution=resolution, startX=startX, startY=startY, direction=direction, line=line: engine.getScanLine(startX, startY, resolution, direction, 0.1, out=line),
+                resolution))
+        # breadths just below the steps of projectBreadthToInt
+        for breadth in (0.099, 0.999):
+            cases.append(Case(
+                f"getScanLine/res={resolution}/breadth={breadth:g}/right",
+                lambda resolution=resolution, breadth=breadth, line=line: engine.getScanLine(0, height // 2, resolution, 1, breadth, out=line),
+                resolution))
+    return cases
+
+
+def scanImageCases(engine: SimulatorEngine, resolutions: tuple) -> list:
+    cases = []
+    for resolution in resolutions:
+        for breadth in IMAGE_BREADTHS:
+            cases.append(Case(
+                f"getScanImage/res={resolution}/breadth={breadth:g}",
+                lambda resolution=resolution, breadth=breadth: engine.getScanImage(0, 0, resolution, resolution, 1, resolution, breadth),
+                resolution * resolution))
+    return cases
+
+
+def loadImgDataCases(engine: SimulatorEngine) -> list:
+    cases = []
+    for path in engine.imgPaths:
+        shape = engine.loadImgData(path).shape
+        pixels = shape[0] * shape[1]
+        cases.append(Case(f"loadImgData/{path.name}/cached", lambda path=path: engine.loadImgData(path), pixels, "pixels"))
+
+        def decode(path=path):
+            # a new cache directory, so the image is decoded again
+            with tempfile.TemporaryDirectory() as directory:
+                MaterialCache(directory).load(path)
+
+        cases.append(Case(f"loadImgData/{path.name}/decode", decode, pixels, "pixels"))
+    return cases
+
+
+def addNoiseCases(engine: SimulatorEngine, resolutions: tuple) -> list:
+    cases = []
+    for modelName, modelClass in NOISE_MODELS.items():
+        model = modelClass()
+        for resolution in resolutions:
+            for lines in (1, NOISE_BLOCK_LINES):
+                block = np.zeros((lines, resolution))
+                noiseBuffer = np.empty_like(block)
+
+                def addNoise(model=model, block=block, noiseBuffer=noiseBuffer):
+                    engine.setNoiseModel(model, amplitude=NOISE_AMPLITUDE)
+                    engine.addNoise(block, block.shape, out=block, noiseBuffer=noiseBuffer)
+
+                cases.append(Case(f"addNoise/{modelName}/res={resolution}/lines={lines}", addNoise, block.size))
+
+    # without amplitude no noise is generated at all
+    block = np.zeros((NOISE_BLOCK_LINES, max(resolutions)))
+
+    def addSilentNoise():
+        engine.setNoiseModel(engine.noise.model, amplitude=0)
+        engine.addNoise(block, block.shape, out=block)
+
+    cases.append(Case(f"addNoise/silent/res={max(resolutions)}/lines={NOISE_BLOCK_LINES}", addSilentNoise, block.size))
+    return cases
+
+
+def tunnelCurrentCases(engine: SimulatorEngine) -> list:
+    cases = []
+    for name, screwValues in SCREW_VALUES.items():
+        def updateTunnelCurrent(screwValues=screwValues):
+            for _ in range(TUNNEL_CURRENT_CALLS):
+                engine.updateTunnelCurrent(screwValues)
+
+        cases.append(Case(f"updateTunnelCurrent/{name}", updateTunnelCurrent, TUNNEL_CURRENT_CALLS, "calls"))
+    return cases
+
+
+def measure(case: Case, minTime: float) -> dict:
+    """Runs a case until minTime has passed and at least MIN_REPEATS times
+
+    Returns:
+        dict: fastest call and the throughput of it
+    """
+    case.run()
+    times = []
+    start = time.perf_counter()
+    while len(times) < MIN_REPEATS or time.perf_counter() - start < minTime:
+        callStart = time.perf_counter()
+        case.run()
+        times.append(time.perf_counter() - callStart)
+    # the fastest call is the least disturbed by the rest of the system
+    best = min(times)
+    return {"unit": case.unit, "perSecond": case.units / best, "seconds": best, "repeats": len(times)}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Returns:
+        list: (name, baseline, result, change) of all cases whose throughput dropped by more than threshold
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        change = result["perSecond"] / reference["perSecond"] - 1
+        if change < -threshold:
+            regressions.append((name, reference["perSecond"], result["perSecond"], change))
+    return regressions
+
+
+def main(args=None):
+    args = parseArguments(args)
+    # materials are loaded in this process only and the noise is seeded, so every run does the same work
+    engine = SimulatorEngine(args.images, pathToCache=args.cache, noiseSeed=NOISE_SEED, prefetchMaterials=False, sharedMaterials=False)
+    try:
+        engine.updateTunnelCurrent(SCREW_VALUES["target"])
+        engine.setNoiseModel(UniformNoise(), amplitude=NOISE_AMPLITUDE)
+        cases = (scanLineCases(engine, args.resolutions) + scanImageCases(engine, args.resolutions) + loadImgDataCases(engine)
+                 + addNoiseCases(engine, args.resolutions) + tunnelCurrentCases(engine))
+        results = {}
+        for case in cases:
+            if args.filter in case.name:
+                results[case.name] = measure(case, args.min_time)
+    finally:
+        engine.close()
+
+    baseline = {}
+    if args.baseline.exists():
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    print(json.dumps({"threshold": args.threshold, "results": results}, indent=2))
+
+    if args.save_baseline or not baseline:
+        # cases which were filtered out keep their baseline
+        baseline.update(results)
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump({"results": baseline}, file, indent=2)
+        print(f"Baseline gespeichert in {args.baseline}", file=sys.stderr)
+    elif regressions:
+        print(f"{len(regressions)} Fälle sind um mehr als {args.threshold:.0%} langsamer als die Baseline:", file=sys.stderr)
+        for name, reference, result, change in regressions:
+            print(f"  {name}: {reference:.4g} -> {result:.4g} pro Sekunde ({change:+.1%})", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
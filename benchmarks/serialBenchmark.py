@@ -0,0 +1,99 @@
+"""Measures the sustained sample rate of the serial driver against the fake device on a pseudo terminal.
+
+A scan is rastered as fast as the device and the driver allow, the result is written as JSON. The exit code is 1 if
+the sample rate is below --min-rate.
+
+Example:
+    python -m benchmarks.serialBenchmark --resolution 4000 --lines 200 --corruption-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+from microscope.serialMicroscope import SerialMicroscope
+from simulator.fakeDevice import DEVICE_INITIAL_SCREWS, DEVICE_LOWER_CURRENT_BOUND, DEVICE_UPPER_CURRENT_BOUND, FakeDevice
+from simulator.model.engine import PATH_TO_IMAGES, ScanParameters, SimulatorEngine
+from simulator.model.materialCache import PATH_TO_MATERIAL_CACHE
+
+MIN_SAMPLE_RATE = 100000 # samples per second
+
+
+def parseArguments(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialBenchmark", description="Measures the sample rate of the serial driver.")
+    parser.add_argument("--images", type=Path, default=Path(PATH_TO_IMAGES), help="directory of the material images")
+    parser.add_argument("--cache", type=Path, default=PATH_TO_MATERIAL_CACHE, help="directory of the decoded material cache")
+    parser.add_argument("--resolution", type=int, default=4000, help="points per line")
+    parser.add_argument("--lines", type=int, default=200, help="number of lines")
+    parser.add_argument("--breadth", type=float, default=0.1)
+    parser.add_argument("--corruption-rate", type=float, default=0.0, help="share of the frames which the device corrupts")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the corruption")
+    parser.add_argument("--min-rate", type=float, default=MIN_SAMPLE_RATE, help="samples per second which must be reached")
+    return parser.parse_args(args)
+
+
+async def runScan(microscope: SerialMicroscope, params: ScanParameters) -> dict:
+    """Runs one scan and consumes its lines like the GUI
+
+    Returns:
+        dict: the measured values
+    """
+    await microscope.connect()
+    linesReceived = 0
+    blocksReceived = 0
+
+    async def consumeLines():
+        nonlocal linesReceived, blocksReceived
+        async for scanId, firstRow, lines in microscope.streamLines():
+            linesReceived += len(lines)
+            blocksReceived += 1
+
+    consumer = asyncio.create_task(consumeLines())
+    start = time.perf_counter()
+    await microscope.startScan(params)
+    async for event in microscope.streamEvents():
+        if event["event"] in ("scanCompleted", "disconnected"):
+            break
+    seconds = time.perf_counter() - start
+    await microscope.lines.waitEmpty()
+    consumer.cancel()
+    await microscope.close()
+
+    samples = params.lengthX * microscope.completedRows
+    return {
+        "samples": samples,
+        "seconds": seconds,
+        "samplesPerSecond": samples / seconds,
+        "linesReceived": linesReceived,
+        "blocksReceived": blocksReceived,
+        "framesParsed": microscope.parser.frames,
+        "corruptedFrames": microscope.parser.corrupted,
+        "linesRepeated": microscope.commandCount - params.lengthY,
+    }
+
+
+def main(args=None):
+    args = parseArguments(args)
+    engine = SimulatorEngine(args.images, DEVICE_LOWER_CURRENT_BOUND, DEVICE_UPPER_CURRENT_BOUND, pathToCache=args.cache)
+    engine.updateTunnelCurrent(DEVICE_INITIAL_SCREWS)
+    device = FakeDevice(engine, corruptionRate=args.corruption_rate, seed=args.seed)
+    device.start()
+    try:
+        microscope = SerialMicroscope(device.portName)
+        params = ScanParameters(0, 0, args.resolution, args.lines, 1, args.breadth)
+        result = asyncio.run(runScan(microscope, params))
+    finally:
+        device.close()
+        engine.close()
+
+    result["minRate"] = args.min_rate
+    print(json.dumps(result, indent=2))
+    if result["samplesPerSecond"] < args.min_rate:
+        print(f"Abtastrate {result['samplesPerSecond']:.0f} S/s liegt unter {args.min_rate:.0f} S/s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
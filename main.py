@@ -10,7 +10,12 @@ from widgets.resources import *
 from widgets.scanTabWidget import ScanTabWidget
 from widgets.fileTreeWidget import FileTreeWidget
 from widgets.preparationTabWidget import PreparationTabWidget
+from widgets.renderScheduler import RENDER_TARGET_FPS, RenderScheduler
 from simulator.simulator import SimulatorWindow
+from microscope.protocol import DEFAULT_SERVER_ADDRESS
+from microscope.qtBridge import QtMicroscopeAdapter
+from microscope.serialMicroscope import DEFAULT_SERIAL_PORT, SerialMicroscope
+from microscope.socketMicroscope import SocketMicroscope
 
 ENABLE_FILE_TREE = False
 ENABLE_SPLASH_SCREEN = False
@@ -20,6 +25,11 @@ SCAN_PARAMETER_LABEL = "Scan-Parameter"
 
 WINDOW_TITLE = "STM Scan-UI"
 
+# address of python -m simulator.server, host:port or unix:path
+SIMULATOR_SERVER_ADDRESS = DEFAULT_SERVER_ADDRESS
+# serial port of the 500€ RTM, python -m simulator.fakeDevice prints the port of an emulated device
+RTM_SERIAL_PORT = DEFAULT_SERIAL_PORT
+
 INITIAL_WINDOW_WIDTH = 1200
 INITIAL_WINDOW_HEIGHT = 800
 
@@ -31,6 +41,7 @@ SETPOINT_VALUES = ("Zielstrom:", 20, "nA", True, 10, 100)
 X_START_VALUES = ("Startkoordinate X:", 250, "", False, 0, 4000)
 Y_START_VALUES = ("Startkoordinate Y:", 250, "", False, 0, 4000)
 RESOLUTION_VALUES = ("Auflösung:", 250, "pixel x pixel", False, "", "")
+LINE_TIME_VALUES = ("Zeilenzeit:", 500, "ms", True, 0, 10000) # 0 scans as fast as possible
 
 
 class ValueRadioButton(qtw.QRadioButton):
@@ -48,7 +59,9 @@ class ValueRadioButton(qtw.QRadioButton):
 class MainWindow(qtw.QMainWindow):
 
     microscope = None
-    imgData = []
+    simulatorWindow = None
+    imgData = None
+    currentScanId = None
 
     isMidScan = False
 
@@ -255,6 +268,11 @@ class MainWindow(qtw.QMainWindow):
         )
         self.scanGroupBox.layout().addWidget(self.scanVelocityRow)
 
+        self.lineTimeRow = self.createParameterRow(
+            LINE_TIME_VALUES[0], f"{LINE_TIME_VALUES[1]}", f"{LINE_TIME_VALUES[4]} - {LINE_TIME_VALUES[5]} {LINE_TIME_VALUES[2]}", double=LINE_TIME_VALUES[3], top=LINE_TIME_VALUES[5], bottom=LINE_TIME_VALUES[4])
+        self.lineTimeRow.setToolTip("Zeit pro Scan-Zeile, 0 ms scannt so schnell wie möglich")
+        self.scanGroupBox.layout().addWidget(self.lineTimeRow)
+
         self.controlGroupBox = qtw.QGroupBox("Scan-Controls", self)
         self.controlGroupBox.setStyleSheet("QGroupBox {font-weight: bold;}")
         self.startBtn = qtw.QPushButton("Start", clicked=self.startHandler)
@@ -292,8 +310,9 @@ class MainWindow(qtw.QMainWindow):
         direction = 0 if self.directionRow.children()[2].isChecked() else 1
         # multiplier = int(self.multiplierRow.children()[2].text())
         velocity = float(self.scanVelocityRow.children()[2].text())
+        lineTime = float(self.lineTimeRow.children()[2].text()) / 1000
 
-        return (pGain, iGain, zHeight, xStart, yStart, xEnd, yEnd, direction, velocity, biasV)
+        return (pGain, iGain, zHeight, xStart, yStart, xEnd, yEnd, direction, velocity, biasV, lineTime)
 
     def updateParametersHandler(self):
         """This function handles the PID-parameter update functionality
@@ -379,7 +398,7 @@ class MainWindow(qtw.QMainWindow):
         For use in QAction
         """
 
-        if self.imgData != None:
+        if self.imgData is not None:
             fileName = qtw.QFileDialog.getSaveFileName(
                 self,
                 "Datei speichern unter...",
@@ -420,13 +439,15 @@ class MainWindow(qtw.QMainWindow):
         self.prepContainer.setLayout(qtw.QHBoxLayout())
         self.scanContainer = qtw.QWidget()
         
-        self.prepTabWidget = PreparationTabWidget()
+        # all graphs are redrawn together by one scheduler
+        self.renderScheduler = RenderScheduler(RENDER_TARGET_FPS, self)
+        self.prepTabWidget = PreparationTabWidget(renderScheduler=self.renderScheduler)
         self.prepTabWidget.rtmConnectBtn.clicked.connect(self.connectWithRTM)
         self.prepContainer.layout().addWidget(self.prepTabWidget)
 
         self.scanContainer.setLayout(qtw.QHBoxLayout())
 
-        self.scanTabWidget = ScanTabWidget()
+        self.scanTabWidget = ScanTabWidget(renderScheduler=self.renderScheduler)
         self.scanContainer.layout().addWidget(self.scanTabWidget)
         self.scanTabWidget.logMessage.connect(self.updateLog)
 
@@ -434,16 +455,45 @@ class MainWindow(qtw.QMainWindow):
 
         self.tabWidget.addTab(self.scanContainer, "Scans")
 
-    def updateScanCanvas(self, img):
-        """Slot function to handle image updates to the Scan canvas
+    def prepareScanCanvas(self, scanId, rows, cols):
+        """Slot function which allocates the scan buffer when a new scan is started
+
+        Args:
+            scanId (int): id of the started scan
+            rows (int): number of lines of the scan
+            cols (int): number of points per line
+        """
+        self.currentScanId = scanId
+        self.imgData = self.scanTabWidget.initScanBuffer(rows, cols)
+
+    def updateScanLines(self, firstRow, lines, scanId):
+        """Slot function to handle line updates to the Scan canvas
 
         Args:
-            img: img data in 3d array
+            firstRow (int): index of the first line in the scan
+            lines: block of line data
+            scanId (int): id of the scan the lines belong to
         """
-        self.imgData = img
-        self.scanTabWidget.updateImage(self.imgData)
+        # lines of older scans may still be queued after a restart
+        if scanId != self.currentScanId:
+            return
+        self.scanTabWidget.updateImageLines(firstRow, lines)
         self.statusBar.showMessage("Scan aktualisiert", 1000)
 
+    def scanCompletedHandler(self, scanId):
+        """Slot function which resets the scan controls once the scan is complete
+
+        Args:
+            scanId (int): id of the completed scan
+        """
+        if scanId != self.currentScanId:
+            return
+        self.isMidScan = False
+        self.startBtn.setEnabled(True)
+        self.pauseBtn.setEnabled(False)
+        self.stopBtn.setEnabled(False)
+        self.statusBar.showMessage("Scan abgeschlossen", 1000)
+
     def connectWithRTM(self):
         """This function handles connecting to the chosen RTM
 
@@ -452,25 +502,70 @@ class MainWindow(qtw.QMainWindow):
         if selected == 1: # if simulator is chosen
             self.updateLog("Verbindung wird aufgebaut...")
             qtc.QTimer.singleShot(2000, lambda: self.showSimulator())
-        else:
-            # TODO Add connection to hardware prototype code here
-            # init rtm connection
-            pass
+        elif selected == 2: # simulator running as separate process
+            self.connectSimulatorServer()
+        elif selected == 3: # 500€ RTM on the serial port
+            self.connectSerialMicroscope()
 
 
     def showSimulator(self):
-        """This function handles showing the simulator and connecting related signals
+        """This function handles showing the simulator and connecting to it through its driver
         """
         if self.microscope is None:
-            self.microscope = SimulatorWindow()
-            self.microscope.transmitTunnelCurrent.connect(self.prepTabWidget.updatePlot)
-            self.microscope.logMessage.connect(self.updateLog)
-            self.prepTabWidget.updateLED(True)
-            self.microscope.scanFinished.connect(self.stopHandler)
-            self.updateLog("Verbindung hergestellt!")
-            self.microscope.show()
+            self.simulatorWindow = SimulatorWindow()
+            self.connectMicroscope(self.simulatorWindow.createMicroscope())
+            self.simulatorWindow.show()
+        elif self.simulatorWindow is not None:
+            self.simulatorWindow.show()
         else:
-            self.microscope.show()
+            self.updateLog("Es besteht bereits eine Verbindung zu einem Mikroskop")
+
+    def connectSimulatorServer(self):
+        """This function connects to a simulator which runs as server in another process (python -m simulator.server)
+        """
+        if self.microscope is not None:
+            self.updateLog("Es besteht bereits eine Verbindung zu einem Mikroskop")
+            return
+        self.updateLog(f"Verbindung zu {SIMULATOR_SERVER_ADDRESS} wird aufgebaut...")
+        self.connectMicroscope(SocketMicroscope(SIMULATOR_SERVER_ADDRESS))
+
+    def connectSerialMicroscope(self):
+        """This function connects to the 500€ RTM on its serial port
+        """
+        if self.microscope is not None:
+            self.updateLog("Es besteht bereits eine Verbindung zu einem Mikroskop")
+            return
+        self.updateLog(f"Verbindung zu {RTM_SERIAL_PORT} wird aufgebaut...")
+        self.connectMicroscope(SerialMicroscope(RTM_SERIAL_PORT))
+
+    def connectMicroscope(self, driver):
+        """Runs a microscope driver and connects its signals, all microscopes are controlled through a driver
+
+        Args:
+            driver (Microscope): the driver
+        """
+        self.microscope = QtMicroscopeAdapter(driver, self)
+        self.microscope.transmitTunnelCurrent.connect(self.prepTabWidget.updatePlot)
+        self.microscope.logMessage.connect(self.updateLog)
+        self.microscope.scanStarted.connect(self.prepareScanCanvas)
+        self.microscope.transmitScanLines.connect(self.updateScanLines)
+        self.microscope.scanCompleted.connect(self.scanCompletedHandler)
+        self.microscope.connected.connect(self.microscopeConnected)
+        self.microscope.disconnected.connect(self.microscopeDisconnected)
+
+    def microscopeConnected(self):
+        self.prepTabWidget.updateLED(True)
+        self.updateLog("Verbindung hergestellt!")
+
+    def microscopeDisconnected(self):
+        self.prepTabWidget.updateLED(False)
+        self.updateLog("Verbindung zum Mikroskop getrennt")
+        self.microscope.close()
+        self.microscope = None
+        self.isMidScan = False
+        self.startBtn.setEnabled(True)
+        self.pauseBtn.setEnabled(False)
+        self.stopBtn.setEnabled(False)
 
     def startHandler(self):
         """This function handles stop and resume button functionality
@@ -482,15 +577,9 @@ class MainWindow(qtw.QMainWindow):
             qtw.QMessageBox.warning(self,
                                     "Mikroskop Verbinden!",
                                     "Es muss eine Verbindung zu einem Rastertunnelmikroskop bestehen um einen Scan zu starten!")
-        elif self.microscope == 1:
-            params = list(self.getExperimentParameters(forSubprocess=True))
-            params.insert(0, PATH_TO_SCRIPT)
-            subprocess.call(params)
-            
         elif self.isMidScan:
 
             self.statusBar.showMessage("Scan fortgesetzt", 10)
-            self.microscope.transmitScanImg.connect(self.updateScanCanvas)
             self.startBtn.setEnabled(False)
             self.stopBtn.setEnabled(True)
             self.microscope.resumeScan()
@@ -498,7 +587,6 @@ class MainWindow(qtw.QMainWindow):
             self.updateLog(f"Scan wird fortgesetzt.")
         else:
             self.statusBar.showMessage("Scan gestarted", 10)
-            self.microscope.transmitScanImg.connect(self.updateScanCanvas)
 
             self.startBtn.setEnabled(False)
             self.stopBtn.setEnabled(True)
@@ -517,7 +605,6 @@ class MainWindow(qtw.QMainWindow):
         self.microscope.pauseScan()
         self.startBtn.setEnabled(True)
         self.pauseBtn.setEnabled(False)
-        self.microscope.transmitScanImg.disconnect(self.updateScanCanvas)
         self.stopBtn.setEnabled(True)
 
     def stopHandler(self):
@@ -528,7 +615,6 @@ class MainWindow(qtw.QMainWindow):
         self.pauseBtn.setEnabled(False)
         self.stopBtn.setEnabled(False)
         self.microscope.stopScan()
-        self.microscope.transmitScanImg.disconnect(self.updateScanCanvas)
 
 ###  functions below are used in current iteration
 
@@ -614,6 +700,13 @@ class MainWindow(qtw.QMainWindow):
         self.fileTreeDock = FileTreeWidget()
         self.addDockWidget(qtc.Qt.LeftDockWidgetArea, self.fileTreeDock)
 
+    def closeEvent(self, event):
+        """Stops the microscope driver before the window is closed
+        """
+        if self.microscope is not None:
+            self.microscope.close()
+        super().closeEvent(event)
+
         
 
 
@@ -0,0 +1,176 @@
+"""Asynchronous driver interface for microscopes.
+
+A driver runs in an asyncio event loop. Commands are coroutines, the data of the microscope is received through
+the streams streamLines, streamCurrent and streamEvents. The streams are backed by bounded queues which never block the
+acquisition: if a consumer falls behind, scan lines of the same scan are merged into larger blocks and old tunnel
+current samples are dropped.
+"""
+import asyncio
+from collections import deque
+
+import numpy as np
+
+from simulator.model.engine import ScanParameters
+
+LINE_QUEUE_SIZE = 4 # blocks of scan lines
+CURRENT_QUEUE_SIZE = 4 # tunnel current samples
+EVENT_QUEUE_SIZE = 256
+
+
+class DroppingQueue:
+    """Bounded queue for a single consumer, putting never blocks. If the queue is full the oldest item is dropped.
+    The queue is bound to the event loop of its first get, so it can be created outside of the loop.
+    """
+    def __init__(self, maxsize: int):
+        self.items = deque(maxlen=maxsize)
+        self.ready = None
+        self.drained = None
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        if len(self.items) == self.items.maxlen:
+            self.dropped += 1
+        self.items.append(item)
+        if self.ready is not None:
+            self.ready.set()
+
+    async def get(self):
+        if self.ready is None:
+            self.ready = asyncio.Event()
+        while not self.items:
+            self.ready.clear()
+            await self.ready.wait()
+        item = self.items.popleft()
+        if not self.items and self.drained is not None:
+            self.drained.set()
+        return item
+
+    async def waitEmpty(self):
+        """Waits until the consumer has taken all queued items
+        """
+        if self.drained is None:
+            self.drained = asyncio.Event()
+        while self.items:
+            self.drained.clear()
+            await self.drained.wait()
+
+    def clear(self):
+        self.items.clear()
+
+
+class ScanLineQueue(DroppingQueue):
+    """Queue of finished scan lines. Only row ranges into the image buffer of the scan are queued,
+    so lines which follow a queued block of the same scan are merged into it instead of taking a new place.
+    A slow consumer therefore receives fewer, larger blocks and the lines are never copied.
+    """
+    def __init__(self, maxsize: int = LINE_QUEUE_SIZE):
+        super().__init__(maxsize)
+        self.coalesced = 0
+
+    def put(self, scanId: int, image: np.ndarray, firstRow: int, lastRow: int):
+        """Queues the lines firstRow to lastRow (exclusive) of a scan
+
+        Args:
+            scanId (int): id of the scan
+            image (np.ndarray): image buffer of the scan, the lines must not be written again
+            firstRow (int): index of the first line
+            lastRow (int): index after the last line
+        """
+        if self.items:
+            block = self.items[-1]
+            if block[0] == scanId and block[1] is image and block[3] == firstRow:
+                block[3] = lastRow
+                self.coalesced += 1
+                return
+        super().put([scanId, image, firstRow, lastRow])
+
+    async def get(self) -> tuple:
+        """
+        Returns:
+            tuple: scan id, index of the first line and a view of the lines
+        """
+        scanId, image, firstRow, lastRow = await super().get()
+        return scanId, firstRow, image[firstRow:lastRow]
+
+
+class Microscope:
+    """Interface of all microscope drivers. The coroutines must be awaited in the event loop of the driver.
+
+    Events are dicts with an "event" key:
+        log (message), scanStarted (scanId, rows, cols), scanCompleted (scanId), disconnected
+    """
+    def __init__(self):
+        self.lines = ScanLineQueue()
+        self.current = DroppingQueue(CURRENT_QUEUE_SIZE)
+        self.events = DroppingQueue(EVENT_QUEUE_SIZE)
+
+    async def connect(self):
+        """Connects to the microscope and starts streaming the tunnel current
+        """
+        raise NotImplementedError
+
+    async def setParams(self, kp: float, ki: float, setpoint: float, biasVoltage: float):
+        """Sets the control parameters
+
+        Args:
+            kp (float): proportional gain
+            ki (float): integral gain
+            setpoint (float): target current in nA
+            biasVoltage (float): bias voltage in V
+        """
+        raise NotImplementedError
+
+    async def startScan(self, params: ScanParameters):
+        """Starts a new scan, a running scan is stopped
+
+        Args:
+            params (ScanParameters): parameters of the scan
+        """
+        raise NotImplementedError
+
+    async def pauseScan(self):
+        raise NotImplementedError
+
+    async def resumeScan(self):
+        raise NotImplementedError
+
+    async def stop(self):
+        """Stops the running scan
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Stops the scan and disconnects from the microscope
+        """
+        raise NotImplementedError
+
+    async def streamLines(self):
+        """
+        Yields:
+            tuple: scan id, index of the first line and a block of finished lines
+        """
+        while True:
+            yield await self.lines.get()
+
+    async def streamCurrent(self):
+        """
+        Yields:
+            tuple: tunnel current and target current in A
+        """
+        while True:
+            yield await self.current.get()
+
+    async def streamEvents(self):
+        """
+        Yields:
+            dict: the next event
+        """
+        while True:
+            yield await self.events.get()
+
+    def emitEvent(self, event: str, **values):
+        values["event"] = event
+        self.events.put(values)
@@ -0,0 +1,166 @@
+"""Binary protocol between the GUI and a microscope process.
+
+Every message is a frame of a fixed header followed by the payload:
+
+    magic (2 bytes, b"RT") | version (uint8) | frame type (uint8) | payload length (uint32), little endian
+
+Commands and events are UTF-8 encoded JSON objects. Scan lines and tunnel current samples carry raw little-endian
+arrays, the array header holds the dtype character, the number of dimensions and the shape. Nothing is pickled.
+"""
+import json
+import struct
+
+import numpy as np
+
+PROTOCOL_MAGIC = b"RT"
+PROTOCOL_VERSION = 2
+MAX_PAYLOAD_LENGTH = 64 * 1024**2
+
+FRAME_HEADER = struct.Struct("<2sBBI")
+ARRAY_HEADER = struct.Struct("<cB")
+ARRAY_DIMENSION = struct.Struct("<I")
+LINE_HEADER = struct.Struct("<Ii") # scan id, row index
+
+# frame types
+FRAME_COMMAND = 1 # JSON object with a "command" key, GUI to microscope
+FRAME_EVENT = 2 # JSON object with an "event" key, microscope to GUI
+FRAME_SCAN_LINE = 3 # LINE_HEADER with the first row followed by the lines as array of shape (rows, cols)
+FRAME_CURRENT = 4 # array of shape (n, 2) with n samples of tunnel current and target current in A
+
+# dtypes which may be sent, all of them are sent little endian
+ARRAY_DTYPES = {"B": np.uint8, "H": np.uint16, "i": np.int32, "f": np.float32, "d": np.float64}
+
+DEFAULT_SERVER_ADDRESS = "127.0.0.1:5500"
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encodeFrame(frameType: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, frameType, len(payload)) + payload
+
+
+def encodeJson(frameType: int, message: dict) -> bytes:
+    return encodeFrame(frameType, json.dumps(message).encode("utf-8"))
+
+
+def encodeArray(array: np.ndarray) -> bytes:
+    """Encodes an array with its header, the data is converted to little endian if necessary
+
+    Args:
+        array (np.ndarray): array with one of the ARRAY_DTYPES
+
+    Returns:
+        bytes: header and raw data
+    """
+    dtype = np.dtype(array.dtype)
+    if dtype.char not in ARRAY_DTYPES:
+        raise ProtocolError(f"dtype {dtype} can not be sent")
+    header = ARRAY_HEADER.pack(dtype.char.encode(), array.ndim) + b"".join(ARRAY_DIMENSION.pack(size) for size in array.shape)
+    return header + np.ascontiguousarray(array, dtype=dtype.newbyteorder("<")).tobytes()
+
+
+def decodeArray(payload: memoryview) -> np.ndarray:
+    """Decodes an array encoded by encodeArray without copying the data
+
+    Args:
+        payload (memoryview): header and raw data
+
+    Returns:
+        np.ndarray: read only array
+    """
+    dtypeChar, ndim = ARRAY_HEADER.unpack_from(payload)
+    dtypeChar = dtypeChar.decode()
+    if dtypeChar not in ARRAY_DTYPES:
+        raise ProtocolError(f"unknown dtype {dtypeChar}")
+    offset = ARRAY_HEADER.size
+    shape = []
+    for _ in range(ndim):
+        shape.append(ARRAY_DIMENSION.unpack_from(payload, offset)[0])
+        offset += ARRAY_DIMENSION.size
+    dtype = np.dtype(ARRAY_DTYPES[dtypeChar]).newbyteorder("<")
+    count = int(np.prod(shape)) if shape else 1
+    if len(payload) - offset != count * dtype.itemsize:
+        raise ProtocolError("array size does not match its shape")
+    return np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+
+def encodeScanLine(scanId: int, row: int, lines: np.ndarray) -> bytes:
+    """
+    Args:
+        scanId (int): id of the scan
+        row (int): index of the first line
+        lines (np.ndarray): a line or a block of consecutive lines
+    """
+    return encodeFrame(FRAME_SCAN_LINE, LINE_HEADER.pack(scanId, row) + encodeArray(np.atleast_2d(lines)))
+
+
+def decodeScanLine(payload: memoryview) -> tuple:
+    """
+    Returns:
+        tuple: scan id, index of the first line and the lines of shape (rows, cols)
+    """
+    scanId, row = LINE_HEADER.unpack_from(payload)
+    lines = decodeArray(payload[LINE_HEADER.size:])
+    if lines.ndim != 2:
+        raise ProtocolError("scan lines must be two dimensional")
+    return scanId, row, lines
+
+
+def encodeCurrent(samples: np.ndarray) -> bytes:
+    return encodeFrame(FRAME_CURRENT, encodeArray(np.asarray(samples, dtype=np.float64).reshape(-1, 2)))
+
+
+class FrameReader:
+    """Splits a byte stream into frames. Data is fed in as it arrives, incomplete frames are kept until the rest arrives
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """Adds received data and returns all frames which are complete now
+
+        Args:
+            data (bytes): received data
+
+        Returns:
+            list: tuples of frame type and payload
+        """
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= FRAME_HEADER.size:
+            magic, version, frameType, length = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if magic != PROTOCOL_MAGIC or version != PROTOCOL_VERSION:
+                raise ProtocolError("invalid frame header")
+            if length > MAX_PAYLOAD_LENGTH:
+                raise ProtocolError(f"frame of {length} bytes is too large")
+            end = offset + FRAME_HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((frameType, memoryview(bytes(self.buffer[offset + FRAME_HEADER.size:end]))))
+            offset = end
+        del self.buffer[:offset]
+        return frames
+
+
+def decodeJson(payload: memoryview) -> dict:
+    return json.loads(bytes(payload).decode("utf-8"))
+
+
+def parseAddress(address: str) -> tuple:
+    """Parses a server address, either host:port for TCP or unix:path for a Unix domain socket
+
+    Args:
+        address (str): the address
+
+    Returns:
+        tuple: "tcp" and (host, port) or "unix" and the socket path
+    """
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"invalid address {address}, expected host:port or unix:path")
+    return "tcp", (host, int(port))
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+
+from PySide6 import QtCore as qtc
+
+from simulator.model.engine import ScanParameters
+
+from .driver import Microscope
+
+
+class QtMicroscopeAdapter(qtc.QObject):
+    """Bridges an asyncio microscope driver into the Qt event loop.
+
+    The driver runs in an event loop on its own thread. The commands of the main window are scheduled into that loop
+    and the streams of the driver are delivered as signals to the GUI thread. Scan lines and tunnel current samples
+    are only handed over after the GUI has processed the previous ones, while the GUI is busy the queues of the driver
+    merge the lines and drop old samples, so a slow GUI never stalls the acquisition.
+    """
+    transmitTunnelCurrent = qtc.Signal(float, float)
+    transmitScanLines = qtc.Signal(int, object, int) # index of the first line, block of lines, scan id
+    scanStarted = qtc.Signal(int, int, int) # scan id, number of lines, points per line
+    scanCompleted = qtc.Signal(int) # scan id
+    logMessage = qtc.Signal(str)
+
+    connected = qtc.Signal()
+    disconnected = qtc.Signal() # also emitted if the connection could not be established
+
+    # emitted on the driver thread, the connections to the slots below are queued
+    linesReceived = qtc.Signal(object)
+    currentReceived = qtc.Signal(object)
+    eventReceived = qtc.Signal(object)
+
+    def __init__(self, microscope: Microscope, parent=None):
+        super().__init__(parent)
+        self.microscope = microscope
+        self.isClosed = False
+
+        self.linesReceived.connect(self.deliverLines, qtc.Qt.QueuedConnection)
+        self.currentReceived.connect(self.deliverCurrent, qtc.Qt.QueuedConnection)
+        self.eventReceived.connect(self.deliverEvent, qtc.Qt.QueuedConnection)
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="microscopeDriver", daemon=True)
+        self.thread.start()
+        self.linesDelivered = None
+        self.currentDelivered = None
+        self.runFuture = self.submit(self.run())
+
+    def submit(self, coroutine):
+        """Schedules a coroutine in the event loop of the driver, errors are written to the log
+
+        Args:
+            coroutine: the coroutine
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(self.handleCommandResult)
+        return future
+
+    def handleCommandResult(self, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            print(error)
+            self.eventReceived.emit({"event": "log", "message": f"Fehler des Mikroskops: {error}"})
+
+    async def run(self):
+        self.linesDelivered = asyncio.Event()
+        self.currentDelivered = asyncio.Event()
+        try:
+            await self.microscope.connect()
+        except Exception as e:
+            # any failure of a driver has to reach the GUI, otherwise it waits for the connection forever
+            print(e)
+            self.eventReceived.emit({"event": "log", "message": f"Verbindung zum Mikroskop fehlgeschlagen: {e}"})
+            self.eventReceived.emit({"event": "disconnected"})
+            return
+        self.eventReceived.emit({"event": "connected"})
+        await asyncio.gather(self.pumpLines(), self.pumpCurrent(), self.pumpEvents())
+
+    async def pumpLines(self):
+        async for block in self.microscope.streamLines():
+            self.linesDelivered.clear()
+            self.linesReceived.emit(block)
+            await self.linesDelivered.wait()
+
+    async def pumpCurrent(self):
+        async for sample in self.microscope.streamCurrent():
+            self.currentDelivered.clear()
+            self.currentReceived.emit(sample)
+            await self.currentDelivered.wait()
+
+    async def pumpEvents(self):
+        # events are rare and are not acknowledged, so scanStarted always reaches the GUI before the first lines
+        async for event in self.microscope.streamEvents():
+            if event["event"] == "scanCompleted":
+                # the last lines of the scan are handed over first
+                await self.microscope.lines.waitEmpty()
+            self.eventReceived.emit(event)
+
+    def deliverLines(self, block):
+        scanId, firstRow, lines = block
+        try:
+            self.transmitScanLines.emit(firstRow, lines, scanId)
+        finally:
+            self.loop.call_soon_threadsafe(self.linesDelivered.set)
+
+    def deliverCurrent(self, sample):
+        try:
+            self.transmitTunnelCurrent.emit(*sample)
+        finally:
+            self.loop.call_soon_threadsafe(self.currentDelivered.set)
+
+    def deliverEvent(self, message: dict):
+        event = message["event"]
+        if event == "log":
+            self.logMessage.emit(message["message"])
+        elif event == "scanStarted":
+            self.scanStarted.emit(message["scanId"], message["rows"], message["cols"])
+        elif event == "scanCompleted":
+            self.scanCompleted.emit(message["scanId"])
+        elif event == "connected":
+            self.connected.emit()
+        elif event == "disconnected" and not self.isClosed:
+            self.isClosed = True
+            self.disconnected.emit()
+
+    def updateControlParameters(self, args):
+        """Sends the control parameters to the microscope
+
+        Args:
+            args (float, float, float, float): BiasVoltage, proportional Gain, integral Gain, Setpoint
+        """
+        biasV, pGain, iGain, zHeight = args
+        self.submit(self.microscope.setParams(kp=pGain, ki=iGain, setpoint=zHeight, biasVoltage=biasV))
+
+    def startScan(self, args):
+        """Starts a scan with the current parameters of the main GUI
+
+        Args:
+            args (float, float, float, int, int ,int ,int ,int, float, float, float):
+            proportional Gain, integral Gain, Setpoint, Start Coordinate x, start Coordinate y, End Coordinate in x, End Coordinate in y, Direction, Tip breadth, BiasVoltage, seconds per line
+        """
+        pGain, iGain, zHeight, xStart, yStart, xEnd, yEnd, direction, breadth, biasV, lineTime = args
+        self.updateControlParameters((biasV, pGain, iGain, zHeight))
+        self.submit(self.microscope.startScan(ScanParameters(xStart, yStart, xEnd, yEnd, direction, breadth, lineTime=lineTime)))
+
+    def pauseScan(self):
+        self.submit(self.microscope.pauseScan())
+
+    def resumeScan(self):
+        self.submit(self.microscope.resumeScan())
+
+    def stopScan(self):
+        self.submit(self.microscope.stop())
+
+    def close(self):
+        """Closes the driver and stops its event loop
+        """
+        if not self.thread.is_alive():
+            return
+        self.isClosed = True
+        self.runFuture.cancel()
+        try:
+            self.submit(self.microscope.close()).result()
+        except Exception as e:
+            print(e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
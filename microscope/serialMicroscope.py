@@ -0,0 +1,356 @@
+import asyncio
+import os
+from collections import deque
+
+try:
+    import termios
+    import tty
+except ImportError:
+    # serial ports are configured with termios, which is only available on POSIX systems
+    termios = None
+
+import numpy as np
+
+from simulator.model.engine import ScanParameters
+
+from .driver import Microscope
+from .serialProtocol import FRAME_CURRENT, FRAME_LINE, CommandBatch, FrameParser
+
+DEFAULT_SERIAL_PORT = "/dev/ttyACM0"
+DEFAULT_BAUDRATE = 2000000
+LINES_IN_FLIGHT = 2 # raster lines which are commanded before the first of them is complete
+LINE_TIMEOUT = 0.5 # seconds without line samples after which the outstanding lines are commanded again
+LOSS_TIMEOUT = 0.005 # seconds without any data after lost frames, after which the outstanding lines are commanded again
+NANO = 1e-9
+
+
+def openSerialPort(port: str, baudrate: int = DEFAULT_BAUDRATE) -> int:
+    """Opens a serial port in raw, non blocking mode
+
+    Args:
+        port (str): path of the port
+        baudrate (int, optional): baud rate. Defaults to DEFAULT_BAUDRATE.
+
+    Returns:
+        int: file descriptor of the port
+
+    Raises:
+        OSError: if the port can not be opened or configured, e.g. because it is not a terminal
+    """
+    if termios is None:
+        raise OSError("serial ports are only supported on POSIX systems")
+    speed = getattr(termios, f"B{baudrate}", None)
+    if speed is None:
+        raise ValueError(f"unsupported baud rate {baudrate}")
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attributes = termios.tcgetattr(fd)
+        attributes[4] = attributes[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attributes)
+    except termios.error as e:
+        os.close(fd)
+        # termios.error is not an OSError, callers only have to handle OSError
+        raise OSError(*e.args, port) from e
+    return fd
+
+
+class OutstandingLine:
+    """Receive state of a commanded raster line. A line which lost frames is commanded again as a whole, the frames of
+    every command of the line fill the same samples, so the line is complete once each sample arrived from any of them.
+    """
+    def __init__(self, length: int):
+        self.filled = np.zeros(length, dtype=bool)
+        self.missing = length
+        # indices of the commands of the line whose frames may still arrive, the device sends them in this order
+        self.commands = deque()
+        # offset of the next frame of the first command, 0 if none of its frames arrived yet
+        self.nextOffset = 0
+
+    def fill(self, offset: int, count: int):
+        self.missing -= count - np.count_nonzero(self.filled[offset:offset + count])
+        self.filled[offset:offset + count] = True
+
+    def endCommand(self):
+        """The frames of the first command stopped arriving, its remaining frames were lost or it was complete
+        """
+        if self.commands:
+            self.commands.popleft()
+        self.nextOffset = 0
+
+    def isLost(self) -> bool:
+        """
+        Returns:
+            bool: True if samples are missing which no outstanding command will send anymore
+        """
+        if self.missing == 0:
+            return False
+        if len(self.commands) > 1 or (self.commands and self.nextOffset == 0):
+            # a command whose frames did not start yet sends the whole line
+            return False
+        return not self.commands or not self.filled[:self.nextOffset].all()
+
+
+class SerialMicroscope(Microscope):
+    """Driver of the 500€ RTM on a serial port. Commands issued in the same iteration of the event loop are
+    written in one batch. The scan is rastered line by line, the next lines are commanded while the device sends
+    the samples of the current one, so the device never waits for the host. With a line time in the scan parameters
+    a line is not commanded before it is due, without one the scan runs as fast as the device.
+    """
+    def __init__(self, port: str = DEFAULT_SERIAL_PORT, baudrate: int = DEFAULT_BAUDRATE):
+        super().__init__()
+        self.port = port
+        self.baudrate = baudrate
+        self.fd = None
+        self.parser = FrameParser()
+        self.batch = CommandBatch()
+        self.output = bytearray()
+        self.flushScheduled = False
+        self.targetCurrent = 0
+
+        self.params = None
+        self.scanId = 0
+        self.scanTag = 0
+        self.image = None
+        self.received = {}
+        self.commandCount = 0
+        self.nextRow = 0
+        self.completedRows = 0
+        self.isPaused = False
+        self.lastLineTime = 0
+        self.scanOrigin = 0
+        self.requestHandle = None
+        self.lossHandle = None
+        self.watchTask = None
+
+    async def connect(self):
+        self.fd = openSerialPort(self.port, self.baudrate)
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.fd, self.readAvailable)
+        self.watchTask = asyncio.create_task(self.watchLines())
+        # lines of a scan before the connection are cancelled
+        self.batch.stop()
+        self.scheduleFlush()
+
+    def readAvailable(self):
+        try:
+            count = self.parser.ring.readFrom(self.fd)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(e)
+            count = 0
+        if count == 0:
+            self.disconnect()
+            return
+        self.cancelLossCheck()
+
+        for frameType, tag, offset, row, samples, afterLoss in self.parser.parse():
+            if frameType == FRAME_CURRENT:
+                if afterLoss:
+                    # the device sends the frames of a line at once, so frames lost before a current frame
+                    # were the last frames of the outstanding lines
+                    self.commandOutstandingLines()
+                if len(samples):
+                    self.current.put((float(samples[-1]), self.targetCurrent))
+            elif frameType == FRAME_LINE and tag == self.scanTag and self.image is not None:
+                self.receiveSamples(offset, row, samples)
+
+        if not self.parser.isSynchronized and self.received:
+            # the data ends with lost frames, if the device sends nothing more they were the last frames of the outstanding lines
+            self.lossHandle = asyncio.get_running_loop().call_later(LOSS_TIMEOUT, self.commandOutstandingLines)
+
+    def receiveSamples(self, offset: int, row: int, samples: np.ndarray):
+        line = self.received.get(row)
+        if line is None:
+            # the rest of a line which was already complete or was never commanded
+            return
+        self.lastLineTime = asyncio.get_running_loop().time()
+
+        # the frames of a line are sent in order, a frame before the expected one starts the next command of the line
+        if offset < line.nextOffset:
+            line.endCommand()
+        if line.commands:
+            # the device sends the commands in order, so every older command of the other lines is finished
+            for otherRow, other in list(self.received.items()):
+                if otherRow != row:
+                    while other.commands and other.commands[0] < line.commands[0]:
+                        other.endCommand()
+                    if other.isLost():
+                        self.commandLine(otherRow)
+
+        count = min(len(samples), self.params.lengthX - offset)
+        self.image[row, offset:offset + count] = samples[:count]
+        line.fill(offset, count)
+        line.nextOffset = offset + count
+        if line.nextOffset >= self.params.lengthX:
+            line.endCommand()
+
+        if line.missing > 0:
+            if line.isLost():
+                self.commandLine(row)
+            return
+
+        del self.received[row]
+        self.completedRows += 1
+        self.lines.put(self.scanId, self.image, row, row + 1)
+        if self.completedRows == self.params.lengthY:
+            self.image = None
+            self.emitEvent("log", message="Scan wurde erfolgreich beendet")
+            self.emitEvent("scanCompleted", scanId=self.scanId)
+        else:
+            self.requestLines()
+
+    def requestLines(self):
+        """Commands raster lines until LINES_IN_FLIGHT lines are outstanding or the next line is not due yet
+        """
+        self.cancelRequest()
+        loop = asyncio.get_running_loop()
+        lineTime = self.params.lineTime
+        while not self.isPaused and len(self.received) < LINES_IN_FLIGHT and self.nextRow < self.params.lengthY:
+            if lineTime:
+                dueTime = self.scanOrigin + self.nextRow * lineTime
+                if dueTime > loop.time():
+                    self.requestHandle = loop.call_at(dueTime, self.requestLines)
+                    break
+            self.commandLine(self.nextRow)
+            self.nextRow += 1
+        self.scheduleFlush()
+
+    def commandOutstandingLines(self):
+        """Commands all outstanding lines again in the order of their commands, without waiting for LINE_TIMEOUT
+        """
+        self.lossHandle = None
+        for row in sorted(self.received, key=lambda row: self.received[row].commands[-1] if self.received[row].commands else 0):
+            line = self.received[row]
+            line.commands.clear()
+            line.nextOffset = 0
+            self.commandLine(row)
+
+    def cancelLossCheck(self):
+        if self.lossHandle is not None:
+            self.lossHandle.cancel()
+            self.lossHandle = None
+
+    def cancelRequest(self):
+        if self.requestHandle is not None:
+            self.requestHandle.cancel()
+            self.requestHandle = None
+
+    def commandLine(self, row: int):
+        """Commands the raster of a line, a line which lost samples is rastered again as a whole
+
+        Args:
+            row (int): index of the line
+        """
+        params = self.params
+        self.batch.rasterLine(self.scanTag, row, params.startX, params.startY + row, params.lengthX, params.direction, params.breadth)
+        self.commandCount += 1
+        line = self.received.get(row)
+        if line is None:
+            line = self.received[row] = OutstandingLine(params.lengthX)
+        line.commands.append(self.commandCount)
+        self.scheduleFlush()
+
+    async def watchLines(self):
+        """Commands the outstanding lines again if their last frame was lost
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(LINE_TIMEOUT)
+            if self.received and loop.time() - self.lastLineTime > LINE_TIMEOUT:
+                self.commandOutstandingLines()
+                self.lastLineTime = loop.time()
+
+    def scheduleFlush(self):
+        if not self.flushScheduled:
+            self.flushScheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.flushScheduled = False
+        if self.fd is None:
+            return
+        self.output += self.batch.take()
+        self.writeAvailable()
+
+    def writeAvailable(self):
+        loop = asyncio.get_running_loop()
+        try:
+            sent = os.write(self.fd, self.output)
+            del self.output[:sent]
+        except BlockingIOError:
+            pass
+        if self.output:
+            loop.add_writer(self.fd, self.writeAvailable)
+        else:
+            loop.remove_writer(self.fd)
+
+    def disconnect(self):
+        if self.fd is None:
+            return
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self.fd)
+        loop.remove_writer(self.fd)
+        os.close(self.fd)
+        self.fd = None
+        self.emitEvent("disconnected")
+
+    async def setParams(self, kp: float, ki: float, setpoint: float, biasVoltage: float):
+        self.batch.setBias(biasVoltage)
+        self.batch.setGains(kp, ki, setpoint)
+        self.targetCurrent = setpoint * NANO
+        self.scheduleFlush()
+
+    async def startScan(self, params: ScanParameters):
+        self.batch.stop()
+        self.params = params
+        self.scanId += 1
+        # lines of the previous scan which are still in the buffers of the device are recognized by their tag
+        self.scanTag = (self.scanTag + 1) % 256
+        self.image = np.zeros((params.lengthY, params.lengthX))
+        self.received = {}
+        self.nextRow = 0
+        self.completedRows = 0
+        self.isPaused = False
+        self.lastLineTime = self.scanOrigin = asyncio.get_running_loop().time()
+        self.cancelRequest()
+        self.lines.clear()
+        self.emitEvent("scanStarted", scanId=self.scanId, rows=params.lengthY, cols=params.lengthX)
+        self.requestLines()
+
+    async def pauseScan(self):
+        # the lines which were already commanded are completed
+        self.isPaused = True
+
+    async def resumeScan(self):
+        if self.image is not None:
+            self.isPaused = False
+            # the line time starts again after a pause
+            self.scanOrigin = asyncio.get_running_loop().time() - self.nextRow * (self.params.lineTime or 0)
+            self.requestLines()
+
+    async def stop(self):
+        self.batch.stop()
+        self.image = None
+        self.received = {}
+        self.cancelRequest()
+        self.cancelLossCheck()
+        self.scheduleFlush()
+
+    async def close(self):
+        self.cancelRequest()
+        self.cancelLossCheck()
+        if self.watchTask is not None:
+            self.watchTask.cancel()
+            self.watchTask = None
+        if self.fd is None:
+            return
+        self.batch.stop()
+        self.output += self.batch.take()
+        try:
+            os.write(self.fd, self.output)
+        except OSError as e:
+            print(e)
+        self.output.clear()
+        self.disconnect()
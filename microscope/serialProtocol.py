@@ -0,0 +1,258 @@
+"""Serial protocol of the 500€ RTM.
+
+Commands from the host are small frames which are collected in a CommandBatch and written at once:
+
+    sync (2 bytes, b"\\xa5\\x5a") | command (uint8) | payload length (uint8) | payload | crc32 (uint32), little endian
+
+The device sends its samples in frames of float32 values, a raster line is split into several frames:
+
+    sync (2 bytes, b"\\x5a\\xa5") | frame type (uint8) | scan tag (uint8) | offset (uint16) | count (uint16) | row (int32) |
+    count float32 samples | crc32 (uint32), little endian
+
+The crc32 covers everything between the sync bytes and the crc. Received data is read into a RingBuffer and the
+FrameParser returns the samples as views into it. Corrupted frames are skipped by searching for the next sync bytes.
+"""
+import os
+import struct
+import zlib
+
+import numpy as np
+
+COMMAND_SYNC = b"\xa5\x5a"
+COMMAND_HEADER = struct.Struct("<2sBB")
+
+SAMPLE_SYNC = b"\x5a\xa5"
+SAMPLE_HEADER = struct.Struct("<2sBBHHi")
+CHECKSUM = struct.Struct("<I")
+SAMPLE_DTYPE = np.dtype("<f4")
+
+# commands
+CMD_SET_BIAS = 1 # float32 bias voltage in V
+CMD_SET_GAINS = 2 # float32 kp, ki and setpoint in nA
+CMD_RASTER_LINE = 3 # RASTER_LINE payload
+CMD_STOP = 4 # no payload, cancels all raster lines
+RASTER_LINE = struct.Struct("<BiiiHBf") # scan tag, row, start x, start y, number of points, direction, breadth
+
+# frame types of the device
+FRAME_CURRENT = 1 # tunnel current samples in A, offset and row are 0 and -1
+FRAME_LINE = 2 # samples of a raster line starting at offset
+
+MAX_FRAME_SAMPLES = 1024
+MAX_FRAME_SIZE = SAMPLE_HEADER.size + MAX_FRAME_SAMPLES * SAMPLE_DTYPE.itemsize + CHECKSUM.size
+RING_BUFFER_SIZE = 1 << 20
+
+
+def encodeCommand(command: int, payload: bytes = b"") -> bytes:
+    frame = COMMAND_HEADER.pack(COMMAND_SYNC, command, len(payload)) + payload
+    return frame + CHECKSUM.pack(zlib.crc32(frame[len(COMMAND_SYNC):]))
+
+
+def parseCommands(buffer: bytearray) -> list:
+    """Parses the complete command frames at the start of the buffer and removes them, this is the device side
+
+    Args:
+        buffer (bytearray): received data
+
+    Returns:
+        list: tuples of command and payload
+    """
+    commands = []
+    pos = 0
+    while len(buffer) - pos >= COMMAND_HEADER.size:
+        sync, command, length = COMMAND_HEADER.unpack_from(buffer, pos)
+        if sync != COMMAND_SYNC:
+            found = buffer.find(COMMAND_SYNC, pos + 1)
+            pos = found if found >= 0 else len(buffer) - 1
+            continue
+        frameEnd = pos + COMMAND_HEADER.size + length + CHECKSUM.size
+        if frameEnd > len(buffer):
+            break
+        if zlib.crc32(buffer[pos + len(COMMAND_SYNC):frameEnd - CHECKSUM.size]) != CHECKSUM.unpack_from(buffer, frameEnd - CHECKSUM.size)[0]:
+            pos += 1
+            continue
+        commands.append((command, bytes(buffer[pos + COMMAND_HEADER.size:frameEnd - CHECKSUM.size])))
+        pos = frameEnd
+    del buffer[:pos]
+    return commands
+
+
+def encodeSamples(frameType: int, tag: int, offset: int, row: int, samples: np.ndarray) -> bytes:
+    """Encodes samples as one frame of the device
+
+    Args:
+        frameType (int): FRAME_CURRENT or FRAME_LINE
+        tag (int): scan tag of the raster line
+        offset (int): index of the first sample in the line
+        row (int): index of the line
+        samples (np.ndarray): at most MAX_FRAME_SAMPLES samples
+
+    Returns:
+        bytes: the frame
+    """
+    body = SAMPLE_HEADER.pack(SAMPLE_SYNC, frameType, tag, offset, len(samples), row)[len(SAMPLE_SYNC):]
+    body += np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE).tobytes()
+    return SAMPLE_SYNC + body + CHECKSUM.pack(zlib.crc32(body))
+
+
+class CommandBatch:
+    """Collects commands which are then written to the device in one write
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def setBias(self, voltage: float):
+        self.buffer += encodeCommand(CMD_SET_BIAS, struct.pack("<f", voltage))
+
+    def setGains(self, kp: float, ki: float, setpoint: float):
+        self.buffer += encodeCommand(CMD_SET_GAINS, struct.pack("<fff", kp, ki, setpoint))
+
+    def rasterLine(self, tag: int, row: int, startX: int, startY: int, count: int, direction: int, breadth: float):
+        self.buffer += encodeCommand(CMD_RASTER_LINE, RASTER_LINE.pack(tag, row, startX, startY, count, direction, breadth))
+
+    def stop(self):
+        self.buffer += encodeCommand(CMD_STOP)
+
+    def take(self) -> bytes:
+        """
+        Returns:
+            bytes: all collected commands, the batch is empty afterwards
+        """
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class RingBuffer:
+    """Receive buffer which is filled directly from a file descriptor. The parsed frames are views into the buffer,
+    so the samples are not copied until they are written to their destination.
+
+    Frames never wrap around: when the free space at the end is smaller than a frame, the unparsed rest,
+    which is shorter than one frame, is moved to the start.
+    """
+    def __init__(self, size: int = RING_BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.readPos = 0
+        self.writePos = 0
+
+    def __len__(self):
+        return self.writePos - self.readPos
+
+    def makeRoom(self):
+        if len(self.buffer) - self.writePos < MAX_FRAME_SIZE:
+            pending = self.writePos - self.readPos
+            self.buffer[:pending] = bytes(self.view[self.readPos:self.writePos])
+            self.readPos, self.writePos = 0, pending
+
+    def readFrom(self, fd: int) -> int:
+        """Reads the available data of a non blocking file descriptor into the buffer
+
+        Args:
+            fd (int): the file descriptor
+
+        Returns:
+            int: number of bytes read, 0 at the end of the file
+        """
+        self.makeRoom()
+        count = os.readv(fd, [self.view[self.writePos:]])
+        self.writePos += count
+        return count
+
+    def write(self, data: bytes):
+        """Copies data into the buffer, for data which does not come from a file descriptor
+        """
+        self.makeRoom()
+        self.buffer[self.writePos:self.writePos + len(data)] = data
+        self.writePos += len(data)
+
+
+class FrameParser:
+    """Parses the sample frames of the device from a RingBuffer. After a corrupted frame the parser resynchronizes
+    on the next sync bytes, so one bad frame only loses its own samples. The first frame after a corrupted section
+    is marked, so the driver knows at once that frames before it were lost.
+    """
+    def __init__(self, ring: RingBuffer = None):
+        self.ring = RingBuffer() if ring is None else ring
+        self.frames = 0
+        self.corrupted = 0 # corrupted sections of the stream, each one is skipped in a single resynchronization
+        self.isSynchronized = True
+
+    def loseSync(self):
+        if self.isSynchronized:
+            self.isSynchronized = False
+            self.corrupted += 1
+
+    def parse(self) -> list:
+        """Parses all complete frames in the buffer
+
+        Returns:
+            list: tuples of frame type, scan tag, offset, row, samples and whether frames were lost right before the frame,
+                the samples are only valid until the next read
+        """
+        ring = self.ring
+        buffer = ring.buffer
+        frames = []
+        pos, end = ring.readPos, ring.writePos
+        while end - pos >= SAMPLE_HEADER.size:
+            if buffer[pos] != SAMPLE_SYNC[0] or buffer[pos + 1] != SAMPLE_SYNC[1]:
+                self.loseSync()
+                found = buffer.find(SAMPLE_SYNC, pos + 1, end)
+                if found < 0:
+                    # the last byte may be the start of the next sync
+                    pos = end - 1
+                    break
+                pos = found
+                continue
+
+            _, frameType, tag, offset, count, row = SAMPLE_HEADER.unpack_from(buffer, pos)
+            if frameType not in (FRAME_CURRENT, FRAME_LINE) or count > MAX_FRAME_SAMPLES:
+                self.loseSync()
+                pos += 1
+                continue
+            dataStart = pos + SAMPLE_HEADER.size
+            frameEnd = dataStart + count * SAMPLE_DTYPE.itemsize + CHECKSUM.size
+            if frameEnd > end:
+                # a corrupted count may wait for data which the device never sends, a valid frame behind the header proves it wrong
+                if self.findFrame(pos + 1, end) < 0:
+                    break
+                self.loseSync()
+                pos += 1
+                continue
+            if not self.isValidFrame(pos, frameEnd):
+                self.loseSync()
+                pos += 1
+                continue
+
+            frames.append((frameType, tag, offset, row, np.frombuffer(buffer, dtype=SAMPLE_DTYPE, count=count, offset=dataStart), not self.isSynchronized))
+            self.frames += 1
+            self.isSynchronized = True
+            pos = frameEnd
+        ring.readPos = pos
+        return frames
+
+    def isValidFrame(self, pos: int, frameEnd: int) -> bool:
+        buffer = self.ring.buffer
+        return zlib.crc32(self.ring.view[pos + len(SAMPLE_SYNC):frameEnd - CHECKSUM.size]) == CHECKSUM.unpack_from(buffer, frameEnd - CHECKSUM.size)[0]
+
+    def findFrame(self, start: int, end: int) -> int:
+        """Searches the next complete frame with a valid checksum
+
+        Args:
+            start (int): position in the buffer where the search starts
+            end (int): end of the received data
+
+        Returns:
+            int: position of the frame or -1
+        """
+        buffer = self.ring.buffer
+        pos = buffer.find(SAMPLE_SYNC, start, end)
+        while 0 <= pos <= end - SAMPLE_HEADER.size:
+            _, frameType, _, _, count, _ = SAMPLE_HEADER.unpack_from(buffer, pos)
+            frameEnd = pos + SAMPLE_HEADER.size + count * SAMPLE_DTYPE.itemsize + CHECKSUM.size
+            if frameType in (FRAME_CURRENT, FRAME_LINE) and count <= MAX_FRAME_SAMPLES and frameEnd <= end and self.isValidFrame(pos, frameEnd):
+                return pos
+            pos = buffer.find(SAMPLE_SYNC, pos + 1, end)
+        return -1
@@ -0,0 +1,101 @@
+import asyncio
+
+from simulator.model.clock import MonotonicClock
+from simulator.model.engine import NANO, ScanParameters, SimulatorEngine
+from simulator.model.scanWorker import LINE_INTERVAL, ScanWorker
+
+from .driver import Microscope
+
+CURRENT_INTERVAL = 0.05 # seconds between two tunnel current samples
+
+LOG_CURRENT_TOO_HIGH_MSG = "Tunnelstrom zu hoch - Scan vermutlich weiß oder verrauscht"
+LOG_CURRENT_TOO_LOW_MSG = "Tunnelstrom zu niedrig - Scan vermutlich schwarz"
+LOG_CURRENT_ERROR_MSG = "Abweichung des Tunnelstroms im Konstantstrommodus (RMS): {:.3g} nA"
+
+
+class SimulatorMicroscope(Microscope):
+    """Driver of the simulator in this process. The tunnel current is sampled by a task in the event loop of the driver,
+    the scan lines are generated by a ScanWorker on its own thread, so neither of them waits for the other or for the GUI.
+    Both of them are paced by the clock, a ScaledClock or VirtualClock runs the simulation faster than real time.
+    """
+    def __init__(self, engine: SimulatorEngine, lineInterval: float = LINE_INTERVAL, currentInterval: float = CURRENT_INTERVAL, clock: MonotonicClock = None):
+        super().__init__()
+        self.engine = engine
+        self.lineInterval = lineInterval
+        self.currentInterval = currentInterval
+        self.clock = MonotonicClock() if clock is None else clock
+        self.currentTask = None
+        self.worker = None
+        self.session = None
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        # the callbacks of the worker hand the results over to the event loop
+        self.worker = ScanWorker(
+            lambda session, rows: loop.call_soon_threadsafe(self.putLines, session, rows),
+            lambda session: loop.call_soon_threadsafe(self.finishScan, session),
+            self.lineInterval,
+            self.clock
+        )
+        self.currentTask = asyncio.create_task(self.sampleCurrent())
+
+    async def sampleCurrent(self):
+        clock = self.clock
+        nextTime = clock.now()
+        while True:
+            self.current.put((self.engine.getTunnelCurrent(), self.engine.getTargetCurrent()))
+            # samples which were missed are skipped instead of being taken in a burst
+            nextTime = max(nextTime + self.currentInterval, clock.now())
+            await clock.sleep(nextTime - clock.now())
+
+    async def setParams(self, kp: float, ki: float, setpoint: float, biasVoltage: float):
+        self.engine.setPidParams(ki=ki, kp=kp, setpoint=setpoint)
+        self.engine.setBiasVoltage(biasVoltage)
+
+    async def startScan(self, params: ScanParameters):
+        self.session = session = self.engine.startScanSession(params)
+        self.lines.clear()
+        self.emitEvent("scanStarted", scanId=session.scanId, rows=session.lengthY, cols=session.lengthX)
+
+        currentVal = self.engine.getTunnelCurrent()
+        if currentVal < self.engine.lowerCurrentBound:
+            self.emitEvent("log", message=LOG_CURRENT_TOO_LOW_MSG)
+        if currentVal >= self.engine.upperCurrentBound:
+            self.emitEvent("log", message=LOG_CURRENT_TOO_HIGH_MSG)
+
+        # a running scan is cancelled by the worker
+        self.worker.start(session)
+
+    def putLines(self, session, rows: range):
+        # lines of a stopped scan may still arrive after the stop
+        if session is self.session:
+            # finished lines are never written again, so the queue only holds their range
+            self.lines.put(session.scanId, session.image, rows.start, rows.stop)
+
+    def finishScan(self, session):
+        if session is self.session:
+            self.session = None
+            self.emitEvent("log", message="Scan wurde erfolgreich beendet")
+            currentError = session.getCurrentErrorRms()
+            if currentError is not None:
+                self.emitEvent("log", message=LOG_CURRENT_ERROR_MSG.format(currentError / NANO))
+            self.emitEvent("scanCompleted", scanId=session.scanId)
+
+    async def pauseScan(self):
+        self.worker.pause()
+
+    async def resumeScan(self):
+        self.worker.resume()
+
+    async def stop(self):
+        self.session = None
+        self.worker.stop()
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.close()
+            self.worker = None
+        self.session = None
+        if self.currentTask is not None:
+            self.currentTask.cancel()
+            self.currentTask = None
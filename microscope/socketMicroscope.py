@@ -0,0 +1,101 @@
+import asyncio
+import socket
+
+import numpy as np
+
+from simulator.model.engine import ScanParameters
+
+from .driver import Microscope
+from .protocol import (DEFAULT_SERVER_ADDRESS, FRAME_COMMAND, FRAME_CURRENT, FRAME_EVENT, FRAME_SCAN_LINE, FrameReader, ProtocolError,
+                       decodeArray, decodeJson, decodeScanLine, encodeJson, parseAddress)
+
+RECEIVE_BUFFER_SIZE = 65536
+
+
+class SocketMicroscope(Microscope):
+    """Driver of a microscope process which speaks microscope.protocol, e.g. python -m simulator.server.
+    The received lines are collected in one image buffer per scan, so they can be queued like the lines of a local driver.
+    """
+    def __init__(self, address: str = DEFAULT_SERVER_ADDRESS):
+        super().__init__()
+        self.address = address
+        self.reader = None
+        self.writer = None
+        self.readTask = None
+        self.scanImages = {}
+
+    async def connect(self):
+        family, socketAddress = parseAddress(self.address)
+        if family == "unix":
+            self.reader, self.writer = await asyncio.open_unix_connection(socketAddress)
+        else:
+            host, port = socketAddress
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+            self.writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.readTask = asyncio.create_task(self.readFrames())
+
+    async def readFrames(self):
+        frameReader = FrameReader()
+        try:
+            while True:
+                data = await self.reader.read(RECEIVE_BUFFER_SIZE)
+                if not data:
+                    break
+                for frameType, payload in frameReader.feed(data):
+                    self.handleFrame(frameType, payload)
+        except (ProtocolError, ValueError) as e:
+            print(e)
+            self.emitEvent("log", message=f"Ungültige Daten vom Mikroskop: {e}")
+        except ConnectionError as e:
+            print(e)
+        finally:
+            self.writer.close()
+            self.emitEvent("disconnected")
+
+    def handleFrame(self, frameType: int, payload: memoryview):
+        if frameType == FRAME_CURRENT:
+            for tunnelCurrent, targetCurrent in decodeArray(payload):
+                self.current.put((float(tunnelCurrent), float(targetCurrent)))
+        elif frameType == FRAME_SCAN_LINE:
+            scanId, row, lines = decodeScanLine(payload)
+            image = self.scanImages.get(scanId)
+            if image is not None:
+                image[row:row + len(lines)] = lines
+                self.lines.put(scanId, image, row, row + len(lines))
+        elif frameType == FRAME_EVENT:
+            message = decodeJson(payload)
+            event = message.get("event")
+            if event == "scanStarted":
+                # only the buffer of the newest scan is kept
+                self.scanImages = {message["scanId"]: np.zeros((message["rows"], message["cols"]))}
+                self.lines.clear()
+            elif event == "scanCompleted":
+                self.scanImages.pop(message["scanId"], None)
+            self.events.put(message)
+
+    async def sendCommand(self, command: str, **arguments):
+        arguments["command"] = command
+        self.writer.write(encodeJson(FRAME_COMMAND, arguments))
+        await self.writer.drain()
+
+    async def setParams(self, kp: float, ki: float, setpoint: float, biasVoltage: float):
+        await self.sendCommand("setParams", kp=kp, ki=ki, setpoint=setpoint, biasVoltage=biasVoltage)
+
+    async def startScan(self, params: ScanParameters):
+        await self.sendCommand("startScan", startX=params.startX, startY=params.startY, lengthX=params.lengthX, lengthY=params.lengthY,
+                               direction=params.direction, breadth=params.breadth, lineTime=params.lineTime)
+
+    async def pauseScan(self):
+        await self.sendCommand("pauseScan")
+
+    async def resumeScan(self):
+        await self.sendCommand("resumeScan")
+
+    async def stop(self):
+        await self.sendCommand("stopScan")
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.readTask is not None:
+            await self.readTask
@@ -0,0 +1,166 @@
+"""Emulates the 500€ RTM on a pseudo terminal, so the serial driver can be tested and benchmarked without hardware.
+
+The device answers the commands of microscope.serialProtocol with the data of a SimulatorEngine: raster lines are
+scanned by the engine as soon as they are commanded and the tunnel current is sent at a fixed interval.
+
+Example:
+    python -m simulator.fakeDevice
+"""
+import argparse
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+import tty
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from microscope.serialProtocol import (CMD_RASTER_LINE, CMD_SET_BIAS, CMD_SET_GAINS, CMD_STOP, FRAME_CURRENT, FRAME_LINE, RASTER_LINE,
+                                       encodeSamples, parseCommands)
+from simulator.model.engine import PATH_TO_IMAGES, SimulatorEngine
+from simulator.model.materialCache import PATH_TO_MATERIAL_CACHE
+
+DEVICE_LOWER_CURRENT_BOUND = 1e-9
+DEVICE_UPPER_CURRENT_BOUND = 1e-7
+DEVICE_INITIAL_SCREWS = (100, 100, 100)
+
+CURRENT_INTERVAL = 0.05 # seconds between two tunnel current samples
+FRAME_SAMPLES = 512 # samples per line frame
+RECEIVE_BUFFER_SIZE = 4096
+OUTPUT_HIGH_WATER = 1 << 20 # no new lines are scanned while this many bytes wait to be sent
+
+
+class FakeDevice:
+    """Serves the commands of the serial driver on the master side of a pseudo terminal,
+    the driver opens portName like the port of the real device
+    """
+    def __init__(self, engine: SimulatorEngine, currentInterval: float = CURRENT_INTERVAL, corruptionRate: float = 0.0, seed=None):
+        """
+        Args:
+            engine (SimulatorEngine): engine which generates the data
+            currentInterval (float, optional): seconds between two tunnel current samples. Defaults to CURRENT_INTERVAL.
+            corruptionRate (float, optional): share of the frames in which a byte is flipped. Defaults to 0.0.
+            seed (optional): seed of the corruption. Defaults to None.
+        """
+        self.engine = engine
+        self.currentInterval = currentInterval
+        self.corruptionRate = corruptionRate
+        self.random = np.random.default_rng(seed)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.portName = os.ttyname(self.slave)
+
+        self.commands = bytearray()
+        self.output = bytearray()
+        self.rasterLines = deque()
+        self.isRunning = False
+        self.thread = None
+
+    def start(self):
+        self.isRunning = True
+        self.thread = threading.Thread(target=self.run, name="fakeDevice", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.isRunning = False
+        if self.thread is not None:
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def run(self):
+        nextCurrentTime = time.monotonic()
+        while self.isRunning:
+            # lines are only scanned when the host keeps up with reading, like the send buffer of the device
+            if self.rasterLines and len(self.output) < OUTPUT_HIGH_WATER:
+                self.scanLine(*self.rasterLines.popleft())
+
+            now = time.monotonic()
+            if now >= nextCurrentTime:
+                self.sendFrame(FRAME_CURRENT, 0, 0, -1, np.array([self.engine.getTunnelCurrent()]))
+                nextCurrentTime = max(nextCurrentTime + self.currentInterval, now)
+
+            timeout = 0 if self.rasterLines and len(self.output) < OUTPUT_HIGH_WATER else min(max(nextCurrentTime - now, 0), 0.05)
+            writers = [self.master] if self.output else []
+            readable, writable, _ = select.select([self.master], writers, [], timeout)
+            if readable:
+                self.receive()
+            if writable:
+                try:
+                    sent = os.write(self.master, self.output)
+                    del self.output[:sent]
+                except BlockingIOError:
+                    pass
+
+    def receive(self):
+        try:
+            data = os.read(self.master, RECEIVE_BUFFER_SIZE)
+        except (BlockingIOError, OSError):
+            return
+        self.commands += data
+        for command, payload in parseCommands(self.commands):
+            if command == CMD_SET_BIAS:
+                self.engine.setBiasVoltage(struct.unpack("<f", payload)[0])
+            elif command == CMD_SET_GAINS:
+                kp, ki, setpoint = struct.unpack("<fff", payload)
+                self.engine.setPidParams(ki=ki, kp=kp, setpoint=setpoint)
+            elif command == CMD_RASTER_LINE:
+                self.rasterLines.append(RASTER_LINE.unpack(payload))
+            elif command == CMD_STOP:
+                self.rasterLines.clear()
+
+    def scanLine(self, tag: int, row: int, startX: int, startY: int, count: int, direction: int, breadth: float):
+        # lines scanned without tunnel current stay black
+        if self.engine.getTunnelCurrent() >= self.engine.lowerCurrentBound:
+            line = self.engine.getScanLine(startX, startY, count, direction, breadth)
+        else:
+            line = np.zeros(count)
+        for offset in range(0, count, FRAME_SAMPLES):
+            self.sendFrame(FRAME_LINE, tag, offset, row, line[offset:offset + FRAME_SAMPLES])
+
+    def sendFrame(self, frameType: int, tag: int, offset: int, row: int, samples: np.ndarray):
+        frame = encodeSamples(frameType, tag, offset, row, samples)
+        if self.corruptionRate and self.random.random() < self.corruptionRate:
+            frame = bytearray(frame)
+            frame[self.random.integers(len(frame))] ^= 0xff
+        self.output += frame
+
+
+def parseArguments(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m simulator.fakeDevice", description="Emulates the 500€ RTM on a pseudo terminal.")
+    parser.add_argument("--images", type=Path, default=Path(PATH_TO_IMAGES), help="directory of the material images")
+    parser.add_argument("--cache", type=Path, default=PATH_TO_MATERIAL_CACHE, help="directory of the decoded material cache")
+    parser.add_argument("--corruption-rate", type=float, default=0.0, help="share of the frames which are corrupted")
+    parser.add_argument("--shared-materials", action="store_true", help="share the materials with the other simulators on this machine")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parseArguments(args)
+    engine = SimulatorEngine(args.images, DEVICE_LOWER_CURRENT_BOUND, DEVICE_UPPER_CURRENT_BOUND, pathToCache=args.cache, sharedMaterials=args.shared_materials)
+    engine.updateTunnelCurrent(DEVICE_INITIAL_SCREWS)
+    device = FakeDevice(engine, corruptionRate=args.corruption_rate)
+    device.start()
+
+    # terminating the device releases the materials like an interrupt
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"RTM wartet auf {device.portName}", file=sys.stderr)
+    try:
+        while device.thread.is_alive():
+            device.thread.join(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.close()
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Generates synthetic scans in bulk, e.g. for training data sets.
+
+Every combination of the given parameter values is scanned once. The scans are distributed over a process pool,
+written to TIFF files by the workers and listed in a manifest with one JSON object per scan.
+
+Example:
+    python -m simulator.generate --output scans --materials RTM_TOP --resolution 256 512 --breadth 0.1 0.5
+    python -m simulator.generate --output scans --constant-current --kp 1 2 4 --setpoint 10 20
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import tifffile
+
+from simulator.model.engine import INITIAL_BIASVOLTAGE, INITIAL_IK, INITIAL_PK, INITIAL_SETPOINT, PATH_TO_IMAGES, ScanParameters, SimulatorEngine
+from simulator.model.materialCache import PATH_TO_MATERIAL_CACHE
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+# parameters of the feedback loop, which only change the scans in constant current mode, and their defaults
+CONSTANT_CURRENT_ARGUMENTS = {"bias": INITIAL_BIASVOLTAGE, "kp": INITIAL_PK, "ki": INITIAL_IK, "setpoint": INITIAL_SETPOINT}
+GENERATE_CHUNK_SIZE = 4
+
+# engine of the worker process, created once per worker by initWorker
+workerEngine = None
+
+
+def getWorkerCount() -> int:
+    """Returns the number of CPUs this process may run on
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parseResolution(value: str) -> tuple:
+    """Parses a resolution given as N or NXxNY
+
+    Args:
+        value (str): the resolution
+
+    Returns:
+        tuple: points per line and number of lines
+    """
+    lengthX, _, lengthY = value.lower().partition("x")
+    return int(lengthX), int(lengthY or lengthX)
+
+
+def parseArguments(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m simulator.generate", description="Generates synthetic scans for every combination of the given parameters.")
+    parser.add_argument("--output", "-o", type=Path, required=True, help="directory the scans and the manifest are written to")
+    parser.add_argument("--images", type=Path, default=Path(PATH_TO_IMAGES), help="directory of the material images")
+    parser.add_argument("--cache", type=Path, default=PATH_TO_MATERIAL_CACHE, help="directory of the decoded material cache")
+    parser.add_argument("--materials", nargs="+", default=None, help="names of the material images without extension, all materials by default")
+    parser.add_argument("--start-x", nargs="+", type=int, default=[0])
+    parser.add_argument("--start-y", nargs="+", type=int, default=[0])
+    parser.add_argument("--resolution", nargs="+", type=parseResolution, default=[(256, 256)], help="N or NXxNY")
+    parser.add_argument("--direction", nargs="+", type=int, default=[1], choices=(0, 1), help="0 for left, 1 for right")
+    parser.add_argument("--breadth", nargs="+", type=float, default=[0.1])
+    parser.add_argument("--bias", nargs="+", type=float, default=[INITIAL_BIASVOLTAGE])
+    parser.add_argument("--kp", nargs="+", type=float, default=[INITIAL_PK])
+    parser.add_argument("--ki", nargs="+", type=float, default=[INITIAL_IK])
+    parser.add_argument("--setpoint", nargs="+", type=float, default=[INITIAL_SETPOINT], help="target current in nA")
+    parser.add_argument("--constant-current", action="store_true", help="scan the topography in constant current mode")
+    parser.add_argument("--seed", type=int, default=0, help="the scan with index i uses the noise seed SEED + i")
+    parser.add_argument("--workers", type=int, default=getWorkerCount())
+    return parser.parse_args(args)
+
+
+def buildJobs(args: argparse.Namespace, materialPaths: list) -> list:
+    """Builds one job per combination of the parameter values
+
+    Args:
+        args (argparse.Namespace): parsed command line arguments
+        materialPaths (list): paths of the selected material images
+
+    Returns:
+        list: job dictionaries which are sent to the workers
+
+    Raises:
+        ValueError: if parameters of the feedback loop are given without --constant-current
+    """
+    if not args.constant_current:
+        # image mode scans do not depend on them, every value would give the same scans
+        given = [name for name, default in CONSTANT_CURRENT_ARGUMENTS.items() if getattr(args, name) != [default]]
+        if given:
+            raise ValueError(f"{', '.join('--' + name for name in given)} only change scans with --constant-current")
+    grid = itertools.product(materialPaths, args.start_x, args.start_y, args.resolution, args.direction, args.breadth, args.bias, args.kp, args.ki, args.setpoint)
+    jobs = []
+    for index, (material, startX, startY, (lengthX, lengthY), direction, breadth, bias, kp, ki, setpoint) in enumerate(grid):
+        jobs.append({
+            "index": index,
+            "file": f"scan_{index:06d}.tif",
+            "material": material.stem,
+            "materialPath": str(material),
+            "startX": startX,
+            "startY": startY,
+            "lengthX": lengthX,
+            "lengthY": lengthY,
+            "direction": direction,
+            "breadth": breadth,
+            "bias": bias,
+            "kp": kp,
+            "ki": ki,
+            "setpoint": setpoint,
+            "constantCurrent": args.constant_current,
+            "seed": args.seed + index,
+        })
+    return jobs
+
+
+def initWorker(pathToImages: str, pathToCache: str):
+    """Creates the engine of a worker process. Materials are only loaded when a job needs them,
+    they are attached from the shared material store or memory mapped from the material cache
+    """
+    global workerEngine
+    workerEngine = SimulatorEngine(pathToImages, pathToCache=pathToCache, prefetchMaterials=False, sharedMaterials=True, initialImage=None)
+
+
+def runJob(job: dict, outputDir: str) -> dict:
+    """Generates a single scan and writes it to a TIFF file
+
+    Args:
+        job (dict): job from buildJobs
+        outputDir (str): directory the scan is written to
+
+    Returns:
+        dict: manifest entry of the scan
+    """
+    startTime = time.perf_counter()
+    engine = workerEngine
+    engine.setCurrentImage(engine.imgPaths.index(Path(job["materialPath"])))
+    engine.setBiasVoltage(job["bias"])
+    engine.setPidParams(ki=job["ki"], kp=job["kp"], setpoint=job["setpoint"])
+
+    params = ScanParameters(job["startX"], job["startY"], job["lengthX"], job["lengthY"], job["direction"], job["breadth"],
+                            constantCurrent=job["constantCurrent"], seed=job["seed"])
+    session = engine.runScan(params)
+    scan = session.image.astype(np.float32)
+    tifffile.imwrite(Path(outputDir) / job["file"], scan, photometric="minisblack")
+
+    entry = {key: value for key, value in job.items() if key != "materialPath"}
+    entry["min"] = float(scan.min())
+    entry["max"] = float(scan.max())
+    if session.currentError is not None:
+        # second channel of the constant current mode: deviation of the tunnel current from the setpoint in A
+        entry["errorFile"] = job["file"].replace(".tif", "_error.tif")
+        tifffile.imwrite(Path(outputDir) / entry["errorFile"], session.currentError.astype(np.float32), photometric="minisblack")
+        entry["currentErrorRms"] = session.getCurrentErrorRms()
+    entry["seconds"] = time.perf_counter() - startTime
+    return entry
+
+
+def selectMaterials(pathToImages: Path, names: list) -> list:
+    paths = SimulatorEngine.getImgPaths(pathToImages)
+    if names is None:
+        return sorted(paths)
+    byName = {path.stem: path for path in paths}
+    missing = [name for name in names if name not in byName]
+    if missing:
+        raise ValueError(f"Unknown materials: {', '.join(missing)}, available: {', '.join(sorted(byName))}")
+    return [byName[name] for name in names]
+
+
+def generate(args: argparse.Namespace) -> int:
+    """Runs all jobs on the process pool and writes the manifest while the scans are finished
+
+    Returns:
+        int: number of generated scans
+    """
+    materialPaths = selectMaterials(args.images, args.materials)
+    jobs = buildJobs(args, materialPaths)
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    # every material is built once here and stays published in shared memory until all scans are finished,
+    # the workers only attach to it. Pinned materials are not evicted by the byte budget
+    engine = SimulatorEngine(args.images, pathToCache=args.cache, prefetchMaterials=False, sharedMaterials=True, initialImage=None)
+    for path in materialPaths:
+        engine.materials.get(path, pin=True)
+
+    startTime = time.perf_counter()
+    workers = max(1, min(args.workers, len(jobs)))
+    try:
+        with open(args.output / MANIFEST_FILE_NAME, "w") as manifest, \
+                ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(str(args.images), str(args.cache))) as executor:
+            results = executor.map(runJob, jobs, itertools.repeat(str(args.output)), chunksize=GENERATE_CHUNK_SIZE)
+            for count, entry in enumerate(results, 1):
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+                print(f"\r{count}/{len(jobs)} Scans", end="", file=sys.stderr)
+    finally:
+        engine.close()
+
+    duration = time.perf_counter() - startTime
+    print(f"\n{len(jobs)} Scans in {duration:.1f} s mit {workers} Prozessen erzeugt", file=sys.stderr)
+    return len(jobs)
+
+
+def main(args=None):
+    try:
+        generate(parseArguments(args))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+
+class MonotonicClock:
+    """Clock of the simulation. The scan worker and the tunnel current sampler read the time and wait through a clock,
+    so the simulation can run faster than real time by exchanging it.
+
+    This clock runs in real time. Waiting is done on condition variables for threads and with sleep for asyncio tasks,
+    so waiters are still woken up by commands at once.
+    """
+    def now(self) -> float:
+        """
+        Returns:
+            float: the simulated time in seconds
+        """
+        return time.monotonic()
+
+    def wait(self, condition: threading.Condition, timeout: float = None) -> bool:
+        """Waits on a condition which the caller holds, like condition.wait
+
+        Args:
+            condition (threading.Condition): the condition
+            timeout (float, optional): simulated seconds after which the wait ends, None waits for a notify. Defaults to None.
+
+        Returns:
+            bool: False if the timeout expired
+        """
+        return condition.wait(timeout)
+
+    async def sleep(self, seconds: float):
+        """Waits in an asyncio task
+
+        Args:
+            seconds (float): simulated seconds
+        """
+        await asyncio.sleep(seconds)
+
+
+class ScaledClock(MonotonicClock):
+    """Clock which runs at a multiple of real time, e.g. 100 for a scan in a hundredth of its time
+    """
+    def __init__(self, speed: float):
+        """
+        Args:
+            speed (float): simulated seconds per real second
+        """
+        self.speed = speed
+        self.realOrigin = time.monotonic()
+
+    def now(self) -> float:
+        return (time.monotonic() - self.realOrigin) * self.speed
+
+    def wait(self, condition: threading.Condition, timeout: float = None) -> bool:
+        return condition.wait(None if timeout is None else timeout / self.speed)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds / self.speed)
+
+
+class VirtualClock(MonotonicClock):
+    """Clock which only advances when advance is called, e.g. by a test or a batch job. Waiters whose time has come
+    are woken up by advance, so a whole scan runs as fast as the time is advanced and independent of the load of the machine.
+    """
+    def __init__(self, start: float = 0):
+        """
+        Args:
+            start (float, optional): simulated time at the start. Defaults to 0.
+        """
+        self.time = start
+        self.lock = threading.Lock()
+        self.conditions = set()
+        self.sleepers = []
+
+    def now(self) -> float:
+        return self.time
+
+    def wait(self, condition: threading.Condition, timeout: float = None) -> bool:
+        deadline = None if timeout is None else self.time + timeout
+        with self.lock:
+            if deadline is not None and self.time >= deadline:
+                # the time was advanced before the waiter was registered
+                return False
+            self.conditions.add(condition)
+        try:
+            # advance notifies all conditions, the waiter checks its deadline itself
+            condition.wait()
+        finally:
+            with self.lock:
+                self.conditions.discard(condition)
+        return deadline is None or self.time < deadline
+
+    async def sleep(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            if seconds > 0:
+                self.sleepers.append((self.time + seconds, loop, future))
+            else:
+                future.set_result(None)
+        await future
+
+    def advance(self, seconds: float):
+        """Advances the time and wakes up all waiters whose time has come
+
+        Args:
+            seconds (float): simulated seconds
+        """
+        with self.lock:
+            self.time += seconds
+            conditions = list(self.conditions)
+            due = [sleeper for sleeper in self.sleepers if sleeper[0] <= self.time]
+            self.sleepers = [sleeper for sleeper in self.sleepers if sleeper[0] > self.time]
+
+        for condition in conditions:
+            with condition:
+                condition.notify_all()
+        for _, loop, future in due:
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
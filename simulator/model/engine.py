@@ -0,0 +1,552 @@
+
+import math
+from pathlib import Path
+
+import numpy as np
+
+from .materialCache import MATERIAL_CACHE_BYTE_BUDGET, MaterialCache, MaterialLibrary, PATH_TO_MATERIAL_CACHE
+from .noise import NoiseEngine, NoiseModel
+from .pid import BatchPID
+from .pyramid import MaterialPyramid
+from .sharedMaterialStore import SharedMaterialStore
+
+PATH_TO_IMAGES = "simulator/img"
+
+LOWER_CURRENT_BOUND = 0
+UPPER_CURRENT_BOUND = 1e-6
+
+PID_ENABLED = False
+PID_ENABLE_LIMIT = False
+PID_LIMIT_BOTTOM =10e-10
+PID_LIMIT_TOP = 10e-5
+PID_SAMPLE_TIME = 0.1
+
+SCREW_TARGET = 100
+
+
+NANO = 1e-9
+INITIAL_PK = 2
+INITIAL_IK = 0.5
+INITIAL_DK = 0
+INITIAL_SETPOINT = 20
+INITIAL_BIASVOLTAGE = 1.0
+MINIMUM_IMG_DATA_VAL = 0
+MAXIMUM_IMG_DATA_VAL = 255
+
+NOISE_SEED = None # None draws a new seed on every start, set an int for reproducible scans
+
+# materials are published in shared memory, so that all simulator processes on the machine use the same copy.
+# A single simulator maps the material cache instead, publishing would copy every material once more
+SHARED_MATERIALS_ENABLED = False
+
+# constant current mode: I = CONSTANT_CURRENT_PREFACTOR * biasVoltage * exp(-2 * CONSTANT_CURRENT_DECAY * gap)
+CONSTANT_CURRENT_DECAY = 10.25 # decay constant of the tunneling current in 1/nm, about 4 eV work function
+CONSTANT_CURRENT_PREFACTOR = 1e-3 # in A/V
+CONSTANT_CURRENT_HEIGHT_SCALE = 0.0005 # surface height in nm per grey level of the material image
+CONSTANT_CURRENT_GAIN_SCALE = 0.1 # scales the gains of the GUI to the feedback loop which runs once per scanned point
+CONSTANT_CURRENT_PIXEL_TIME = 1.0 # time step of the feedback loop per scanned point
+CONSTANT_CURRENT_MIN_BIAS = 1e-3 # the current vanishes without bias voltage, smaller voltages are raised to this value
+CONSTANT_CURRENT_MIN_SETPOINT = 1e-12 # the loop works on the logarithm of the current, so the setpoint has to be positive
+CONSTANT_CURRENT_Z_RANGE = (0, 5) # range of the tip height in nm which the piezo can reach, the feedback loop is limited to it
+
+
+class ScanParameters:
+    """Parameters of a single scan
+    """
+    def __init__(self, startX: int = 0, startY: int = 0, lengthX: int = 100, lengthY: int = 100, direction: int = 1, breadth: float = 0.1, constantCurrent: bool = None, seed=None, lineTime: float = None):
+        """
+        Args:
+            startX (int, optional): start coordinate in x. Defaults to 0.
+            startY (int, optional): start coordinate in y. Defaults to 0.
+            lengthX (int, optional): number of points per line. Defaults to 100.
+            lengthY (int, optional): number of lines. Defaults to 100.
+            direction (int, optional): 0 for left, 1 for right. Defaults to 1.
+            breadth (float, optional): tip breadth. Defaults to 0.1.
+            constantCurrent (bool, optional): scan in constant current mode, None uses the mode of the engine. Defaults to None.
+            seed (optional): seeds the noise before the scan, None continues the running generator. Defaults to None.
+            lineTime (float, optional): seconds per line, 0 scans as fast as possible, None uses the line interval of the driver. Defaults to None.
+        """
+        self.startX = startX
+        self.startY = startY
+        self.lengthX = lengthX
+        self.lengthY = lengthY
+        self.direction = direction
+        self.breadth = breadth
+        self.constantCurrent = constantCurrent
+        self.seed = seed
+        self.lineTime = lineTime
+
+
+class SimulatorEngine:
+    """This class is the simulation core of the microscope. It only depends on numpy, so scans can be generated
+    without Qt, e.g. in batch jobs or tests. SimulatorModel wraps it for the GUI.
+    """
+    pid: BatchPID
+    currentImage: np.ndarray
+    currentPyramid: MaterialPyramid
+    currentPath: Path = None
+    imgPaths: list
+    tunnelCurrent: float = 0
+    scanCount: int = 0
+    noiseAmplitude = None
+    constantCurrentMode: bool = False
+
+    def __init__(self, pathToImages=PATH_TO_IMAGES, lowerCurrentBound=LOWER_CURRENT_BOUND, upperCurrentBound=UPPER_CURRENT_BOUND, pathToCache=PATH_TO_MATERIAL_CACHE, materialByteBudget=MATERIAL_CACHE_BYTE_BUDGET, noiseSeed=NOISE_SEED, prefetchMaterials=True, sharedMaterials=SHARED_MATERIALS_ENABLED, initialImage=0):
+        self.materialCache = MaterialCache(pathToCache)
+        self.imgPaths = self.getImgPaths(Path(pathToImages))
+
+        self.sharedStore = SharedMaterialStore(pathToCache) if sharedMaterials and SharedMaterialStore.isSupported() else None
+        self.sharedKeys = {}
+
+        # all materials are decoded in the background so that switching materials does not block
+        self.materials = MaterialLibrary(self.loadMaterial, byteBudget=materialByteBudget, releaseFunction=self.releaseMaterial)
+        if prefetchMaterials:
+            self.materials.prefetch(self.imgPaths)
+        # with None no material is loaded until setCurrentImage is called, e.g. by workers which only scan some materials
+        if initialImage is not None:
+            self.setCurrentImage(initialImage)
+
+        self.lowerCurrentBound = lowerCurrentBound
+        self.upperCurrentBound = upperCurrentBound
+
+        self.biasVoltage = INITIAL_BIASVOLTAGE
+        self.noise = NoiseEngine(seed=noiseSeed)
+
+        # the controller advances one fixed time step per call, so it does not depend on the timing of the calls
+        self.pid = BatchPID(INITIAL_PK, INITIAL_IK, INITIAL_DK, setpoint=INITIAL_SETPOINT * NANO, sampleTime=PID_SAMPLE_TIME)
+        if PID_ENABLE_LIMIT:
+            self.pid.outputLimits = (PID_LIMIT_BOTTOM, PID_LIMIT_TOP )
+
+    def setPidParams(self, ki, kp, setpoint):
+        self.pid.ki = ki
+        self.pid.kp = kp
+        self.pid.setpoint = setpoint*NANO
+
+    def setConstantCurrentMode(self, enabled: bool):
+        """Switches between the image mode, which returns the intensities of the material image,
+        and the constant current mode, which returns the height of the tip. Only affects scans started afterwards
+
+        Args:
+            enabled (bool): True for the constant current mode
+        """
+        self.constantCurrentMode = enabled
+
+    def getConstantCurrentPid(self) -> BatchPID:
+        """Returns the feedback controller of the constant current mode with the gains set by setPidParams
+
+        Returns:
+            BatchPID: controller which works on the logarithm of the current and outputs 2 * CONSTANT_CURRENT_DECAY * z
+        """
+        lowerZ, upperZ = CONSTANT_CURRENT_Z_RANGE
+        return BatchPID(
+            self.pid.kp * CONSTANT_CURRENT_GAIN_SCALE, self.pid.ki * CONSTANT_CURRENT_GAIN_SCALE, self.pid.kd * CONSTANT_CURRENT_GAIN_SCALE,
+            setpoint=-math.log(self.getConstantCurrentSetpoint()), sampleTime=CONSTANT_CURRENT_PIXEL_TIME,
+            outputLimits=(2 * CONSTANT_CURRENT_DECAY * lowerZ, 2 * CONSTANT_CURRENT_DECAY * upperZ))
+
+    def getConstantCurrentSetpoint(self) -> float:
+        return max(self.pid.setpoint, CONSTANT_CURRENT_MIN_SETPOINT)
+
+    def getTargetCurrent(self):
+        return self.pid.setpoint
+
+    def setBiasVoltage(self, voltage):
+        self.biasVoltage = voltage
+
+    @staticmethod
+    def getImgPaths(path: Path) -> list:
+        return [img.resolve() for img in path.iterdir() if not img.is_dir()]
+
+    def updateTunnelCurrent(self, screwVals: tuple):
+        a, b, c = screwVals
+        a = SCREW_TARGET-a
+        b = SCREW_TARGET-b
+        c = SCREW_TARGET-c
+
+        retVal = math.pow((math.exp(-(a+b+c))), self.biasVoltage)
+        if PID_ENABLED:
+            self.tunnelCurrent = retVal
+        else:
+            self.tunnelCurrent = self.constrainedTunnelCurrent(retVal, self.lowerCurrentBound, self.upperCurrentBound)
+            
+    def constrainedTunnelCurrent(self, value, lowerBound, upperBound):
+        constrainedValue = value
+        if value < lowerBound:
+            constrainedValue = lowerBound
+        elif value > upperBound:
+            constrainedValue = upperBound
+        
+        return constrainedValue
+
+    def getTunnelCurrent(self):
+        if PID_ENABLED:
+            self.tunnelCurrent /= self.pid(self.tunnelCurrent)
+        return self.tunnelCurrent
+
+    def setNoiseModel(self, model: NoiseModel, amplitude=None):
+        """Sets the noise model used for scans
+
+        Args:
+            model (NoiseModel): the noise model
+            amplitude (float, optional): fixed amplitude in grey levels,
+                None uses the difference of setpoint and tunnel current. Defaults to None.
+        """
+        self.noise.setModel(model)
+        self.noiseAmplitude = amplitude
+
+    def seedNoise(self, seed):
+        """Seeds the noise generator so that scans can be reproduced
+
+        Args:
+            seed: seed of the generator
+        """
+        self.noise.seed(seed)
+
+    def getNoiseAmplitude(self):
+        if self.noiseAmplitude is not None:
+            return self.noiseAmplitude
+        return abs(self.pid.setpoint - self.getTunnelCurrent())
+
+    def addNoise(self, Y, size, out=None, noiseBuffer=None):
+        return self.noise.addNoise(Y, self.getNoiseAmplitude(), out=out, noiseBuffer=noiseBuffer)
+
+    def setCurrentImage(self, idx):
+        if idx < len(self.imgPaths):
+            path = self.imgPaths[idx]
+            try:
+                # the current material is pinned, so loading other materials never evicts it under a running scan
+                self.currentPyramid = self.materials.get(path, pin=True)
+                self.currentImage = self.currentPyramid.getImage()
+            except Exception as e:
+                if path != self.currentPath:
+                    self.materials.unpin(path)
+                print(e)
+                return
+            if self.currentPath is not None and self.currentPath != path:
+                self.materials.unpin(self.currentPath)
+            self.currentPath = path
+        else:
+            print("IMG idx out of range")
+
+    def getCurrentImage(self):
+        return self.currentImage
+
+    def loadMaterial(self, path: str) -> MaterialPyramid:
+        """Loads a material, with the shared material store it is only built if no other process has published it yet
+
+        Args:
+            path (str): path to the material image
+
+        Returns:
+            MaterialPyramid: the material
+        """
+        if self.sharedStore is None:
+            return self.buildMaterial(path)
+        key = self.materialCache.getCacheKey(path)
+        levels = self.sharedStore.acquire(key, lambda: self.buildMaterial(path).levels)
+        self.sharedKeys[path] = key
+        return MaterialPyramid.fromLevels(levels)
+
+    def buildMaterial(self, path: str) -> MaterialPyramid:
+        """Loads the image data of a material and builds its pyramid for wide scans
+
+        Args:
+            path (str): path to the material image
+
+        Returns:
+            MaterialPyramid: the material
+        """
+        # the cache already stores the scan major layout the pyramid is built on
+        return MaterialPyramid(self.loadImgData(path).T)
+
+    def releaseMaterial(self, path: str, material: MaterialPyramid):
+        """Detaches from a shared material when it is removed from the material library
+        """
+        key = self.sharedKeys.pop(path, None)
+        if key is not None:
+            self.sharedStore.release(key)
+
+    def close(self):
+        """Stops loading materials and releases all of them
+        """
+        self.materials.shutdown()
+
+    def loadImgData(self, path: str) -> np.ndarray:
+        try:
+            # decoded images are cached on disk and memory mapped in scan major layout,
+            # the transposed view is indexed by [x, y] like the image itself
+            return self.materialCache.load(path).T
+        except Exception as e:
+            print(e)
+            raise
+
+    def projectBreadthToInt(self, breadth):
+        breadthToInt = 0
+        if breadth < 0.1:
+            breadthToInt = breadth * 100
+        elif breadth < 1:
+            breadthToInt = breadth * 10
+        elif breadth:
+            breadthToInt = breadth 
+        
+        return int(breadthToInt)
+
+    def startScanSession(self, params: ScanParameters):
+        """Creates a new scan session which generates the scan line by line
+
+        Args:
+            params (ScanParameters): parameters of the scan
+
+        Returns:
+            ScanSession: the new scan session
+        """
+        if params.seed is not None:
+            self.seedNoise(params.seed)
+        self.scanCount += 1
+        return ScanSession(self, params, scanId=self.scanCount)
+
+    def scan(self, params: ScanParameters) -> np.ndarray:
+        """Generates a whole scan at once
+
+        Args:
+            params (ScanParameters): parameters of the scan
+
+        Returns:
+            np.ndarray: scan data with one line per row, the topography in nm in constant current mode
+        """
+        return self.runScan(params).image
+
+    def runScan(self, params: ScanParameters):
+        """Generates a whole scan at once
+
+        Args:
+            params (ScanParameters): parameters of the scan
+
+        Returns:
+            ScanSession: the finished session, with the current error in constant current mode
+        """
+        session = self.startScanSession(params)
+        session.nextLines(params.lengthY)
+        return session
+
+    def scanLines(self, params: ScanParameters, linesPerBlock: int = 1):
+        """Generates a scan line by line, the lines are computed in blocks of linesPerBlock lines
+
+        Args:
+            params (ScanParameters): parameters of the scan
+            linesPerBlock (int, optional): number of lines computed at once. Defaults to 1.
+
+        Yields:
+            tuple: index of the line and the line data
+        """
+        session = self.startScanSession(params)
+        while not session.isFinished():
+            for row in session.nextLines(linesPerBlock):
+                yield row, session.image[row]
+
+    def getScanImage(self, startX: int, startY: int, lengthX: int, lengthY: int, direction: int, maxY: int, breadth: int):
+        session = ScanSession(self, ScanParameters(startX, startY, lengthX, maxY, direction, breadth))
+        session.nextLines(lengthY)
+        return session.image
+
+    def getScanLine(self, startX: int, startY: int, length: int, direction: int, breadth=0.1, out=None, workspace=None):
+        if out is not None:
+            out = out.reshape(1, length)
+        return self.getScanBlock(startX, startY, length, 1, direction, breadth, out=out, workspace=workspace)[0]
+
+    def getScanBlock(self, startX: int, startY: int, nx: int, ny: int, direction: int, breadth=0.1, out=None, workspace=None) -> np.ndarray:
+        """Scans a rectangular block of ny lines with nx points each in one vectorized gather
+
+        Args:
+            startX (int): start coordinate of the lines in x
+            startY (int): coordinate of the first line in y
+            nx (int): number of points per line
+            ny (int): number of lines
+            direction (int): 0 for left, 1 for right
+            breadth (float, optional): tip breadth. Defaults to 0.1.
+            out (np.ndarray, optional): array of shape (ny, nx) the block is written to. Defaults to None.
+            workspace (ScanWorkspace, optional): buffers for the noise, without it temporaries are allocated. Defaults to None.
+
+        Returns:
+            np.ndarray: scan data with one line per row
+        """
+        # the pyramid levels are stored in scan major layout, so every scan line is read from contiguous memory
+        # the material may be changed by another thread while scanning, so the block is read from one pyramid
+        pyramid = self.currentPyramid
+        height, width = pyramid.getLevel(0).shape
+
+        # breadth determines distance of points. Simulator images are 4096 x 4096
+        breadthMultiplier = max(self.projectBreadthToInt(breadth), 1)
+        adjustedLength = nx * breadthMultiplier
+
+        if direction == 1:  # right direction
+            xCoords = np.arange(startX, startX + adjustedLength, breadthMultiplier)
+        else:  # left direction
+            xCoords = np.arange(startX - adjustedLength, startX, breadthMultiplier)
+        yCoords = np.arange(startY, startY + ny)
+
+        # wide scans read from a downsampled level, so every point is the mean of the pixels it covers
+        level = pyramid.levelForStep(breadthMultiplier)
+        levelImage = pyramid.getLevel(level)
+
+        # points and lines outside of the image stay black, the coordinates are sorted so the inside is one range
+        firstX, lastX = np.searchsorted(xCoords, (0, width))
+        firstY, lastY = max(startY, 0), min(startY + ny, height)
+        block = np.zeros((ny, nx)) if out is None else out
+        if lastY <= firstY:
+            block[...] = 0
+            return block
+        firstRow, lastRow = firstY - startY, lastY - startY
+        if breadthMultiplier % (1 << level) == 0 and lastX > firstX:
+            # the points are evenly spaced in the level as well, so a strided view can be used instead of a gather
+            levelStart = xCoords[firstX] >> level
+            levelStop = (xCoords[lastX - 1] >> level) + 1
+            block[firstRow:lastRow, firstX:lastX] = levelImage[firstY:lastY, levelStart:levelStop:breadthMultiplier >> level]
+        else:
+            block[firstRow:lastRow, firstX:lastX] = levelImage[firstY:lastY, xCoords[firstX:lastX] >> level]
+        block[:, :firstX] = 0
+        block[:, lastX:] = 0
+
+        noiseBuffer = workspace.getNoiseBuffer(block.shape) if workspace is not None else None
+        self.addNoise(block, block.shape, out=block, noiseBuffer=noiseBuffer)
+        # lines outside of the image do not get noise
+        block[:firstRow] = 0
+        block[lastRow:] = 0
+
+        # constrain values to the range of the image data
+        np.clip(block, MINIMUM_IMG_DATA_VAL, MAXIMUM_IMG_DATA_VAL, out=block)
+
+        return block
+
+    def getConstantCurrentBlock(self, startX: int, startY: int, nx: int, ny: int, direction: int, breadth=0.1, out=None, errorOut=None, workspace=None) -> tuple:
+        """Scans a block in constant current mode. The material image is the height of the surface and
+        the feedback loop moves the tip so that the tunneling current stays at the setpoint.
+
+        The loop works on the logarithm of the current, which is linear in the height of the tip,
+        so every line is solved in one vectorized pass by BatchPID.runLinearPlant. Each line starts with a settled loop.
+
+        Args:
+            startX (int): start coordinate of the lines in x
+            startY (int): coordinate of the first line in y
+            nx (int): number of points per line
+            ny (int): number of lines
+            direction (int): 0 for left, 1 for right
+            breadth (float, optional): tip breadth. Defaults to 0.1.
+            out (np.ndarray, optional): array of shape (ny, nx) the topography is written to. Defaults to None.
+            errorOut (np.ndarray, optional): array of shape (ny, nx) the current error is written to. Defaults to None.
+            workspace (ScanWorkspace, optional): buffers for the noise. Defaults to None.
+
+        Returns:
+            tuple: height of the tip in nm and difference of tunneling current and setpoint in A
+        """
+        heights = self.getScanBlock(startX, startY, nx, ny, direction, breadth, out=out, workspace=workspace)
+        if errorOut is None:
+            errorOut = np.empty((ny, nx))
+
+        # the tip moves to the left in left scans, so the loop runs backwards through the lines
+        timeOrder = np.s_[:, ::-1] if direction == 0 else np.s_[:, :]
+
+        # -ln(I) = 2 * DECAY * z - 2 * DECAY * h - ln(PREFACTOR * V), the controller outputs 2 * DECAY * z
+        bias = max(abs(self.biasVoltage), CONSTANT_CURRENT_MIN_BIAS)
+        offsets = heights[timeOrder] * (-2 * CONSTANT_CURRENT_DECAY * CONSTANT_CURRENT_HEIGHT_SCALE)
+        offsets -= math.log(CONSTANT_CURRENT_PREFACTOR * bias)
+        outputs, errors = self.getConstantCurrentPid().runLinearPlant(offsets, 1.0)
+
+        heights[timeOrder] = outputs / (2 * CONSTANT_CURRENT_DECAY)
+        # the error of the controller is ln(I / setpoint)
+        np.expm1(errors, out=errors)
+        errors *= self.getConstantCurrentSetpoint()
+        errorOut[timeOrder] = errors
+        return heights, errorOut
+
+
+class ScanWorkspace:
+    """This class holds preallocated buffers which are reused for every block of a scan,
+    so that adding noise and clipping are done in place without temporary arrays
+    """
+    def __init__(self, nx: int, ny: int = 1):
+        self.noise = np.empty((ny, nx))
+
+    def getNoiseBuffer(self, shape: tuple) -> np.ndarray:
+        """Returns a noise buffer of the given shape, it is only reallocated if a larger block is requested
+
+        Args:
+            shape (tuple): shape of the block (ny, nx)
+
+        Returns:
+            np.ndarray: buffer for the noise of the block
+        """
+        ny, nx = shape
+        if ny > self.noise.shape[0] or nx != self.noise.shape[1]:
+            self.noise = np.empty((max(ny, self.noise.shape[0]), nx))
+        return self.noise[:ny]
+
+
+class ScanSession:
+    """This class represents a running scan.
+    Each call to nextLines only generates the requested lines and writes them into a preallocated image buffer,
+    so the cost of a call does not depend on how far the scan has progressed.
+    """
+    def __init__(self, engine: SimulatorEngine, params: ScanParameters, scanId: int = 0):
+        self.engine = engine
+        self.params = params
+        self.scanId = scanId
+        self.startX = params.startX
+        self.startY = params.startY
+        self.lengthX = lengthX = params.lengthX
+        self.lengthY = lengthY = params.lengthY
+        self.direction = params.direction
+        self.breadth = params.breadth
+
+        # in constant current mode the image is the topography and currentError holds the second channel
+        self.constantCurrent = engine.constantCurrentMode if params.constantCurrent is None else params.constantCurrent
+        self.image = np.zeros(shape=(lengthY, lengthX))
+        self.currentError = np.zeros(shape=(lengthY, lengthX)) if self.constantCurrent else None
+        self.workspace = ScanWorkspace(lengthX)
+        self.currentLineIdx = 0
+
+    def isFinished(self) -> bool:
+        return self.currentLineIdx >= self.lengthY
+
+    def nextLines(self, count: int = 1) -> range:
+        """Generates the next lines of the scan and writes them into the image buffer
+
+        Args:
+            count (int, optional): number of lines to generate. Defaults to 1.
+
+        Returns:
+            range: indices of the lines which were generated
+        """
+        firstIdx = self.currentLineIdx
+        lastIdx = min(firstIdx + count, self.lengthY)
+
+        # lines scanned without tunnel current stay black
+        if lastIdx > firstIdx and self.engine.getTunnelCurrent() >= self.engine.lowerCurrentBound:
+            if self.constantCurrent:
+                self.engine.getConstantCurrentBlock(
+                    self.startX, self.startY+firstIdx, self.lengthX, lastIdx-firstIdx, self.direction, self.breadth,
+                    out=self.image[firstIdx:lastIdx], errorOut=self.currentError[firstIdx:lastIdx], workspace=self.workspace)
+            else:
+                self.engine.getScanBlock(
+                    self.startX, self.startY+firstIdx, self.lengthX, lastIdx-firstIdx, self.direction, self.breadth,
+                    out=self.image[firstIdx:lastIdx], workspace=self.workspace)
+
+        self.currentLineIdx = lastIdx
+        return range(firstIdx, lastIdx)
+
+    def getCurrentErrorRms(self) -> float:
+        """
+        Returns:
+            float: root mean square of the current error of the generated lines in A, None outside of the constant current mode
+        """
+        if self.currentError is None or self.currentLineIdx == 0:
+            return None
+        return float(np.sqrt(np.mean(np.square(self.currentError[:self.currentLineIdx]))))
+
+    def nextLine(self) -> int:
+        """Generates the next line of the scan
+
+        Returns:
+            int: index of the generated line or -1 if the scan is already finished
+        """
+        lines = self.nextLines(1)
+        return lines.start if len(lines) else -1
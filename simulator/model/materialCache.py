@@ -0,0 +1,226 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import PIL.Image
+import numpy as np
+
+PATH_TO_MATERIAL_CACHE = Path.home() / ".cache" / "500-rtm" / "materials"
+
+# increase whenever the decoding of the images or their levels change so that old cache files and shared materials are not used anymore
+MATERIAL_CACHE_VERSION = 3
+
+MATERIAL_CACHE_BYTE_BUDGET = 512 * 1024**2
+MATERIAL_PREFETCH_WORKERS = 2
+
+
+class MaterialCache:
+    """This class caches decoded material images as raw .npy files on disk.
+    Cached images are opened memory mapped, so loading a material does not decode the image again
+    and does not allocate the full image on the heap.
+
+    Images are stored in scan major layout (see decode), so that reading a scan line is a contiguous memory read.
+    """
+    def __init__(self, cacheDir=PATH_TO_MATERIAL_CACHE):
+        self.cacheDir = Path(cacheDir)
+
+    def getCacheKey(self, path) -> str:
+        """Returns the key of an image.
+        The key contains the modification time and size of the image so that changed images are decoded again
+
+        Args:
+            path: path to the image file
+
+        Returns:
+            str: hex digest of the key
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        key = f"{MATERIAL_CACHE_VERSION}|{path}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def getCachePath(self, path) -> Path:
+        """Returns the path of the cache file for an image
+
+        Args:
+            path: path to the image file
+
+        Returns:
+            Path: path to the cache file
+        """
+        return self.cacheDir / f"{Path(path).stem}-{self.getCacheKey(path)}.npy"
+
+    def load(self, path) -> np.ndarray:
+        """Loads the decoded image from the cache, the image is decoded and cached if it is not cached yet
+
+        Args:
+            path: path to the image file
+
+        Returns:
+            np.ndarray: read only, memory mapped image data in scan major layout
+        """
+        cachePath = self.getCachePath(path)
+        if not cachePath.exists():
+            data = self.decode(path)
+            try:
+                self.store(cachePath, data)
+            except OSError as e:
+                # without a writable cache directory the decoded image is used directly
+                print(e)
+                return data
+        return np.load(cachePath, mmap_mode='r')
+
+    def store(self, cachePath: Path, data: np.ndarray):
+        """Writes the data to a temporary file first and then moves it into place,
+        so that other processes never open a partially written cache file
+
+        Args:
+            cachePath (Path): path to the cache file
+            data (np.ndarray): decoded image data
+        """
+        cachePath.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=cachePath.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmpFile:
+                np.save(tmpFile, data)
+            os.replace(tmpPath, cachePath)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+
+    def decode(self, path) -> np.ndarray:
+        """Decodes an image file to 8 bit grayscale data in scan major layout.
+        The simulator scans along the first axis of the image, so the image is stored transposed and contiguous
+        with one scan line per row.
+
+        Args:
+            path: path to the image file
+
+        Returns:
+            np.ndarray: image data indexed by [y, x]
+        """
+        with PIL.Image.open(path) as IMGFile:
+            # constrains data points in image to 0 and 255
+            rgb = IMGFile.point(lambda i: i*(1./256)).convert('L')
+            return np.ascontiguousarray(np.asarray(rgb).T)
+
+
+class MaterialLibrary:
+    """This class loads materials on a thread pool and keeps the most recently used ones in an LRU cache.
+    Requesting a material which is already being loaded waits for that load instead of starting a second one.
+    Pinned materials, e.g. the one which is scanned, are never evicted.
+    """
+    def __init__(self, loadFunction, byteBudget: int = MATERIAL_CACHE_BYTE_BUDGET, workers: int = MATERIAL_PREFETCH_WORKERS, releaseFunction=None):
+        """
+        Args:
+            loadFunction: function which loads the image data for a path
+            byteBudget (int, optional): maximum size of all cached materials. Defaults to MATERIAL_CACHE_BYTE_BUDGET.
+            workers (int, optional): number of loader threads. Defaults to MATERIAL_PREFETCH_WORKERS.
+            releaseFunction (optional): function called with the path and data of every material which is removed from the cache. Defaults to None.
+        """
+        self.loadFunction = loadFunction
+        self.releaseFunction = releaseFunction
+        self.byteBudget = byteBudget
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="materialLoader")
+        self.lock = threading.Lock()
+        self.cached = OrderedDict()
+        self.cachedBytes = 0
+        self.pending = {}
+        self.pinned = set()
+
+    def prefetch(self, paths):
+        """Starts loading all given materials in the background
+
+        Args:
+            paths: paths to the material images
+        """
+        for path in paths:
+            with self.lock:
+                if path not in self.cached:
+                    self.requestLoad(path)
+
+    def get(self, path, pin: bool = False) -> np.ndarray:
+        """Returns the material, blocks only if it is not cached yet
+
+        Args:
+            path: path to the material image
+            pin (bool, optional): keep the material in the cache until unpin is called. Defaults to False.
+
+        Returns:
+            np.ndarray: image data
+        """
+        with self.lock:
+            if pin:
+                # pinned before the load, so the material can not be evicted before it is returned
+                self.pinned.add(path)
+            if path in self.cached:
+                self.cached.move_to_end(path)
+                return self.cached[path]
+            future = self.requestLoad(path)
+        return future.result()
+
+    def unpin(self, path):
+        """Allows a pinned material to be evicted again, it is evicted at once if the cache exceeds the byte budget
+        """
+        with self.lock:
+            self.pinned.discard(path)
+            self.evict()
+
+    def isCached(self, path) -> bool:
+        with self.lock:
+            return path in self.cached
+
+    def requestLoad(self, path):
+        """Returns the future of a running load or starts a new one, must be called with the lock held
+        """
+        future = self.pending.get(path)
+        if future is None:
+            future = self.executor.submit(self.load, path)
+            self.pending[path] = future
+        return future
+
+    def load(self, path) -> np.ndarray:
+        try:
+            data = self.loadFunction(path)
+        except BaseException:
+            with self.lock:
+                self.pending.pop(path, None)
+            raise
+
+        with self.lock:
+            self.pending.pop(path, None)
+            if path not in self.cached:
+                self.cached[path] = data
+                self.cachedBytes += data.nbytes
+                self.evict()
+        return data
+
+    def evict(self):
+        """Removes the least recently used materials until the cache fits the byte budget again,
+        the most recently used material and pinned materials are always kept
+        """
+        for path in list(self.cached)[:-1]:
+            if self.cachedBytes <= self.byteBudget:
+                break
+            if path in self.pinned:
+                continue
+            data = self.cached.pop(path)
+            self.cachedBytes -= data.nbytes
+            if self.releaseFunction is not None:
+                self.releaseFunction(path, data)
+
+    def shutdown(self):
+        """Stops the loader threads and removes all materials from the cache
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            self.pinned.clear()
+            while self.cached:
+                path, data = self.cached.popitem(last=False)
+                self.cachedBytes -= data.nbytes
+                if self.releaseFunction is not None:
+                    self.releaseFunction(path, data)
@@ -0,0 +1,316 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+# shape of the precomputed noise tile, blocks are copied from random positions of the tile
+NOISE_TILE_SHAPE = (256, 4096)
+
+TELEGRAPH_SWITCH_PROBABILITY = 0.01
+
+
+class NoiseModel:
+    """Base class of all noise models.
+    generate writes noise with unit amplitude into a buffer, scale then applies the amplitude in grey levels in place.
+    Blocks are always two dimensional with one scan line per row.
+    """
+    # the noise is proportional to the amplitude, so scale is a multiplication
+    isLinear = True
+
+    def __init__(self, weight: float = 1.0):
+        self.weight = weight
+
+    def isSilent(self, amplitude: float) -> bool:
+        return amplitude * self.weight == 0
+
+    def generate(self, rng: np.random.Generator, out: np.ndarray):
+        raise NotImplementedError
+
+    def scale(self, out: np.ndarray, amplitude: float):
+        out *= amplitude * self.weight
+
+    def reset(self):
+        """Resets the internal state of the model, used when the noise is seeded again
+        """
+        pass
+
+
+class UniformNoise(NoiseModel):
+    """Uniformly distributed integers from 0 to ceil(amplitude) - 1, this is the original noise of the simulator
+    """
+    isLinear = False
+
+    def isSilent(self, amplitude: float) -> bool:
+        # random integers below 1 are all 0
+        return math.ceil(amplitude * self.weight) <= 1
+
+    def generate(self, rng: np.random.Generator, out: np.ndarray):
+        rng.random(out=out)
+
+    def scale(self, out: np.ndarray, amplitude: float):
+        out *= math.ceil(amplitude * self.weight)
+        np.floor(out, out=out)
+
+
+class GaussianNoise(NoiseModel):
+    """White gaussian noise, the amplitude is the standard deviation
+    """
+    def generate(self, rng: np.random.Generator, out: np.ndarray):
+        rng.standard_normal(out=out)
+
+
+class PinkNoise(NoiseModel):
+    """1/f noise along the scan lines, white noise is shaped in the frequency domain of every line.
+    The amplitude is the expected standard deviation, so every line only depends on its own random numbers
+    and not on the other lines of the block.
+    """
+    def generate(self, rng: np.random.Generator, out: np.ndarray):
+        rng.standard_normal(out=out)
+        length = out.shape[-1]
+        spectrum = np.fft.rfft(out, axis=-1)
+        spectrum *= pinkFilter(length)
+        out[...] = np.fft.irfft(spectrum, n=length, axis=-1)
+
+
+@lru_cache(maxsize=16)
+def pinkFilter(length: int) -> np.ndarray:
+    """Filter which shapes white noise of unit variance into 1/f noise of unit variance
+
+    Args:
+        length (int): number of samples per line
+
+    Returns:
+        np.ndarray: factors of the rfft frequencies
+    """
+    frequencies = np.arange(length // 2 + 1, dtype=float)
+    frequencies[0] = 1
+    shape = 1 / np.sqrt(frequencies)
+    shape[0] = 0
+    # the variance of the filtered noise is the mean power of the filter over the full spectrum,
+    # every rfft frequency except 0 and the nyquist frequency of even lengths appears twice in it
+    multiplicity = np.full(len(shape), 2.0)
+    multiplicity[0] = 1
+    if length % 2 == 0:
+        multiplicity[-1] = 1
+    variance = np.sum(multiplicity * shape ** 2) / length
+    if variance > 0:
+        shape /= np.sqrt(variance)
+    return shape
+
+
+class TelegraphNoise(NoiseModel):
+    """Random telegraph noise, the signal jumps between -amplitude/2 and +amplitude/2.
+    Jumps happen with switchProbability per point in scan order and the state is kept from one block to the next.
+    """
+    def __init__(self, weight: float = 1.0, switchProbability: float = TELEGRAPH_SWITCH_PROBABILITY):
+        super().__init__(weight)
+        self.switchProbability = switchProbability
+        self.state = 0
+
+    def generate(self, rng: np.random.Generator, out: np.ndarray):
+        switches = rng.random(out.size) < self.switchProbability
+        states = np.cumsum(switches)
+        states += self.state
+        states %= 2
+        self.state = int(states[-1]) if len(states) else self.state
+        out[...] = states.reshape(out.shape)
+        out -= 0.5
+
+    def reset(self):
+        self.state = 0
+
+
+class LineOffsetNoise(NoiseModel):
+    """Gaussian offset which is constant along every scan line, the amplitude is the standard deviation
+    """
+    def generate(self, rng: np.random.Generator, out: np.ndarray):
+        out[...] = rng.standard_normal(out.shape[0])[:, np.newaxis]
+
+
+class CompositeNoise(NoiseModel):
+    """Sum of several noise models. The models are treated as linear in the amplitude,
+    so UniformNoise loses its rounding to integers when it is part of a composite.
+    Every model draws from its own generator, which is seeded from the generator of the engine at the first block,
+    so the noise of a line does not depend on how the lines are split into blocks.
+    """
+    def __init__(self, models: list, weight: float = 1.0):
+        super().__init__(weight)
+        self.models = models
+        self.generators = None
+
+    def generate(self, rng: np.random.Generator, out: np.ndarray):
+        if self.generators is None:
+            self.generators = [np.random.default_rng(seed) for seed in rng.integers(1 << 63, size=len(self.models))]
+        out[...] = 0
+        buffer = np.empty_like(out)
+        for model, generator in zip(self.models, self.generators):
+            model.generate(generator, buffer)
+            model.scale(buffer, 1.0)
+            out += buffer
+
+    def reset(self):
+        self.generators = None
+        for model in self.models:
+            model.reset()
+
+
+class NoiseEngine:
+    """This class generates noise for whole blocks or scans in one vectorized call.
+    It uses its own seedable numpy Generator, so runs with the same seed produce the same noise.
+
+    With useTiles the noise model fills a large tile once and the noise of every block is taken from a random
+    position of the tile, which is cheaper than generating new noise. For a constant amplitude the scaled tile
+    is kept and added to the data directly. The tile repeats eventually and models with a state
+    (TelegraphNoise) lose their continuity between blocks.
+    """
+    tile = None
+    scaledTile = None
+    scaledTileFactor = 1.0
+
+    def __init__(self, model: NoiseModel = None, seed=None, useTiles: bool = False, tileShape: tuple = NOISE_TILE_SHAPE):
+        self.model = model if model is not None else UniformNoise()
+        self.useTiles = useTiles
+        self.tileShape = tileShape
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """Restarts the random number generator
+
+        Args:
+            seed (optional): seed of the generator, None for a random seed. Defaults to None.
+        """
+        self.rng = np.random.default_rng(seed)
+        self.model.reset()
+        self.tile = None
+
+    def setModel(self, model: NoiseModel):
+        self.model = model
+        self.tile = None
+
+    def setUseTiles(self, useTiles: bool):
+        self.useTiles = useTiles
+        self.tile = None
+
+    def generate(self, shape: tuple, amplitude: float, out: np.ndarray = None) -> np.ndarray:
+        """Generates noise for a whole block
+
+        Args:
+            shape (tuple): shape of the block, (nx,) or (ny, nx)
+            amplitude (float): amplitude of the noise in grey levels
+            out (np.ndarray, optional): buffer the noise is written to. Defaults to None.
+
+        Returns:
+            np.ndarray: the noise
+        """
+        if out is None:
+            out = np.empty(shape)
+        if self.model.isSilent(amplitude):
+            out[...] = 0
+            return out
+
+        block = out.reshape(1, -1) if out.ndim == 1 else out
+        if not self.useTiles:
+            self.model.generate(self.rng, block)
+            self.model.scale(out, amplitude)
+        elif self.model.isLinear:
+            self.copyFromTile(block, amplitude * self.model.weight)
+        else:
+            self.copyFromTile(block)
+            self.model.scale(out, amplitude)
+        return out
+
+    def addNoise(self, Y: np.ndarray, amplitude: float, out: np.ndarray = None, noiseBuffer: np.ndarray = None) -> np.ndarray:
+        """Adds noise to the data
+
+        Args:
+            Y (np.ndarray): data
+            amplitude (float): amplitude of the noise in grey levels
+            out (np.ndarray, optional): array the result is written to. Defaults to None.
+            noiseBuffer (np.ndarray, optional): buffer for the noise, allocated if not given. Defaults to None.
+
+        Returns:
+            np.ndarray: data with noise
+        """
+        if self.model.isSilent(amplitude):
+            if out is not None and out is not Y:
+                out[...] = Y
+                return out
+            return Y
+        if self.useTiles and self.model.isLinear:
+            return self.addFromTile(Y, amplitude * self.model.weight, out=out)
+        noise = self.generate(np.shape(Y), amplitude, out=noiseBuffer)
+        return np.add(Y, noise, out=out)
+
+    def getTile(self, factor: float = 1.0) -> np.ndarray:
+        """Returns the precomputed noise tile multiplied with factor.
+        The last scaled tile is kept, so blocks with the same amplitude are added straight from it.
+
+        Args:
+            factor (float, optional): factor the unit noise is multiplied with. Defaults to 1.0.
+
+        Returns:
+            np.ndarray: the noise tile
+        """
+        if self.tile is None:
+            self.tile = np.empty(self.tileShape)
+            self.model.generate(self.rng, self.tile)
+            self.scaledTile, self.scaledTileFactor = self.tile, 1.0
+        if factor != self.scaledTileFactor:
+            self.scaledTile = self.tile * factor
+            self.scaledTileFactor = factor
+        return self.scaledTile
+
+    def tileSlices(self, shape: tuple):
+        """Yields pairs of block and tile slices which cover a block, starting at a random position of the tile
+        and continuing at the start of the tile at its borders
+
+        Args:
+            shape (tuple): shape of the block (ny, nx)
+        """
+        tileRows, tileCols = self.tileShape
+        ny, nx = shape
+        row, col = int(self.rng.integers(tileRows)), int(self.rng.integers(tileCols))
+
+        outRow = 0
+        while outRow < ny:
+            rows = min(ny - outRow, tileRows - row)
+            outCol, tileCol = 0, col
+            while outCol < nx:
+                cols = min(nx - outCol, tileCols - tileCol)
+                yield ((slice(outRow, outRow + rows), slice(outCol, outCol + cols)),
+                       (slice(row, row + rows), slice(tileCol, tileCol + cols)))
+                outCol += cols
+                tileCol = 0
+            outRow += rows
+            row = 0
+
+    def copyFromTile(self, out: np.ndarray, factor: float = 1.0):
+        """Copies noise from a random position of the precomputed tile
+
+        Args:
+            out (np.ndarray): two dimensional buffer
+            factor (float, optional): factor the unit noise is multiplied with. Defaults to 1.0.
+        """
+        tile = self.getTile(factor)
+        for outSlice, tileSlice in self.tileSlices(out.shape):
+            out[outSlice] = tile[tileSlice]
+
+    def addFromTile(self, Y: np.ndarray, factor: float, out: np.ndarray = None) -> np.ndarray:
+        """Adds noise from a random position of the precomputed tile without an intermediate noise buffer
+
+        Args:
+            Y (np.ndarray): data
+            factor (float): factor the unit noise is multiplied with
+            out (np.ndarray, optional): array the result is written to. Defaults to None.
+
+        Returns:
+            np.ndarray: data with noise
+        """
+        if out is None:
+            out = np.empty(np.shape(Y))
+        tile = self.getTile(factor)
+        Y2d = Y.reshape(1, -1) if Y.ndim == 1 else Y
+        out2d = out.reshape(1, -1) if out.ndim == 1 else out
+        for outSlice, tileSlice in self.tileSlices(out2d.shape):
+            np.add(Y2d[outSlice], tile[tileSlice], out=out2d[outSlice])
+        return out
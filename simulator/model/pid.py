@@ -0,0 +1,191 @@
+from functools import lru_cache
+
+import numpy as np
+
+PID_TIME_STEP = 0.1
+
+
+class BatchPID:
+    """Discrete PID controller with a fixed time step.
+
+    Calling the controller advances it by exactly one time step, independent of the wall clock.
+    run feeds a whole array of measurements through the controller in one vectorized pass and
+    runLinearPlant simulates the closed feedback loop of the controller and a linear plant for whole lines at once.
+
+    The controller follows the conventions of simple_pid: the error is setpoint - input, the integral term
+    is limited to the output limits and the derivative term acts on the input.
+    """
+    integral: float = 0
+    lastInput = None
+    lastOutput = None
+
+    def __init__(self, kp: float = 1.0, ki: float = 0.0, kd: float = 0.0, setpoint: float = 0, sampleTime: float = PID_TIME_STEP, outputLimits: tuple = (None, None)):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.setpoint = setpoint
+        self.sampleTime = sampleTime
+        self.outputLimits = outputLimits
+
+    def __call__(self, input: float) -> float:
+        """Advances the controller by one time step
+
+        Args:
+            input (float): current measurement
+
+        Returns:
+            float: controller output
+        """
+        error = self.setpoint - input
+        dInput = input - self.lastInput if self.lastInput is not None else 0
+
+        self.integral = self.clamp(self.integral + self.ki * error * self.sampleTime)
+        output = self.clamp(self.kp * error + self.integral - self.kd * dInput / self.sampleTime)
+
+        self.lastInput = input
+        self.lastOutput = output
+        return output
+
+    def clamp(self, value: float) -> float:
+        lower, upper = self.outputLimits
+        if lower is not None:
+            value = max(value, lower)
+        if upper is not None:
+            value = min(value, upper)
+        return value
+
+    def reset(self):
+        self.integral = 0
+        self.lastInput = None
+        self.lastOutput = None
+
+    def run(self, inputs: np.ndarray) -> np.ndarray:
+        """Feeds a series of measurements through the controller, one time step per measurement.
+        The result is the same as calling the controller for every measurement and the state is updated accordingly.
+
+        Args:
+            inputs (np.ndarray): one dimensional array of measurements
+
+        Returns:
+            np.ndarray: controller outputs
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        if len(inputs) == 0:
+            return np.empty(0)
+
+        lower, upper = self.outputLimits
+        if lower is not None or upper is not None:
+            # a limited integral depends on every previous step, so it can not be accumulated in one pass
+            return np.array([self(input) for input in inputs])
+
+        errors = self.setpoint - inputs
+        integral = np.cumsum(errors)
+        integral *= self.ki * self.sampleTime
+        integral += self.integral
+        dInputs = np.diff(inputs, prepend=inputs[0] if self.lastInput is None else self.lastInput)
+
+        outputs = self.kp * errors + integral - self.kd * dInputs / self.sampleTime
+
+        self.integral = integral[-1]
+        self.lastInput = inputs[-1]
+        self.lastOutput = outputs[-1]
+        return outputs
+
+    def runLinearPlant(self, offsets: np.ndarray, gain: float, setpoint: float = None) -> tuple:
+        """Simulates the closed loop of the controller and a linear plant whose measurement at step k is
+        gain * output[k-1] + offsets[k]. Every row of offsets is an independent run (e.g. a scan line) which starts
+        settled on its first offset, so the result does not depend on how the rows are split into blocks.
+
+        The loop is a linear recursion, so it is solved as a convolution with the impulse response of the loop
+        in the frequency domain instead of stepping through the samples. If the outputs leave the output limits,
+        e.g. with unstable gains, the loop is stepped through the samples with the limits applied instead.
+
+        Args:
+            offsets (np.ndarray): disturbance of the measurement, the last axis is the time
+            gain (float): gain of the plant
+            setpoint (float, optional): setpoint of the loop, the setpoint of the controller if None. Defaults to None.
+
+        Returns:
+            tuple: controller outputs and errors, both with the shape of offsets
+        """
+        offsets = np.asarray(offsets, dtype=float)
+        if setpoint is None:
+            setpoint = self.setpoint
+        length = offsets.shape[-1]
+        if length == 0:
+            return np.empty(offsets.shape), np.empty(offsets.shape)
+
+        # the loop starts settled: the output makes the error of the first sample zero
+        reference = setpoint - offsets
+        settledOutput = reference[..., :1] / gain
+        deviation = reference - reference[..., :1]
+
+        # velocity form of the controller: output[k] - output[k-1] = c0 * e[k] + c1 * e[k-1] + c2 * e[k-2]
+        c0 = self.kp + self.ki * self.sampleTime + self.kd / self.sampleTime
+        c1 = -(self.kp + 2 * self.kd / self.sampleTime)
+        c2 = self.kd / self.sampleTime
+
+        forcing = c0 * deviation
+        forcing[..., 1:] += c1 * deviation[..., :-1]
+        forcing[..., 2:] += c2 * deviation[..., :-2]
+
+        response = impulseResponse((1 - gain * c0, -gain * c1, -gain * c2), length)
+        fftLength = 1 << (2 * length - 1).bit_length()
+        with np.errstate(over="ignore", invalid="ignore"):
+            # the response of unstable gains overflows, the loop is then stepped with the output limits below
+            outputDeviation = np.fft.irfft(np.fft.rfft(forcing, fftLength) * np.fft.rfft(response, fftLength), fftLength)[..., :length]
+
+        outputs = outputDeviation + settledOutput
+        lower, upper = self.outputLimits
+        if not (np.isfinite(outputs).all() and (lower is None or outputs.min() >= lower) and (upper is None or outputs.max() <= upper)):
+            outputDeviation = self.stepLinearPlant(deviation, gain, (c0, c1, c2), settledOutput)
+            outputs = outputDeviation + settledOutput
+        errors = deviation.copy()
+        errors[..., 1:] -= gain * outputDeviation[..., :-1]
+        return outputs, errors
+
+    def stepLinearPlant(self, deviation: np.ndarray, gain: float, coefficients: tuple, settledOutput: np.ndarray) -> np.ndarray:
+        """Steps the loop of runLinearPlant through the samples and limits every output to the output limits.
+        The controller is in velocity form, so the limited output is also the state and the integral can not wind up.
+        All rows are stepped at once
+
+        Returns:
+            np.ndarray: deviation of the outputs from the settled output
+        """
+        c0, c1, c2 = coefficients
+        lower, upper = self.outputLimits
+        lower = -np.inf if lower is None else lower - settledOutput[..., 0]
+        upper = np.inf if upper is None else upper - settledOutput[..., 0]
+
+        outputDeviation = np.empty(deviation.shape)
+        lastOutput = np.zeros(deviation.shape[:-1])
+        lastErrors = (np.zeros(deviation.shape[:-1]), np.zeros(deviation.shape[:-1]))
+        for k in range(deviation.shape[-1]):
+            error = deviation[..., k] - gain * lastOutput
+            lastOutput = np.clip(lastOutput + c0 * error + c1 * lastErrors[0] + c2 * lastErrors[1], lower, upper)
+            outputDeviation[..., k] = lastOutput
+            lastErrors = (error, lastErrors[0])
+        return outputDeviation
+
+
+@lru_cache(maxsize=16)
+def impulseResponse(coefficients: tuple, length: int) -> np.ndarray:
+    """Impulse response of the recursion y[k] = x[k] + a1 * y[k-1] + a2 * y[k-2] + a3 * y[k-3].
+    It only depends on the controller gains, so it is computed once per parameter set.
+
+    Args:
+        coefficients (tuple): a1, a2, a3
+        length (int): number of samples
+
+    Returns:
+        np.ndarray: impulse response
+    """
+    a1, a2, a3 = coefficients
+    response = np.zeros(length + 3)
+    response[3] = 1
+    with np.errstate(over="ignore", invalid="ignore"):
+        for k in range(4, length + 3):
+            response[k] = a1 * response[k - 1] + a2 * response[k - 2] + a3 * response[k - 3]
+    response = response[3:]
+    response.flags.writeable = False
+    return response
@@ -0,0 +1,97 @@
+import numpy as np
+
+# the coarsest level averages 2**PYRAMID_MAX_LEVEL pixels
+PYRAMID_MAX_LEVEL = 5
+
+
+class MaterialPyramid:
+    """This class holds a material image and area averaged versions of it with 2x, 4x, 8x, ... fewer pixels.
+
+    All levels are stored in scan major layout, indexed by [y, x] with every scan line contiguous in memory.
+    The levels are only averaged along the fast scan axis x, because the tip breadth only determines the distance
+    of the points within a line while consecutive lines are always one pixel apart.
+    Level k at [y, j] holds the rounded mean of the pixels j * 2**k to (j + 1) * 2**k - 1 of line y of the full image.
+    """
+    def __init__(self, image: np.ndarray, maxLevel: int = PYRAMID_MAX_LEVEL):
+        self.levels = [image]
+
+        # every level is rounded from the exact sums of the full image, rounding the previous level would add up the errors
+        sums = image
+        while len(self.levels) <= maxLevel and sums.shape[1] > 1:
+            sums = self.sumPairs(sums)
+            self.levels.append(self.quantize(sums, len(self.levels)))
+
+    @classmethod
+    def fromLevels(cls, levels: list) -> "MaterialPyramid":
+        """Creates a pyramid from levels which were already built, e.g. by another process
+
+        Args:
+            levels (list): levels in scan major layout, starting with the full image
+
+        Returns:
+            MaterialPyramid: the pyramid
+        """
+        pyramid = cls.__new__(cls)
+        pyramid.levels = list(levels)
+        return pyramid
+
+    @staticmethod
+    def sumPairs(sums: np.ndarray) -> np.ndarray:
+        """Adds pairs of pixels along the scan lines, an odd last pixel is added to itself
+
+        Args:
+            sums (np.ndarray): image data or sums of a previous call in scan major layout
+
+        Returns:
+            np.ndarray: uint32 sums with half the length in x
+        """
+        if sums.shape[1] % 2:
+            sums = np.concatenate((sums, sums[:, -1:]), axis=1)
+        summed = sums[:, 0::2].astype(np.uint32)
+        summed += sums[:, 1::2]
+        return summed
+
+    @staticmethod
+    def quantize(sums: np.ndarray, level: int) -> np.ndarray:
+        """Rounds sums of 2**level pixels to their mean, halves are rounded to even so that the levels are not brighter
+        than the image on average
+
+        Args:
+            sums (np.ndarray): sums from sumPairs
+            level (int): number of sumPairs calls the sums went through
+
+        Returns:
+            np.ndarray: uint8 image data
+        """
+        rounded = sums >> level
+        rounded &= 1
+        rounded += sums
+        rounded += (1 << (level - 1)) - 1
+        rounded >>= level
+        return rounded.astype(np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def getImage(self) -> np.ndarray:
+        """Returns the full resolution image indexed by [x, y] like the original image
+
+        Returns:
+            np.ndarray: transposed view of the first level
+        """
+        return self.levels[0].T
+
+    def getLevel(self, level: int) -> np.ndarray:
+        return self.levels[level]
+
+    def levelForStep(self, step: int) -> int:
+        """Returns the coarsest level whose pixels are not wider than the distance of the scanned points
+
+        Args:
+            step (int): distance of the scanned points in pixels of the full image
+
+        Returns:
+            int: index of the level
+        """
+        return min(max(int(step), 1).bit_length() - 1, len(self.levels) - 1)
@@ -0,0 +1,204 @@
+import math
+import threading
+
+from .clock import MonotonicClock
+from .engine import ScanSession
+
+LINE_INTERVAL = 0.5 # seconds between two scan lines
+MIN_TICK_INTERVAL = 0.02 # seconds, the lines which are due within this time are generated in one batch
+FAST_BATCH_TIME = 0.02 # seconds which one batch takes when scanning as fast as possible
+MAX_BATCH_LINES = 256
+
+
+class CancelToken:
+    """Cancels one scan session. The worker checks the token between two lines,
+    so a line is always generated completely and a cancelled session never delivers another line
+    """
+    def __init__(self):
+        self.isCancelled = False
+
+    def cancel(self):
+        self.isCancelled = True
+
+
+class LinePacer:
+    """Paces the lines of a scan at a fixed line time.
+
+    All lines which are due at a tick are generated in one batch, so short line times and a scan which fell behind
+    do not cost a tick per line. Two ticks are at least MIN_TICK_INTERVAL apart. A line time of 0 scans as fast as
+    possible, the batches are then sized from the measured time per line, so that one batch takes about FAST_BATCH_TIME.
+    """
+    def __init__(self, lineTime: float):
+        """
+        Args:
+            lineTime (float): seconds per line, 0 for as fast as possible
+        """
+        self.lineTime = max(lineTime, 0)
+        self.origin = 0
+        self.lastTick = -math.inf
+        self.linesDone = 0
+        self.secondsPerLine = 0
+
+    def restart(self, now: float):
+        """Continues the schedule at now, e.g. at the start or after a pause
+
+        Args:
+            now (float): the current time
+        """
+        self.origin = now - self.linesDone * self.lineTime
+        self.lastTick = -math.inf
+
+    @property
+    def nextTime(self) -> float:
+        """Time of the next tick
+        """
+        if self.lineTime == 0:
+            return -math.inf
+        return max(self.origin + self.linesDone * self.lineTime, self.lastTick + MIN_TICK_INTERVAL)
+
+    def linesDue(self, now: float) -> int:
+        """Starts a tick
+
+        Args:
+            now (float): the current time
+
+        Returns:
+            int: number of lines which should be generated in this tick
+        """
+        self.lastTick = now
+        if self.lineTime > 0:
+            count = (now - self.origin) / self.lineTime + 1 - self.linesDone
+        elif self.secondsPerLine > 0:
+            count = FAST_BATCH_TIME / self.secondsPerLine
+        else:
+            count = 1
+        return int(min(max(count, 1), MAX_BATCH_LINES))
+
+    def linesGenerated(self, count: int, seconds: float):
+        """Ends a tick
+
+        Args:
+            count (int): number of lines which were generated
+            seconds (float): time which they took
+        """
+        self.linesDone += count
+        if count:
+            self.secondsPerLine = seconds / count
+
+
+class ScanWorker:
+    """Long-lived worker which generates the lines of scan sessions on its own thread.
+
+    The thread is started once and waits for sessions, so starting a scan only hands over the session.
+    start, pause, resume and stop only change the state of the worker and wake it up, they never wait for a line to be generated.
+    The finished lines and the end of the session are reported through the callbacks, which are called on the worker thread.
+    """
+    def __init__(self, lineCallback, finishedCallback, lineInterval: float = LINE_INTERVAL, clock: MonotonicClock = None):
+        """
+        Args:
+            lineCallback: called with the session and the range of the new lines
+            finishedCallback: called with the session after its last line
+            lineInterval (float, optional): seconds between two scan lines of sessions without a line time. Defaults to LINE_INTERVAL.
+            clock (MonotonicClock, optional): clock which paces the lines, None for real time. Defaults to None.
+        """
+        self.lineCallback = lineCallback
+        self.finishedCallback = finishedCallback
+        self.lineInterval = lineInterval
+        self.clock = MonotonicClock() if clock is None else clock
+
+        self.condition = threading.Condition()
+        self.session = None
+        self.token = None
+        self.isPaused = False
+        self.isClosed = False
+        self.thread = threading.Thread(target=self.run, name="scanWorker", daemon=True)
+        self.thread.start()
+
+    def start(self, session: ScanSession) -> CancelToken:
+        """Starts generating a session, a running session is cancelled
+
+        Args:
+            session (ScanSession): the session
+
+        Returns:
+            CancelToken: token of the new session
+        """
+        with self.condition:
+            if self.token is not None:
+                self.token.cancel()
+            self.session = session
+            self.token = CancelToken()
+            self.isPaused = False
+            self.condition.notify()
+            return self.token
+
+    def pause(self):
+        with self.condition:
+            self.isPaused = True
+            self.condition.notify()
+
+    def resume(self):
+        with self.condition:
+            self.isPaused = False
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            if self.token is not None:
+                self.token.cancel()
+            self.session = None
+            self.condition.notify()
+
+    def close(self):
+        """Cancels the running session and ends the thread
+        """
+        with self.condition:
+            self.isClosed = True
+            if self.token is not None:
+                self.token.cancel()
+            self.condition.notify()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.session is None and not self.isClosed:
+                    self.condition.wait()
+                if self.isClosed:
+                    return
+                session, token = self.session, self.token
+
+            self.runSession(session, token)
+
+            with self.condition:
+                if self.session is session:
+                    self.session = None
+
+    def runSession(self, session: ScanSession, token: CancelToken):
+        lineTime = session.params.lineTime
+        pacer = LinePacer(self.lineInterval if lineTime is None else lineTime)
+        clock = self.clock
+        pacer.restart(clock.now())
+        while not session.isFinished():
+            with self.condition:
+                while not token.isCancelled:
+                    if self.isPaused:
+                        self.condition.wait()
+                        # the line time starts again after a pause
+                        pacer.restart(clock.now())
+                    elif clock.now() < pacer.nextTime:
+                        clock.wait(self.condition, pacer.nextTime - clock.now())
+                    else:
+                        break
+                if token.isCancelled:
+                    return
+
+            # the lines are generated without holding the lock, so commands never wait for them
+            start = clock.now()
+            rows = session.nextLines(pacer.linesDue(start))
+            if token.isCancelled:
+                return
+            pacer.linesGenerated(len(rows), clock.now() - start)
+            self.lineCallback(session, rows)
+
+        self.finishedCallback(session)
@@ -0,0 +1,243 @@
+import mmap
+import os
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory, util
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # the reference count is protected by file locks, without them the store is not available
+    fcntl = None
+
+from .materialCache import PATH_TO_MATERIAL_CACHE
+
+SHARED_MATERIAL_PREFIX = "rtm_"
+SHARED_MATERIAL_NAME_LENGTH = 24 # characters of the cache key used in the segment name, macOS allows 31 characters in total
+SHARED_MATERIAL_MAGIC = 0x52544D53 # "RTMS"
+SHARED_MATERIAL_HEADER_SLOTS = 64
+SHARED_MATERIAL_ALIGNMENT = 64
+
+# header slots, the shape and offset of every array follow after HEADER_ARRAYS
+HEADER_MAGIC = 0
+HEADER_READY = 1
+HEADER_REFCOUNT = 2
+HEADER_DTYPE = 3
+HEADER_ARRAY_COUNT = 4
+HEADER_ARRAYS = 5
+
+# from python 3.13 segments can be opened without registering them with the resource tracker
+TRACK_PARAMETER_SUPPORTED = sys.version_info >= (3, 13)
+
+
+def openSegment(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Opens a shared memory segment which is not owned by the resource tracker of this process,
+    otherwise the tracker would remove the segment when this process exits even though other processes still use it
+    """
+    if TRACK_PARAMETER_SUPPORTED:
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+    segment = shared_memory.SharedMemory(name, create=create, size=size)
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def unlinkSegment(segment: shared_memory.SharedMemory):
+    if not TRACK_PARAMETER_SUPPORTED:
+        # unlink unregisters the segment from the resource tracker again, so it has to be registered first
+        resource_tracker.register(segment._name, "shared_memory")
+    segment.unlink()
+
+
+class SharedMaterialStore:
+    """This class publishes decoded materials in shared memory so that all simulator processes on a machine
+    use the same copy. The first process which acquires a material builds it and publishes it, every other process
+    attaches zero copy, read only numpy views to it by name.
+
+    Each segment holds a header with a reference count of the attached processes, it is removed when the last
+    process releases it. Creating, attaching and releasing are serialized by a lock file per segment.
+    A released segment stays mapped in a process until the last of its arrays is deleted.
+    Segments of processes which are killed without releasing them stay until the machine is restarted.
+    """
+    def __init__(self, lockDir=PATH_TO_MATERIAL_CACHE):
+        self.lockDir = Path(lockDir)
+        self.lock = threading.Lock()
+        # segments attached by this process: name -> [segment, arrays, number of acquires]
+        self.attached = {}
+        # materials are built under a lock per segment, so different materials are built at the same time
+        self.segmentLocks = {}
+        # unlike atexit handlers, finalizers also run when worker processes of multiprocessing exit
+        util.Finalize(self, self.releaseAll, exitpriority=10)
+
+    @staticmethod
+    def isSupported() -> bool:
+        return fcntl is not None
+
+    def getSegmentName(self, key: str) -> str:
+        return f"{SHARED_MATERIAL_PREFIX}{key[:SHARED_MATERIAL_NAME_LENGTH]}"
+
+    def acquire(self, key: str, buildFunction) -> list:
+        """Returns the arrays of a material, they are built with buildFunction and published if no process has done so yet
+
+        Args:
+            key (str): key of the material, e.g. from MaterialCache.getCacheKey
+            buildFunction: function without arguments which returns a list of arrays with the same dtype
+
+        Returns:
+            list: read only arrays in shared memory
+        """
+        name = self.getSegmentName(key)
+        with self.lock:
+            arrays = self.reuse(name)
+            if arrays is not None:
+                return arrays
+            segmentLock = self.segmentLocks.setdefault(name, threading.Lock())
+
+        with segmentLock:
+            with self.lock:
+                # another thread may have attached the segment while this one waited
+                arrays = self.reuse(name)
+                if arrays is not None:
+                    return arrays
+
+            with self.fileLock(name):
+                try:
+                    segment = openSegment(name)
+                except FileNotFoundError:
+                    segment = None
+                if segment is not None and self.getHeader(segment)[HEADER_READY] != 1:
+                    # left over by a process which failed while publishing
+                    unlinkSegment(segment)
+                    segment.close()
+                    segment = None
+
+                if segment is None:
+                    segment = self.publish(name, buildFunction())
+                header = self.getHeader(segment)
+                header[HEADER_REFCOUNT] += 1
+                del header
+
+            arrays = self.getArrays(segment)
+            with self.lock:
+                self.attached[name] = [segment, arrays, 1]
+            return arrays
+
+    def reuse(self, name: str) -> list:
+        """Returns the arrays of a segment which is already attached by this process, must be called with the lock held
+
+        Returns:
+            list: the arrays or None if the segment is not attached
+        """
+        entry = self.attached.get(name)
+        if entry is None:
+            return None
+        entry[2] += 1
+        return entry[1]
+
+    def release(self, key: str):
+        """Releases a material acquired by this process, the segment is removed when no process uses it anymore.
+        Arrays which are still referenced stay valid until they are deleted.
+
+        Args:
+            key (str): key the material was acquired with
+        """
+        name = self.getSegmentName(key)
+        with self.lock:
+            entry = self.attached.get(name)
+            if entry is None:
+                return
+            entry[2] -= 1
+            if entry[2] > 0:
+                return
+            del self.attached[name]
+            self.detach(name, entry[0])
+
+    def releaseAll(self):
+        with self.lock:
+            for name, entry in list(self.attached.items()):
+                del self.attached[name]
+                self.detach(name, entry[0])
+
+    def detach(self, name: str, segment: shared_memory.SharedMemory):
+        with self.fileLock(name):
+            header = self.getHeader(segment)
+            header[HEADER_REFCOUNT] -= 1
+            isLastUser = header[HEADER_REFCOUNT] <= 0
+            del header
+            if isLastUser:
+                # the name is removed at once, the memory stays valid for processes which still have it mapped
+                unlinkSegment(segment)
+        # the arrays have their own mapping of the segment (see getArrays), so they stay valid after closing it
+        segment.close()
+
+    def publish(self, name: str, arrays: list) -> shared_memory.SharedMemory:
+        """Creates a segment for the arrays and copies them into it, must be called with the file lock held
+
+        Args:
+            name (str): name of the segment
+            arrays (list): arrays with the same dtype
+
+        Returns:
+            shared_memory.SharedMemory: the new segment
+        """
+        dtype = arrays[0].dtype
+        offsets = []
+        size = SHARED_MATERIAL_HEADER_SLOTS * 8
+        for array in arrays:
+            size = -(-size // SHARED_MATERIAL_ALIGNMENT) * SHARED_MATERIAL_ALIGNMENT
+            offsets.append(size)
+            size += array.nbytes
+
+        segment = openSegment(name, create=True, size=size)
+        header = self.getHeader(segment)
+        header[HEADER_MAGIC] = SHARED_MATERIAL_MAGIC
+        header[HEADER_DTYPE] = ord(dtype.char)
+        header[HEADER_ARRAY_COUNT] = len(arrays)
+        for idx, (array, offset) in enumerate(zip(arrays, offsets)):
+            rows, cols = array.shape
+            header[HEADER_ARRAYS + 3*idx : HEADER_ARRAYS + 3*idx + 3] = (rows, cols, offset)
+            np.ndarray(array.shape, dtype=dtype, buffer=segment.buf, offset=offset)[...] = array
+        header[HEADER_READY] = 1
+        return segment
+
+    def getHeader(self, segment: shared_memory.SharedMemory) -> np.ndarray:
+        return np.ndarray(SHARED_MATERIAL_HEADER_SLOTS, dtype=np.int64, buffer=segment.buf)
+
+    def getArrays(self, segment: shared_memory.SharedMemory) -> list:
+        """Returns read only views of the arrays in a segment. The views use a mapping of their own which is only unmapped
+        when the last of them is deleted. Views of segment.buf would be unmapped under them by segment.close,
+        numpy keeps the mapping object alive but does not prevent closing it
+        """
+        mapping = mmap.mmap(segment._fd, segment.size, access=mmap.ACCESS_READ)
+        header = self.getHeader(segment)
+        if header[HEADER_MAGIC] != SHARED_MATERIAL_MAGIC:
+            raise ValueError(f"{segment.name} is not a shared material")
+        dtype = np.dtype(chr(header[HEADER_DTYPE]))
+        arrays = []
+        for idx in range(header[HEADER_ARRAY_COUNT]):
+            rows, cols, offset = header[HEADER_ARRAYS + 3*idx : HEADER_ARRAYS + 3*idx + 3]
+            array = np.ndarray((rows, cols), dtype=dtype, buffer=mapping, offset=offset)
+            arrays.append(array)
+        return arrays
+
+    def fileLock(self, name: str):
+        return SegmentLock(self.lockDir / f"{name}.lock")
+
+
+class SegmentLock:
+    """Exclusive lock on a file which serializes the access of all processes to a segment, used as context manager
+    """
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
@@ -0,0 +1,220 @@
+"""Runs the simulator as a server process which the GUI connects to like to a real microscope.
+
+The server listens on a local TCP or Unix domain socket and serves one client at a time with the frames of
+microscope.protocol: it receives JSON commands and streams tunnel current samples and scan lines.
+
+Example:
+    python -m simulator.server --address 127.0.0.1:5500
+    python -m simulator.server --address unix:/tmp/rtm.sock
+"""
+import argparse
+import os
+import select
+import signal
+import socket
+import socketserver
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from microscope.protocol import (DEFAULT_SERVER_ADDRESS, FRAME_COMMAND, FRAME_EVENT, FrameReader, ProtocolError, decodeJson,
+                                 encodeCurrent, encodeJson, encodeScanLine, parseAddress)
+from microscope.simulatorMicroscope import LOG_CURRENT_ERROR_MSG
+from simulator.model.clock import ScaledClock
+from simulator.model.engine import NANO, PATH_TO_IMAGES, ScanParameters, SimulatorEngine
+from simulator.model.materialCache import PATH_TO_MATERIAL_CACHE
+from simulator.model.scanWorker import LinePacer
+
+SERVER_LOWER_CURRENT_BOUND = 1e-9
+SERVER_UPPER_CURRENT_BOUND = 1e-7
+SERVER_INITIAL_SCREWS = (100, 100, 100)
+
+CURRENT_INTERVAL = 0.05 # seconds between two tunnel current samples
+LINE_INTERVAL = 0.5 # seconds between two scan lines
+RECEIVE_BUFFER_SIZE = 65536
+
+
+class SimulatorConnection(socketserver.BaseRequestHandler):
+    """Serves one client. Commands are handled as they arrive, tunnel current samples and
+    scan lines are sent at their intervals in between
+    """
+    def setup(self):
+        self.engine = self.server.engine
+        self.reader = FrameReader()
+        self.session = None
+        self.isPaused = False
+        self.lineInterval = self.server.lineInterval
+        # the speed of the clock is known, so select can wait in real time
+        self.clock = ScaledClock(self.server.speed)
+        self.pacer = None
+        if self.request.family != socket.AF_UNIX:
+            # lines are small frames which should not wait for more data
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        try:
+            self.serve()
+        except ConnectionError as e:
+            print(e)
+
+    def serve(self):
+        self.sendEvent("log", message="Verbindung zum Simulator hergestellt")
+        clock = self.clock
+        nextCurrentTime = clock.now()
+        while True:
+            now = clock.now()
+            deadline = nextCurrentTime
+            if self.isScanning():
+                deadline = min(deadline, self.pacer.nextTime)
+
+            readable, _, _ = select.select([self.request], [], [], max(deadline - now, 0) / clock.speed)
+            if readable:
+                data = self.request.recv(RECEIVE_BUFFER_SIZE)
+                if not data:
+                    return
+                try:
+                    for frameType, payload in self.reader.feed(data):
+                        if frameType == FRAME_COMMAND:
+                            self.handleCommand(decodeJson(payload))
+                except (ProtocolError, ValueError, KeyError, TypeError) as e:
+                    print(e)
+                    self.sendEvent("log", message=f"Ungültiger Befehl: {e}")
+
+            now = clock.now()
+            if now >= nextCurrentTime:
+                self.request.sendall(encodeCurrent(np.array([self.engine.getTunnelCurrent(), self.engine.getTargetCurrent()])))
+                # samples which were missed are skipped instead of being sent in a burst
+                nextCurrentTime = max(nextCurrentTime + CURRENT_INTERVAL, now)
+            if self.isScanning() and now >= self.pacer.nextTime:
+                self.sendLines()
+
+    def isScanning(self) -> bool:
+        return self.session is not None and not self.isPaused
+
+    def sendEvent(self, event: str, **values):
+        values["event"] = event
+        self.request.sendall(encodeJson(FRAME_EVENT, values))
+
+    def sendLines(self):
+        """Generates the lines which are due and sends them in one frame
+        """
+        session = self.session
+        start = self.clock.now()
+        rows = session.nextLines(self.pacer.linesDue(start))
+        self.pacer.linesGenerated(len(rows), self.clock.now() - start)
+        if len(rows):
+            self.request.sendall(encodeScanLine(session.scanId, rows.start, session.image[rows.start:rows.stop]))
+        if session.isFinished():
+            self.session = None
+            self.sendEvent("log", message="Scan wurde erfolgreich beendet")
+            currentError = session.getCurrentErrorRms()
+            if currentError is not None:
+                self.sendEvent("log", message=LOG_CURRENT_ERROR_MSG.format(currentError / NANO))
+            self.sendEvent("scanCompleted", scanId=session.scanId)
+
+    def handleCommand(self, message: dict):
+        """Executes a command of the client
+
+        Args:
+            message (dict): the command with its arguments
+        """
+        command = message["command"]
+        if command == "setParams":
+            self.engine.setPidParams(ki=message["ki"], kp=message["kp"], setpoint=message["setpoint"])
+            self.engine.setBiasVoltage(message["biasVoltage"])
+        elif command == "setScrews":
+            self.engine.updateTunnelCurrent(tuple(message["values"]))
+        elif command == "setMaterial":
+            self.engine.setCurrentImage(message["index"])
+        elif command == "setConstantCurrentMode":
+            self.engine.setConstantCurrentMode(bool(message["enabled"]))
+        elif command == "startScan":
+            params = ScanParameters(message["startX"], message["startY"], message["lengthX"], message["lengthY"],
+                                    message["direction"], message["breadth"], lineTime=message.get("lineTime"))
+            self.session = self.engine.startScanSession(params)
+            self.isPaused = False
+            self.pacer = LinePacer(self.lineInterval if params.lineTime is None else params.lineTime)
+            self.pacer.restart(self.clock.now())
+            self.sendEvent("scanStarted", scanId=self.session.scanId, rows=params.lengthY, cols=params.lengthX)
+        elif command == "pauseScan":
+            self.isPaused = True
+        elif command == "resumeScan":
+            self.isPaused = False
+            if self.pacer is not None:
+                self.pacer.restart(self.clock.now())
+        elif command == "stopScan":
+            self.session = None
+        else:
+            raise ValueError(f"unknown command {command}")
+
+
+class SimulatorTCPServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class SimulatorUnixServer(socketserver.UnixStreamServer):
+        pass
+
+
+def createServer(address: str, engine: SimulatorEngine, lineInterval: float = LINE_INTERVAL, speed: float = 1) -> socketserver.BaseServer:
+    """Creates a server for the address, host:port for TCP or unix:path for a Unix domain socket
+
+    Args:
+        address (str): the address
+        engine (SimulatorEngine): engine which generates the data
+        lineInterval (float, optional): seconds between two scan lines. Defaults to LINE_INTERVAL.
+        speed (float, optional): simulated seconds per real second. Defaults to 1.
+
+    Returns:
+        socketserver.BaseServer: the server, which is not serving yet
+    """
+    family, socketAddress = parseAddress(address)
+    if family == "unix":
+        if os.path.exists(socketAddress):
+            os.unlink(socketAddress)
+        server = SimulatorUnixServer(socketAddress, SimulatorConnection)
+    else:
+        server = SimulatorTCPServer(socketAddress, SimulatorConnection)
+    server.engine = engine
+    server.lineInterval = lineInterval
+    server.speed = speed
+    return server
+
+
+def parseArguments(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m simulator.server", description="Runs the simulator as a server for the GUI.")
+    parser.add_argument("--address", default=DEFAULT_SERVER_ADDRESS, help="host:port or unix:path")
+    parser.add_argument("--images", type=Path, default=Path(PATH_TO_IMAGES), help="directory of the material images")
+    parser.add_argument("--cache", type=Path, default=PATH_TO_MATERIAL_CACHE, help="directory of the decoded material cache")
+    parser.add_argument("--line-interval", type=float, default=LINE_INTERVAL, help="seconds between two scan lines of scans without a line time")
+    parser.add_argument("--speed", type=float, default=1, help="simulated seconds per real second")
+    parser.add_argument("--shared-materials", action="store_true", help="share the materials with the other simulators on this machine")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parseArguments(args)
+    engine = SimulatorEngine(args.images, SERVER_LOWER_CURRENT_BOUND, SERVER_UPPER_CURRENT_BOUND, pathToCache=args.cache, sharedMaterials=args.shared_materials)
+    engine.updateTunnelCurrent(SERVER_INITIAL_SCREWS)
+    try:
+        server = createServer(args.address, engine, args.line_interval, args.speed)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    # terminating the server releases the materials like an interrupt
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Simulator wartet auf {args.address}", file=sys.stderr)
+    try:
+        with server:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
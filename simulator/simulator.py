@@ -1,8 +1,9 @@
 import sys
 from PySide6 import QtWidgets as qtw
 from PySide6 import QtGui   as qtg
-from PySide6 import QtCore as qtc
 
+from microscope.simulatorMicroscope import SimulatorMicroscope
+from simulator.model.clock import MonotonicClock, ScaledClock
 from simulator.view.simulatorView import SimulatorView
 from simulator.model.simulatorModel import LOWER_CURRENT_BOUND, PATH_TO_IMAGES, SimulatorModel, UPPER_CURRENT_BOUND
 
@@ -12,51 +13,21 @@ SCREW_STEP = 0.01
 SCREW_DEFAULT = 0
 SCREW_NOTCHES_VISIBLE = False
 
-TUNNELING_CURRENT_INTERVAL = 50
-SCAN_UPDATE_INTERVAL = 500
+TUNNELING_CURRENT_INTERVAL = 50 # ms
+SCAN_UPDATE_INTERVAL = 500 # ms
+SIMULATION_SPEED = 1 # simulated seconds per real second, e.g. 100 for demos
 
 PATH_TO_IMAGES = "simulator/img"
 UPPER_CURRENT_BOUND= 1e-7
 LOWER_CURRENT_BOUND= 1e-9
 
-LOG_CURRENT_TOO_HIGH_MSG = "Tunnelstrom zu hoch - Scan vermutlich weiß oder verrauscht"
-LOG_CURRENT_TOO_LOW_MSG ="Tunnelstrom zu niedrig - Scan vermutlich schwarz"
-
     # TODO: ADD PROPER END SIMULATION FUNCTIONALITY 
     # TODO: ADD VIEW BUTTON IN MAIN WINDOW TO REDISPLAY SIMULATOR
 
-class ScanTimerThread(qtc.QThread):
-    """ This class represents a custom thread whith its own timer
-    """
-    def __init__(self, intervalTime=300):
-        qtc.QThread.__init__(self)
-        self.scanTimer = qtc.QTimer()
-        self.scanTimer.setInterval(intervalTime)
-        self.scanTimer.moveToThread(self)
-
-    def run(self):
-        self.scanTimer.start()
-        # print("Thread started")
-        loop = qtc.QEventLoop()
-        loop.exec_()
-
-
 class SimulatorWindow(qtw.QMainWindow):
-
-    transmitTunnelCurrent = qtc.Signal(float,float)
-    transmitScanImg = qtc.Signal(list)
-    transmitLineProfile = qtc.Signal(list)
-
-    scanFinished = qtc.Signal()
-
-    logMessage = qtc.Signal(str)
-
-
-    startLineIdx: int = 0
-    currentLineIdx: int = 0
-    timer = None
-
-    # threadpool = None
+    """Control panel of the simulator: the screws and the material are set here,
+    the scans are run by the SimulatorMicroscope driver of createMicroscope
+    """
 
     def __init__(self):
         """MainWindow constructor.
@@ -78,15 +49,6 @@ class SimulatorWindow(qtw.QMainWindow):
         self.menuBar = self.setupMenuBar()
         self.setMenuBar(self.menuBar)
 
-        # handles tunnelCurrent updates
-        self.timer = qtc.QTimer()
-        self.timer.setInterval(TUNNELING_CURRENT_INTERVAL)
-        self.timer.timeout.connect(self.sendTunnelCurrent)
-        self.timer.start()
-        
-        
-
-        self.model.scanFinished.connect(self.endScan)
         # End main UI code
         self.show()
 
@@ -107,7 +69,15 @@ class SimulatorWindow(qtw.QMainWindow):
         )
 
         self.fileMenu.addAction(self.closeAction)
-        
+
+        self.modeMenu = menuBar.addMenu('Modus')
+        self.constantCurrentAction = qtg.QAction(
+            "Konstantstrom-Modus",
+            self,
+            checkable=True,
+            toggled=self.model.setConstantCurrentMode
+        )
+        self.modeMenu.addAction(self.constantCurrentAction)
 
         return menuBar
 
@@ -115,97 +85,16 @@ class SimulatorWindow(qtw.QMainWindow):
         """If the Simulator is closed via the file menu action it will be disconnected
         """
         self.view.valuesChanged.disconnect(self.model.updateTunnelCurrent)
-        self.view.timer.timeout.disconnect(self.sendTunnelCurrent)
         self.close()
 
-    def sendTunnelCurrent(self):
-        """Emits the models current tunneling current
-        """
-        self.transmitTunnelCurrent.emit(self.model.getTunnelCurrent(),self.model.getTargetCurrent())
-
-    def updateControlParameters(self, args):
-        """Updates the models PID parameters
-
-        Args:
-            args (float, float, float, float): BiasVoltage, proportional Gain, integral Gain, Setpoint
-        """
-        biasV , pGain, iGain, zHeight = args
-
-        self.model.setPidParams(ki = iGain, kp= pGain, setpoint=zHeight)
-        self.model.setBiasVoltage(biasV)
-        
-    def startScan(self, args):
-        """This function starts a scan and takes all the current parameters of the main GUI
-        It will start a thread for the process to run on and then pass the updates to self.emitImg
-
-        Args:
-            args (float, float, float, int, int ,int ,int ,int, float, float): 
-            proportional Gain, integral Gain, Setpoint, Start Coordinate x, start Coordinate y, End Coordinate in x, End Coordinate in y, Tip breadh, BiasVoltage
-        """
-        pGain, iGain, zHeight, xStart, yStart, xEnd, yEnd, direction, breadth, biasV = args
-        self.model.setPidParams(pGain, iGain, zHeight)
-        self.model.setBiasVoltage(biasV)
-
-        self.scanCallLambda = lambda startX = xStart, startY = yStart, endX = xEnd, endY = yEnd, dir = direction, vel = breadth: self.emitImg(startX, startY, endX, endY, dir, vel)
-
-        currentVal = self.model.getTunnelCurrent()
-        if  currentVal < LOWER_CURRENT_BOUND:
-            self.logMessage.emit(LOG_CURRENT_TOO_LOW_MSG)
-        if currentVal >= UPPER_CURRENT_BOUND:
-            self.logMessage.emit(LOG_CURRENT_TOO_HIGH_MSG)
+    def createMicroscope(self) -> SimulatorMicroscope:
+        """Creates the driver through which the main window scans with this simulator
 
-        self.scanTimerThread = ScanTimerThread(SCAN_UPDATE_INTERVAL)
-        self.scanTimerThread.start()
-
-        self.scanTimerThread.scanTimer.timeout.connect(self.scanCallLambda)
-        
-    def endScan(self):
-        """Cleans up after scan
-        """
-        
-        self.logMessage.emit("Scan wurde erfolgreich beendet")
-
-        self.resetScanVariables()
-        self.scanTimerThread.scanTimer.timeout.disconnect()
-
-        self.scanTimerThread.terminate()
-        
-    def emitImg(self, startX, startY, lengthX, lengthY, direction, breadth):
-        """Handels line by line emission of scans
+        Returns:
+            SimulatorMicroscope: driver of the simulator engine
         """
-        self.startLineIdx = startY
-        
-        if self.startLineIdx != startY:
-            self.currentLineIdx = 1
-        elif self.currentLineIdx < lengthY:
-            self.currentLineIdx += 1
-        else: 
-            self.endScan()
-            return
-        
-        
-        self.transmitScanImg.emit(self.model.getScanImage(startX, startY, lengthX, self.currentLineIdx, direction, lengthY, breadth))
-        
-
-
-    def resetScanVariables(self):
-        self.startLineIdx = 0
-        self.currentLineIdx = 0
-
-    def stopScan(self):
-        self.scanTimerThread.scanTimer.timeout.disconnect()
-        self.resetScanVariables()
-        self.scanTimerThread.terminate()
-
-    def pauseScan(self):
-        self.scanTimerThread.scanTimer.timeout.disconnect()
-
-    def resumeScan(self):
-        self.scanTimerThread.scanTimer.timeout.connect(self.scanCallLambda)
-
-    # # TODO
-    # def sendScanLine(self):
-    #     self.transmitScanLine.emit(self.model.getScanLine())
+        clock = MonotonicClock() if SIMULATION_SPEED == 1 else ScaledClock(SIMULATION_SPEED)
+        return SimulatorMicroscope(self.model.engine, lineInterval=SCAN_UPDATE_INTERVAL / 1000, currentInterval=TUNNELING_CURRENT_INTERVAL / 1000, clock=clock)
 
 
 if __name__ == '__main__':
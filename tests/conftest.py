@@ -0,0 +1,27 @@
+import numpy as np
+import PIL.Image
+import pytest
+
+from simulator.model.engine import SimulatorEngine
+
+MATERIAL_SIZE = 256
+
+
+@pytest.fixture
+def materialDir(tmp_path):
+    """Directory with one random material image
+    """
+    directory = tmp_path / "img"
+    directory.mkdir()
+    data = np.random.default_rng(0).integers(0, 256, size=(MATERIAL_SIZE, MATERIAL_SIZE), dtype=np.uint8)
+    PIL.Image.fromarray(data).save(directory / "Random.png")
+    return directory
+
+
+@pytest.fixture
+def engine(materialDir, tmp_path):
+    engine = SimulatorEngine(materialDir, pathToCache=tmp_path / "cache", noiseSeed=0, prefetchMaterials=False)
+    # tunnel current within the bounds, so every line is generated
+    engine.updateTunnelCurrent((100, 100, 100))
+    yield engine
+    engine.close()
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from simulator.model.clock import VirtualClock
+from simulator.model.engine import ScanParameters
+from simulator.model.noise import CompositeNoise, GaussianNoise, LineOffsetNoise, PinkNoise, TelegraphNoise, UniformNoise
+from simulator.model.scanWorker import ScanWorker
+
+NOISE_MODELS = {
+    "uniform": UniformNoise,
+    "gaussian": GaussianNoise,
+    "pink": PinkNoise,
+    "telegraph": TelegraphNoise,
+    "lineOffset": LineOffsetNoise,
+    "composite": lambda: CompositeNoise([GaussianNoise(), PinkNoise(), TelegraphNoise()]),
+}
+LINE_TIME = 0.125 # binary fractions, so the due lines are counted without rounding errors
+CLOCK_STEP = 0.375 # simulated seconds per advance, so the worker generates batches of several lines
+
+
+def scanParams(seed: int = 0) -> ScanParameters:
+    return ScanParameters(0, 0, 64, 40, 1, 0.1, seed=seed, lineTime=LINE_TIME)
+
+
+def scanWithWorker(engine, clock: VirtualClock, params: ScanParameters) -> tuple:
+    batches = []
+    finished = threading.Event()
+    worker = ScanWorker(lambda session, rows: batches.append(len(rows)), lambda session: finished.set(), clock=clock)
+    try:
+        session = engine.startScanSession(params)
+        worker.start(session)
+        while not finished.wait(0.001):
+            clock.advance(CLOCK_STEP)
+    finally:
+        worker.close()
+    return session.image, batches
+
+
+@pytest.mark.parametrize("modelName", NOISE_MODELS)
+def test_scan_does_not_depend_on_the_batches(engine, modelName):
+    engine.setNoiseModel(NOISE_MODELS[modelName](), amplitude=10)
+    session = engine.startScanSession(scanParams())
+    while not session.isFinished():
+        session.nextLine()
+    expected = session.image
+
+    image, batches = scanWithWorker(engine, VirtualClock(), scanParams())
+    assert sum(batches) == scanParams().lengthY
+    assert max(batches) > 1
+    np.testing.assert_allclose(image, expected, atol=1e-9)
+
+
+def waitForLines(lines: list, count: int, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while len(lines) < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+    # lines which are not due must not follow
+    time.sleep(0.01)
+    assert len(lines) == count
+
+
+def test_virtual_clock_paces_the_lines(engine):
+    clock = VirtualClock(start=100)
+    lines = []
+    worker = ScanWorker(lambda session, rows: lines.extend(rows), lambda session: None, clock=clock)
+    try:
+        worker.start(engine.startScanSession(scanParams()))
+        # the first line is due at once, the next ones only after the time was advanced
+        waitForLines(lines, 1)
+        clock.advance(0.25)
+        waitForLines(lines, 3)
+        clock.advance(1)
+        waitForLines(lines, 11)
+    finally:
+        worker.close()
+    assert lines == list(range(11))
+    assert clock.now() == 101.25
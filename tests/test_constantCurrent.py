@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from simulator.model.engine import CONSTANT_CURRENT_Z_RANGE, ScanParameters
+from simulator.model.pid import BatchPID
+
+
+def scanConstantCurrent(engine, kp: float, ki: float = 0.5):
+    engine.setPidParams(ki=ki, kp=kp, setpoint=20)
+    return engine.runScan(ScanParameters(0, 0, 64, 16, 1, 0.1, constantCurrent=True))
+
+
+def test_stable_gains_track_the_surface(engine):
+    session = scanConstantCurrent(engine, kp=2)
+    lower, upper = CONSTANT_CURRENT_Z_RANGE
+    assert np.isfinite(session.image).all()
+    assert lower < session.image.min() and session.image.max() < upper
+    assert session.getCurrentErrorRms() < engine.getTargetCurrent()
+
+
+@pytest.mark.parametrize("kp", [15, 25, 100])
+def test_unstable_gains_stay_in_the_piezo_range(engine, kp):
+    session = scanConstantCurrent(engine, kp=kp)
+    lower, upper = CONSTANT_CURRENT_Z_RANGE
+    assert np.isfinite(session.image).all()
+    assert np.isfinite(session.currentError).all()
+    assert lower <= session.image.min() and session.image.max() <= upper
+
+
+def test_limited_loop_matches_unlimited_loop_inside_the_limits():
+    offsets = np.random.default_rng(0).normal(size=(4, 300)).cumsum(axis=-1) * 0.1
+    unlimited = BatchPID(0.2, 0.05, 0.01, setpoint=1.0)
+    outputs, errors = unlimited.runLinearPlant(offsets, 1.0)
+
+    limited = BatchPID(0.2, 0.05, 0.01, setpoint=1.0, outputLimits=(outputs.min() - 1, outputs.max() + 1))
+    limitedOutputs, limitedErrors = limited.runLinearPlant(offsets, 1.0)
+    np.testing.assert_allclose(limitedOutputs, outputs)
+    np.testing.assert_allclose(limitedErrors, errors)
+
+    # stepping through the samples solves the same loop as the convolution
+    reference = 1.0 - offsets
+    coefficients = (0.2 + 0.05 * 0.1 + 0.01 / 0.1, -(0.2 + 2 * 0.01 / 0.1), 0.01 / 0.1)
+    stepped = limited.stepLinearPlant(reference - reference[:, :1], 1.0, coefficients, reference[:, :1])
+    np.testing.assert_allclose(stepped + reference[:, :1], outputs, atol=1e-9)
+
+
+def test_image_mode_has_no_current_error(engine):
+    session = engine.runScan(ScanParameters(0, 0, 32, 4, 1, 0.1, constantCurrent=False))
+    assert session.currentError is None
+    assert session.getCurrentErrorRms() is None
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+import tifffile
+
+from simulator import generate
+
+
+def test_feedback_parameters_require_constant_current(materialDir, tmp_path):
+    args = generate.parseArguments(["--output", str(tmp_path / "scans"), "--images", str(materialDir), "--kp", "1", "2"])
+    with pytest.raises(ValueError, match="--kp"):
+        generate.buildJobs(args, generate.selectMaterials(args.images, args.materials))
+
+
+def test_feedback_parameters_change_constant_current_scans(materialDir, tmp_path):
+    output = tmp_path / "scans"
+    generate.main(["--output", str(output), "--images", str(materialDir), "--cache", str(tmp_path / "cache"),
+                   "--resolution", "32", "--constant-current", "--kp", "1", "4", "--workers", "1"])
+
+    entries = [json.loads(line) for line in open(output / generate.MANIFEST_FILE_NAME)]
+    first, second = (tifffile.imread(output / entry["file"]) for entry in entries)
+    assert (first != second).any()
+    assert all((output / entry["errorFile"]).exists() for entry in entries)
+
+
+def test_worker_engine_loads_only_the_materials_of_its_jobs(materialDir, tmp_path):
+    generate.initWorker(str(materialDir), str(tmp_path / "cache"))
+    try:
+        assert not generate.workerEngine.materials.cached
+    finally:
+        generate.workerEngine.close()
+        generate.workerEngine = None
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from simulator.model.pid import BatchPID
+
+GAINS = dict(kp=0.8, ki=2.0, kd=0.05, setpoint=1.0)
+
+
+def buildLines() -> np.ndarray:
+    return np.random.default_rng(0).normal(1.0, 0.3, size=(5, 200))
+
+
+def runLines(pid, lines: np.ndarray, step) -> np.ndarray:
+    """Runs every line from a reset controller, like the engine does for the lines of a scan
+    """
+    outputs = []
+    for line in lines:
+        pid.reset()
+        outputs.append(step(pid, line))
+    return np.array(outputs)
+
+
+def stepScalar(pid, line: np.ndarray) -> list:
+    return [pid(input) for input in line]
+
+
+@pytest.mark.parametrize("outputLimits", [(None, None), (-0.5, 0.5)])
+def test_run_matches_the_scalar_loop(outputLimits):
+    lines = buildLines()
+    batch = BatchPID(**GAINS, outputLimits=outputLimits)
+    scalar = BatchPID(**GAINS, outputLimits=outputLimits)
+    expected = runLines(scalar, lines, stepScalar)
+    np.testing.assert_allclose(runLines(batch, lines, BatchPID.run), expected, atol=1e-12)
+    assert batch.integral == pytest.approx(scalar.integral)
+    assert batch.lastInput == scalar.lastInput
+    assert batch.lastOutput == pytest.approx(scalar.lastOutput)
+
+
+def test_reset_clears_the_integral_between_lines():
+    lines = buildLines()
+    pid = BatchPID(**GAINS)
+    outputs = runLines(pid, lines, BatchPID.run)
+    for line, output in zip(lines, outputs):
+        np.testing.assert_allclose(output, BatchPID(**GAINS).run(line), atol=1e-12)
+
+    # without the reset the integral of the previous lines carries over
+    pid.reset()
+    carried = [pid.run(line) for line in lines]
+    assert not np.allclose(carried[1], outputs[1])
+    np.testing.assert_allclose(np.concatenate(carried), BatchPID(**GAINS).run(lines.ravel()), atol=1e-12)
+
+
+@pytest.mark.parametrize("outputLimits", [(None, None), (-0.5, 0.5)])
+def test_run_matches_simple_pid(outputLimits):
+    simple_pid = pytest.importorskip("simple_pid")
+    lines = buildLines()
+    reference = simple_pid.PID(GAINS["kp"], GAINS["ki"], GAINS["kd"], setpoint=GAINS["setpoint"], sample_time=None, output_limits=outputLimits)
+    expected = runLines(reference, lines, lambda pid, line: [pid(input, dt=0.1) for input in line])
+    batch = BatchPID(**GAINS, sampleTime=0.1, outputLimits=outputLimits)
+    np.testing.assert_allclose(runLines(batch, lines, BatchPID.run), expected, atol=1e-12)
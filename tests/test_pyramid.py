@@ -0,0 +1,32 @@
+import numpy as np
+
+from simulator.model.pyramid import MaterialPyramid
+
+
+def test_levels_are_the_rounded_mean_of_the_full_image():
+    image = np.random.default_rng(0).integers(0, 256, size=(64, 1024), dtype=np.uint8)
+    pyramid = MaterialPyramid(image)
+
+    for level in range(1, len(pyramid.levels)):
+        factor = 1 << level
+        mean = image.reshape(image.shape[0], -1, factor).mean(axis=2)
+        assert pyramid.getLevel(level).dtype == np.uint8
+        # the error does not grow with the level
+        assert np.abs(pyramid.getLevel(level) - mean).max() <= 0.5
+
+
+def test_levels_are_not_biased():
+    # means which are exactly between two grey levels are rounded in both directions across the levels
+    image = np.random.default_rng(1).integers(0, 256, size=(256, 4096), dtype=np.uint8)
+    pyramid = MaterialPyramid(image)
+
+    for level in range(1, len(pyramid.levels)):
+        mean = image.reshape(image.shape[0], -1, 1 << level).mean(axis=2)
+        assert abs(float(np.mean(pyramid.getLevel(level) - mean))) < 0.01
+
+
+def test_odd_widths_repeat_the_last_pixel():
+    image = np.array([[10, 20, 31]], dtype=np.uint8)
+    pyramid = MaterialPyramid(image)
+    np.testing.assert_array_equal(pyramid.getLevel(1), [[15, 31]])
+    np.testing.assert_array_equal(pyramid.getLevel(2), [[23]])
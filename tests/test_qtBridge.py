@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+qtc = pytest.importorskip("PySide6.QtCore")
+
+from microscope.driver import Microscope
+from microscope.qtBridge import QtMicroscopeAdapter
+
+TIMEOUT = 5 # seconds
+
+
+class FailingMicroscope(Microscope):
+    async def connect(self):
+        raise RuntimeError("kaputt")
+
+    async def close(self):
+        pass
+
+
+def test_failed_connect_is_reported():
+    app = qtc.QCoreApplication.instance() or qtc.QCoreApplication([])
+    adapter = QtMicroscopeAdapter(FailingMicroscope())
+    messages = []
+    disconnected = []
+    adapter.logMessage.connect(messages.append)
+    adapter.disconnected.connect(lambda: disconnected.append(True))
+    try:
+        deadline = time.monotonic() + TIMEOUT
+        while not disconnected and time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.001)
+    finally:
+        adapter.close()
+
+    assert disconnected
+    assert any("kaputt" in message for message in messages)
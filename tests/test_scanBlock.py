@@ -0,0 +1,115 @@
+import numpy as np
+import PIL.Image
+import pytest
+
+from simulator.model.noise import UniformNoise
+
+# the first axis of the material is the scan direction x, it is longer than the second one
+MATERIAL_WIDTH = 256
+MATERIAL_HEIGHT = 192
+BREADTH = 0.1 # one pixel per point
+
+CASES = {
+    "right": (10, 20, 100, 30, 1),
+    "left": (200, 20, 100, 30, 0),
+    "leftBorderRight": (-15, 5, 60, 10, 1),
+    "leftBorderLeft": (30, 5, 60, 10, 0),
+    "rightBorder": (220, 100, 60, 10, 1),
+    "lastRows": (0, MATERIAL_HEIGHT - 10, 40, 30, 1),
+    "firstRows": (40, -3, 40, 6, 0),
+    "wholeImage": (0, 0, MATERIAL_WIDTH, MATERIAL_HEIGHT, 1),
+}
+OUTSIDE_CASES = {
+    "belowImage": (0, MATERIAL_HEIGHT, 50, 5, 1),
+    "aboveImage": (0, -10, 50, 5, 0),
+}
+
+
+def buildMaterial() -> np.ndarray:
+    return np.random.default_rng(1).integers(0, 1 << 16, size=(MATERIAL_WIDTH, MATERIAL_HEIGHT), dtype=np.uint16)
+
+
+@pytest.fixture
+def materialDir(tmp_path):
+    """Directory with one non square 16 bit material, which is decoded to the full range of 8 bits
+    """
+    directory = tmp_path / "img"
+    directory.mkdir()
+    PIL.Image.fromarray(buildMaterial()).save(directory / "Random.png")
+    return directory
+
+
+@pytest.fixture
+def silentEngine(engine):
+    engine.setNoiseModel(UniformNoise(), amplitude=0)
+    return engine
+
+
+def scanLineReference(image: np.ndarray, startX: int, startY: int, length: int, direction: int) -> np.ndarray:
+    """The per line gather which getScanBlock replaced, at a step of one pixel
+
+    Args:
+        image (np.ndarray): material indexed by [x, y]
+    """
+    width, height = image.shape
+    if startY < 0 or startY >= height:
+        return np.zeros(length)
+    if direction == 1:
+        xCoords = np.arange(startX, startX + length)
+    else:
+        xCoords = np.arange(startX - length, startX)
+    inside = (xCoords >= 0) & (xCoords < width)
+    line = np.zeros(length)
+    line[inside] = image[xCoords[inside], startY]
+    return line
+
+
+def scanBlockReference(startX: int, startY: int, nx: int, ny: int, direction: int) -> np.ndarray:
+    # the decoder scales the 16 bit data to 8 bits
+    image = buildMaterial() >> 8
+    return np.array([scanLineReference(image, startX, startY + row, nx, direction) for row in range(ny)])
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_block_matches_the_line_gather(silentEngine, case):
+    startX, startY, nx, ny, direction = CASES[case]
+    expected = scanBlockReference(*CASES[case])
+    assert expected.any()
+    np.testing.assert_array_equal(silentEngine.getScanBlock(startX, startY, nx, ny, direction, BREADTH), expected)
+
+
+def test_points_left_of_the_image_are_zero(silentEngine):
+    block = silentEngine.getScanBlock(-15, 5, 60, 10, 1, BREADTH)
+    assert not block[:, :15].any()
+    assert block[:, 15:].any()
+
+    block = silentEngine.getScanBlock(30, 5, 60, 10, 0, BREADTH)
+    assert not block[:, :30].any()
+
+
+@pytest.mark.parametrize("case", OUTSIDE_CASES)
+def test_lines_outside_of_the_image_are_zero(silentEngine, case):
+    startX, startY, nx, ny, direction = OUTSIDE_CASES[case]
+    block = silentEngine.getScanBlock(startX, startY, nx, ny, direction, BREADTH)
+    assert block.shape == (ny, nx)
+    assert not block.any()
+    assert not silentEngine.getScanLine(startX, startY, nx, direction, BREADTH).any()
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_block_equals_single_lines(silentEngine, case):
+    startX, startY, nx, ny, direction = CASES[case]
+    block = silentEngine.getScanBlock(startX, startY, nx, ny, direction, BREADTH)
+    lines = np.array([silentEngine.getScanLine(startX, startY + row, nx, direction, BREADTH) for row in range(ny)])
+    np.testing.assert_array_equal(block, lines)
+    np.testing.assert_array_equal(silentEngine.getScanImage(startX, startY, nx, ny, direction, ny, BREADTH), block)
+
+
+def test_seeded_noise_does_not_depend_on_the_block_size(engine):
+    startX, startY, nx, ny, direction = CASES["right"]
+    engine.setNoiseModel(UniformNoise(), amplitude=10)
+    engine.seedNoise(0)
+    block = engine.getScanBlock(startX, startY, nx, ny, direction, BREADTH)
+    engine.seedNoise(0)
+    lines = np.array([engine.getScanLine(startX, startY + row, nx, direction, BREADTH) for row in range(ny)])
+    np.testing.assert_array_equal(block, lines)
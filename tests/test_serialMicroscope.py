@@ -0,0 +1,52 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from microscope.serialMicroscope import SerialMicroscope
+from simulator.fakeDevice import FakeDevice
+from simulator.model.engine import ScanParameters
+
+PARAMS = ScanParameters(0, 0, 1500, 24, 1, 0.1)
+
+
+async def scanImage(microscope: SerialMicroscope, params: ScanParameters) -> np.ndarray:
+    await microscope.connect()
+    image = np.full((params.lengthY, params.lengthX), np.nan)
+
+    async def consumeLines():
+        async for scanId, firstRow, lines in microscope.streamLines():
+            image[firstRow:firstRow + len(lines)] = lines
+
+    consumer = asyncio.create_task(consumeLines())
+    await microscope.startScan(params)
+    async for event in microscope.streamEvents():
+        if event["event"] in ("scanCompleted", "disconnected"):
+            break
+    await microscope.lines.waitEmpty()
+    consumer.cancel()
+    await microscope.close()
+    return image
+
+
+def scanWithDevice(engine, corruptionRate: float) -> tuple:
+    device = FakeDevice(engine, corruptionRate=corruptionRate, seed=0)
+    device.start()
+    try:
+        microscope = SerialMicroscope(device.portName)
+        image = asyncio.run(asyncio.wait_for(scanImage(microscope, PARAMS), 30))
+    finally:
+        device.close()
+    return image, microscope
+
+
+@pytest.mark.parametrize("corruptionRate", [0.05, 0.2])
+def test_lost_frames_are_repeated(engine, corruptionRate):
+    expected, _ = scanWithDevice(engine, 0)
+    assert np.isfinite(expected).all()
+
+    image, microscope = scanWithDevice(engine, corruptionRate)
+    assert microscope.parser.corrupted > 0
+    assert microscope.completedRows == PARAMS.lengthY
+    assert microscope.commandCount > PARAMS.lengthY
+    np.testing.assert_array_equal(image, expected)
@@ -0,0 +1,89 @@
+import numpy as np
+
+from microscope.serialProtocol import (FRAME_CURRENT, FRAME_LINE, MAX_FRAME_SIZE, SAMPLE_HEADER, FrameParser, RingBuffer,
+                                       encodeSamples)
+
+
+def lineFrame(row: int, offset: int = 0, count: int = 16) -> bytes:
+    return encodeSamples(FRAME_LINE, 1, offset, row, np.arange(offset, offset + count, dtype=np.float32) + row * 1000)
+
+
+def parseRows(parser: FrameParser) -> list:
+    return [(row, offset, afterLoss) for _, _, offset, row, _, afterLoss in parser.parse()]
+
+
+def test_frames_are_parsed_as_views():
+    parser = FrameParser()
+    parser.ring.write(lineFrame(3) + encodeSamples(FRAME_CURRENT, 0, 0, -1, np.ones(4)))
+    frames = parser.parse()
+    assert [frame[0] for frame in frames] == [FRAME_LINE, FRAME_CURRENT]
+    np.testing.assert_array_equal(frames[0][4], np.arange(16) + 3000)
+    assert frames[0][4].base is not None
+    assert parser.corrupted == 0
+    assert len(parser.ring) == 0
+
+
+def test_bad_crc_loses_only_its_frame():
+    parser = FrameParser()
+    corrupted = bytearray(lineFrame(1))
+    corrupted[SAMPLE_HEADER.size + 5] ^= 0xFF
+    parser.ring.write(lineFrame(0) + bytes(corrupted) + lineFrame(2))
+    assert parseRows(parser) == [(0, 0, False), (2, 0, True)]
+    assert parser.corrupted == 1
+    assert parser.isSynchronized
+
+
+def test_corrupted_header_is_skipped():
+    parser = FrameParser()
+    badType = bytearray(lineFrame(1))
+    badType[2] = 0x7F
+    badSync = bytearray(lineFrame(2))
+    badSync[0] = 0
+    parser.ring.write(bytes(badType) + bytes(badSync) + lineFrame(3))
+    assert parseRows(parser) == [(3, 0, True)]
+    # both frames are in one corrupted section
+    assert parser.corrupted == 1
+
+
+def test_corrupted_count_does_not_wait_for_missing_data():
+    parser = FrameParser()
+    badCount = bytearray(lineFrame(1))
+    # a count which is valid, but longer than everything the device sends afterwards
+    badCount[6:8] = (1000).to_bytes(2, "little")
+    parser.ring.write(bytes(badCount) + lineFrame(2))
+    assert parseRows(parser) == [(2, 0, True)]
+
+
+def test_incomplete_frame_waits_for_the_rest():
+    parser = FrameParser()
+    frame = lineFrame(4, offset=32)
+    parser.ring.write(frame[:SAMPLE_HEADER.size + 3])
+    assert parser.parse() == []
+    assert parser.isSynchronized
+
+    parser.ring.write(frame[SAMPLE_HEADER.size + 3:])
+    assert parseRows(parser) == [(4, 32, False)]
+    assert parser.corrupted == 0
+
+
+def test_ring_buffer_moves_pending_data_to_the_start():
+    ring = RingBuffer(MAX_FRAME_SIZE * 2)
+    parser = FrameParser(ring)
+    rows = []
+    moves = 0
+    for row in range(20):
+        frame = lineFrame(row, count=200)
+        # the frames are split, so pending data is moved whenever the end of the buffer is reached
+        for part in (frame[:100], frame[100:]):
+            rows += parseRows(parser)
+            writePos = ring.writePos
+            ring.write(part)
+            moves += ring.writePos < writePos
+        frames = parser.parse()
+        assert len(frames) == 1
+        np.testing.assert_array_equal(frames[0][4], np.arange(200) + row * 1000)
+        rows.append((frames[0][3], frames[0][2], frames[0][5]))
+        assert ring.writePos <= len(ring.buffer)
+    assert moves > 0
+    assert rows == [(row, 0, False) for row in range(20)]
+    assert parser.corrupted == 0
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from simulator.model.materialCache import MaterialLibrary
+from simulator.model.sharedMaterialStore import SharedMaterialStore
+
+pytestmark = pytest.mark.skipif(not SharedMaterialStore.isSupported(), reason="shared materials need file locks")
+
+
+def buildLevels():
+    return [np.arange(64, dtype=np.uint8).reshape(8, 8), np.arange(16, dtype=np.uint8).reshape(4, 4)]
+
+
+def test_arrays_stay_valid_after_release(tmp_path):
+    store = SharedMaterialStore(tmp_path)
+    key = f"test{tmp_path.name}"
+    levels = store.acquire(key, buildLevels)
+    view = levels[0][2:]
+    assert not view.flags.writeable
+
+    store.release(key)
+    del levels
+    # the segment is closed and removed, the view still reads the published data
+    np.testing.assert_array_equal(view, buildLevels()[0][2:])
+
+
+def test_acquire_attaches_once(tmp_path):
+    store = SharedMaterialStore(tmp_path)
+    key = f"test{tmp_path.name}"
+    builds = []
+
+    def build():
+        builds.append(1)
+        return buildLevels()
+
+    first = store.acquire(key, build)
+    second = store.acquire(key, build)
+    assert first is second
+    assert len(builds) == 1
+    store.release(key)
+    store.release(key)
+    assert not store.attached
+
+
+def test_pinned_material_is_not_evicted():
+    released = []
+    library = MaterialLibrary(lambda path: np.zeros(100, dtype=np.uint8), byteBudget=150,
+                              releaseFunction=lambda path, data: released.append(path))
+    try:
+        library.get("current", pin=True)
+        library.get("other")
+        library.get("next")
+        assert library.isCached("current")
+        assert released == ["other"]
+
+        library.unpin("current")
+        assert not library.isCached("current")
+        assert released == ["other", "current"]
+    finally:
+        library.shutdown()
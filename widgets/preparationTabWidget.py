@@ -7,13 +7,20 @@ from PySide6 import QtGui as qtg
 from PySide6 import QtWidgets as qtw
 
 from .canvas import Canvas
+from .renderScheduler import RenderScheduler
 from .resources import *
 import numpy as np
 
+TUNNEL_CURRENT_HISTORY_LENGTH = 100
+TUNNEL_CURRENT_PLOT_MAX = 1e-7
+
 class PreparationTabWidget(qtw.QWidget):
     logMessage = qtc.Signal(str)
 
-    def __init__(self):
+    plotBackground = None
+    writeIdx = 0
+
+    def __init__(self, historyLength: int = TUNNEL_CURRENT_HISTORY_LENGTH, renderScheduler: RenderScheduler = None):
         super().__init__()
 
         
@@ -22,10 +29,11 @@ class PreparationTabWidget(qtw.QWidget):
         self.greenLEDPxm = qtg.QPixmap(
             ":/icons/led_green.png").scaled(16, 16, qtc.Qt.KeepAspectRatio)
 
-        nData = 100
-
-        self.xData = np.arange(nData)
-        self.yData = np.zeros(nData)
+        # yData is used as a ring buffer, writeIdx points to the oldest sample
+        self.xData = np.arange(historyLength)
+        self.yData = np.zeros(historyLength)
+        self.displayData = np.zeros(historyLength)
+        self.targetCurrent = 0
 
         self.mainLayout = qtw.QVBoxLayout()
         self.setLayout(self.mainLayout)
@@ -33,10 +41,12 @@ class PreparationTabWidget(qtw.QWidget):
         self.prepCanvas = Canvas(self)
 
         self.prepAxe = self.prepCanvas.fig.add_subplot(111)
-        self.prepAxe.plot(self.xData, self.yData, linewidth=4,
-                          color="r", label="Tunnelstrom")
+        self.currentLine, = self.prepAxe.plot(self.xData, self.displayData, lw=4,
+                                              color="g", label="Tunnelstrom", animated=True)
+        self.targetLine = self.prepAxe.axhline(y=self.targetCurrent, linestyle="--",
+                                               label="Zieltunnelstrom", animated=True)
         self.prepAxe.legend()
-        self.prepAxe.set_ylim(0, 10e-8)
+        self.prepAxe.set_ylim(0, TUNNEL_CURRENT_PLOT_MAX)
 
         self.prepAxe.set_xlabel("t")
         self.prepAxe.set_ylabel("Tunnelstrom")
@@ -46,6 +56,10 @@ class PreparationTabWidget(qtw.QWidget):
                             qtw.QSizePolicy.Expanding)
         )
 
+        # redraws of the tunnel current are merged with all other redraws to at most one per frame
+        self.renderScheduler = RenderScheduler(parent=self) if renderScheduler is None else renderScheduler
+
+        self.prepCanvas.canvas.mpl_connect("draw_event", self.cachePlotBackground)
         self.prepCanvas.canvas.draw()
 
         self.prepLbl = qtw.QLabel("Vorbereitung")
@@ -69,6 +83,8 @@ class PreparationTabWidget(qtw.QWidget):
         self.rtmComboBox.addItem("Auswählen...")
         self.rtmComboBox.model().item(0).setEnabled(False)
         self.rtmComboBox.addItem("Simulator")
+        self.rtmComboBox.addItem("Simulator (Server)")
+        self.rtmComboBox.addItem("500€ RTM")
 
         self.rtmSelectRow.addWidget(self.prepDescrLbl)
         self.rtmSelectRow.addWidget(self.rtmComboBox)
@@ -95,20 +111,55 @@ class PreparationTabWidget(qtw.QWidget):
         # self.rtmConnectBtn.clicked.connect(self.connectWithRTM)
 
     def updatePlot(self, tunnelCurrent, targetCurrent):
-        if tunnelCurrent > 10e-8:
-            tunnelCurrent = 10e-8
-        self.yData = np.append(self.yData[1:], tunnelCurrent)
-        self.prepAxe.cla()
-        self.prepAxe.plot(self.xData, self.yData, lw="4",
-                            color='g', label="Tunnelstrom")
-        self.prepAxe.axhline(y=targetCurrent, linestyle="--", label="Zieltunnelstrom")
-        self.prepAxe.legend()
-
-        self.prepAxe.set_ylim(0, 1e-7)
-
-        self.prepAxe.set_xlabel("t")
-        self.prepAxe.set_ylabel("Tunnelstrom")
-        self.prepCanvas.canvas.draw()
+        """Writes a new tunnel current sample into the ring buffer and schedules a redraw of the plot
+
+        Args:
+            tunnelCurrent (float): current tunnel current
+            targetCurrent (float): current setpoint of the tunnel current
+        """
+        if tunnelCurrent > TUNNEL_CURRENT_PLOT_MAX:
+            tunnelCurrent = TUNNEL_CURRENT_PLOT_MAX
+        self.yData[self.writeIdx] = tunnelCurrent
+        self.writeIdx = (self.writeIdx + 1) % len(self.yData)
+        self.targetCurrent = targetCurrent
+        self.renderScheduler.markDirty(self.blitPlot)
+
+    def updateArtists(self):
+        """Copies the ring buffer in chronological order into the plotted line and moves the setpoint line
+        """
+        oldestSamples = len(self.yData) - self.writeIdx
+        self.displayData[:oldestSamples] = self.yData[self.writeIdx:]
+        self.displayData[oldestSamples:] = self.yData[:self.writeIdx]
+        self.currentLine.set_ydata(self.displayData)
+        self.targetLine.set_ydata([self.targetCurrent, self.targetCurrent])
+
+    def cachePlotBackground(self, event):
+        """Caches the plot without the animated lines after every full draw so that later updates can be blitted
+
+        Args:
+            event: matplotlib draw event
+        """
+        self.plotBackground = self.prepCanvas.canvas.copy_from_bbox(self.prepAxe.bbox)
+        self.updateArtists()
+        self.prepAxe.draw_artist(self.currentLine)
+        self.prepAxe.draw_artist(self.targetLine)
+
+    def blitPlot(self, region=None):
+        """Redraws only the tunnel current and setpoint lines over the cached background
+
+        Args:
+            region (optional): dirty region of the render scheduler, the plot is always redrawn completely. Defaults to None.
+        """
+        if self.plotBackground is None:
+            self.prepCanvas.canvas.draw()
+            return
+
+        canvas = self.prepCanvas.canvas
+        canvas.restore_region(self.plotBackground)
+        self.updateArtists()
+        self.prepAxe.draw_artist(self.currentLine)
+        self.prepAxe.draw_artist(self.targetLine)
+        canvas.blit(self.prepAxe.bbox)
 
 
     def updateLED(self, isConnected):
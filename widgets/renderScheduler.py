@@ -0,0 +1,91 @@
+import time
+
+from PySide6 import QtCore as qtc
+
+RENDER_TARGET_FPS = 30 # maximum frame rate of the graphs, a slower GUI drops frames instead of falling behind
+
+
+class RenderScheduler(qtc.QObject):
+    """Central scheduler of all redraws of the graphs.
+
+    Widgets mark their render functions dirty instead of drawing in the slots which receive data. All pending updates
+    are rendered together at the next tick, at most once per frame of the target frame rate. Updates of the same
+    render function which arrive before the tick are merged into one region, so a render always shows the newest data.
+    If rendering takes longer than a frame, the ticks which were missed are dropped and counted instead of being queued.
+    """
+    def __init__(self, targetFps: float = RENDER_TARGET_FPS, parent=None):
+        super().__init__(parent)
+        self.timer = qtc.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(qtc.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+
+        self.dirty = {}
+        self.nextFrameTime = 0
+        self.framesRendered = 0
+        self.framesDropped = 0
+        self.updatesMerged = 0
+        self.setTargetFps(targetFps)
+
+    def setTargetFps(self, targetFps: float):
+        """
+        Args:
+            targetFps (float): maximum number of frames per second
+        """
+        self.frameInterval = 1 / targetFps
+
+    def markDirty(self, render, region: tuple = None):
+        """Schedules a render function for the next frame
+
+        Args:
+            render: function which is called with the merged region
+            region (tuple, optional): range (first, last) of the changed rows, None if everything changed. Defaults to None.
+        """
+        if render in self.dirty:
+            pending = self.dirty[render]
+            if pending is None or region is None:
+                region = None
+            else:
+                region = (min(pending[0], region[0]), max(pending[1], region[1]))
+            self.updatesMerged += 1
+        self.dirty[render] = region
+
+        if not self.timer.isActive():
+            # frames are aligned to the frame interval like vsync, so an idle scheduler renders the first update at once
+            now = time.monotonic()
+            self.nextFrameTime = max(self.nextFrameTime, now)
+            self.timer.start(round((self.nextFrameTime - now) * 1000))
+
+    def cancel(self, render):
+        """Removes a pending render, e.g. after the widget has been drawn completely
+
+        Args:
+            render: the render function
+        """
+        self.dirty.pop(render, None)
+
+    def tick(self):
+        now = time.monotonic()
+        # the frames which passed while the GUI thread was busy are dropped, the next frame shows the newest data
+        late = now - self.nextFrameTime
+        if late >= self.frameInterval:
+            self.framesDropped += int(late / self.frameInterval)
+
+        dirty, self.dirty = self.dirty, {}
+        for render, region in dirty.items():
+            try:
+                render(region)
+            except Exception as e:
+                print(e)
+        if dirty:
+            self.framesRendered += 1
+
+        finished = time.monotonic()
+        self.nextFrameTime = now + self.frameInterval
+        if finished > self.nextFrameTime:
+            # the render took longer than a frame, continue on the frame grid
+            overrun = int((finished - self.nextFrameTime) / self.frameInterval) + 1
+            self.framesDropped += overrun
+            self.nextFrameTime += overrun * self.frameInterval
+        if self.dirty:
+            self.timer.start(round(max(self.nextFrameTime - finished, 0) * 1000))
@@ -11,6 +11,7 @@ from PySide6 import QtGui as qtg
 from PySide6 import QtWidgets as qtw
 
 from .canvas import Canvas
+from .renderScheduler import RenderScheduler
 import numpy as np
 
 
@@ -41,6 +42,8 @@ LINE_MEASURE_TOOLTIP = "Distanz messen"
 LINE_MEASURE_STARTED_LOG = "Vermessungs-Werkzeug gestartet - 2 Punkte im Scan auswählen..."
 LINE_MEASURE_EXECUTED_LOG = "Linie erfolgreich vermessen: Länge = {length:.2f}"
 
+SCAN_BLITTING_ENABLED = True
+
 
 class CustomToolbar(NavigationToolbar2QT):
     """Custom Toolbar to remove tools included in base NavigationTOolbar
@@ -67,14 +70,20 @@ class ScanTabWidget(qtw.QWidget):
     mode = 0
     image = []
     changedImage = []
+    scanImage = None
+    scanBackground = None
+    displayModified = False
 
     
     logMessage = qtc.Signal(str)
 
-    def __init__(self):
+    def __init__(self, renderScheduler: RenderScheduler = None):
         super().__init__()
         # Main UI code goes here
 
+        # redraws of scan lines are merged with all other redraws to at most one per frame
+        self.renderScheduler = RenderScheduler(parent=self) if renderScheduler is None else renderScheduler
+
         self.initPlotUI()
         # End main UI code
         # self.show()
@@ -107,6 +116,7 @@ class ScanTabWidget(qtw.QWidget):
         self.scanAxe.set_ylabel(SCAN_GRAPH_Y_LABEL)
         self.scanAxe.set_title(SCAN_GRAPH_TITLE, fontweight="bold", fontname=GRAPH_FONTS, fontsize=14, loc="left")
 
+        self.scanCanvas.canvas.mpl_connect("draw_event", self.cacheScanBackground)
         self.updateImage(self.image)
 
         self.mainLayout.addWidget(self.scanCanvas)
@@ -159,9 +169,98 @@ class ScanTabWidget(qtw.QWidget):
         """
         self.image = None
         self.image = np.array(imageData)
-        
+        self.redrawImage()
+
+    def initScanBuffer(self, rows: int, cols: int) -> np.ndarray:
+        """Allocates the image buffer for a new scan, which is then patched line by line
+
+        Args:
+            rows (int): number of lines of the scan
+            cols (int): number of points per line
+
+        Returns:
+            np.ndarray: the new image buffer
+        """
+        self.image = np.zeros((rows, cols))
+        self.changedImage = []
+        self.redrawImage()
+        return self.image
+
+    def updateImageLines(self, firstRow: int, lines):
+        """Writes a block of scan lines into the image buffer and schedules a redraw of the Scan Graph
+        The changed rows are merged until the next frame of the render scheduler
+
+        Args:
+            firstRow (int): index of the first line
+            lines: line data with one line per row
+        """
+        self.image[firstRow:firstRow + len(lines)] = lines
+        self.renderScheduler.markDirty(self.renderImageLines, (firstRow, firstRow + len(lines)))
+
+    def renderImageLines(self, region: tuple):
+        """Writes the changed rows into the displayed image and blits the Scan Graph
+
+        Args:
+            region (tuple): range of the changed rows, None for the whole image
+        """
+        rows = slice(*region) if region is not None else slice(None)
+        lines = self.image[rows]
+
+        if self.displayModified:
+            # a tool changed the displayed data, continue on the scan data
+            self.scanImage.set_data(self.image)
+            self.displayModified = False
+        else:
+            self.scanImage.get_array()[rows] = lines
+            self.scanImage.changed()
+
+        # imshow scales the colors to the data range, so do the same for the lines received so far
+        vMin, vMax = self.scanImage.get_clim()
+        lineMin, lineMax = np.min(lines), np.max(lines)
+        if lineMin < vMin or lineMax > vMax:
+            self.scanImage.set_clim(min(vMin, lineMin), max(vMax, lineMax))
+
+        self.blitImage()
+
+    def cacheScanBackground(self, event):
+        """Caches the Scan Graph without the scan image after every full draw so that later updates can be blitted
+
+        Args:
+            event: matplotlib draw event
+        """
+        if not SCAN_BLITTING_ENABLED or self.scanImage is None:
+            return
+        self.scanBackground = self.scanCanvas.canvas.copy_from_bbox(self.scanAxe.bbox)
+        self.drawScanArtists()
+
+    def drawScanArtists(self):
+        """Draws the scan image and tool markers on top of it onto the canvas
+        """
+        self.scanAxe.draw_artist(self.scanImage)
+        for line in self.scanAxe.get_lines():
+            self.scanAxe.draw_artist(line)
+
+    def blitImage(self):
+        """Redraws only the scan image over the cached background
+        """
+        if not SCAN_BLITTING_ENABLED or self.scanBackground is None:
+            self.scanCanvas.canvas.draw()
+            return
+
+        canvas = self.scanCanvas.canvas
+        canvas.restore_region(self.scanBackground)
+        self.drawScanArtists()
+        canvas.blit(self.scanAxe.bbox)
+
+    def redrawImage(self):
+        """Redraws the Scan Graph from the image buffer
+        """
+        self.renderScheduler.cancel(self.renderImageLines)
+        self.scanBackground = None
+        self.displayModified = False
+
         self.scanAxe.clear()
-        self.scanAxe.imshow(self.image, cmap="gray", origin='lower')
+        self.scanImage = self.scanAxe.imshow(self.image, cmap="gray", origin='lower', animated=SCAN_BLITTING_ENABLED)
         
         self.scanAxe.set_xlabel(SCAN_GRAPH_X_LABEL)
         self.scanAxe.set_ylabel(SCAN_GRAPH_Y_LABEL)
@@ -184,7 +283,9 @@ class ScanTabWidget(qtw.QWidget):
         """Resets the Scan data back to the image received by the STM
         """
         self.removeToolPointsFromImage()
-        self.scanAxe.imshow(self.image, cmap="gray", origin='lower')
+        self.scanImage.set_data(self.image)
+        self.scanImage.autoscale()
+        self.displayModified = False
         self.logMessage.emit(DATA_RESET_LOG)
         self.scanCanvas.canvas.draw()
 
@@ -325,12 +426,14 @@ class ScanTabWidget(qtw.QWidget):
         # plane = ( np.dot(crossProd, p3) - a*np.arange(0, stop=len(self.image), step=1) - b*np.arange(0, stop=len(self.image[0]), step=1) )/ c
 
         # leveledImage = np.subtract(self.image, plane)
-        if self.changedImage != []:
-            self.scanAxe.imshow(np.subtract(self.changedImage, plane), cmap="gray", origin='lower')
+        if len(self.changedImage):
+            self.scanImage.set_data(np.subtract(self.changedImage, plane))
         else: 
             self.changedImage = np.subtract(self.image, plane)
 
-            self.scanAxe.imshow(self.changedImage, cmap="gray", origin='lower')
+            self.scanImage.set_data(self.changedImage)
+        self.scanImage.autoscale()
+        self.displayModified = True
 
         self.scanCanvas.canvas.draw()
         